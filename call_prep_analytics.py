@@ -0,0 +1,186 @@
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from call_prep_engine import Lead, infer_stage, rate_floor
+
+# Pipeline analytics across every lead in the session store: leads per stage,
+# average rate improvement, offers below the floor and the fee-sensitive
+# share, by state and / or segment.
+#
+# LeadTable keeps one row per lead in NumPy columns (state and segment as
+# small integer codes, rates as floats with NaN for "not captured"), so a
+# grouped aggregate is a handful of np.bincount calls over the columns, not
+# a loop over leads. PipelineAnalytics keeps a table in step with the store
+# by reading only the changes since its last refresh (the store's change
+# counter, as for exports): a lead that changed is one row overwritten, a
+# closed lead one row removed.
+
+STAGES = (1, 2, 3, 4, 5)
+GROUPINGS = {
+    "State": ("state",),
+    "Segment": ("segment",),
+    "State and segment": ("state", "segment"),
+    "All leads": (),
+}
+INITIAL_CAPACITY = 1024
+
+class GroupStats(NamedTuple):
+    state: str | None  # None: all states (or not captured, when grouped by state)
+    segment: str | None
+    leads: int
+    stages: tuple[int, ...]  # leads at each of STAGES
+    avg_rate_improvement: float | None  # current rate − working offer, offers at or above the floor
+    below_floor: int  # working offers under the lead's floor
+    fee_sensitive: float  # share of leads
+
+class _Codes:
+    # Category value <-> small integer; 0 is "not captured".
+    def __init__(self):
+        self.values: list = [None]
+        self._index: dict = {None: 0}
+
+    def code(self, value) -> int:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+# -----------------------------------------------------------------------------
+# Columnar table
+# -----------------------------------------------------------------------------
+class LeadTable:
+    _COLUMNS = {
+        "state": np.int32,
+        "segment": np.int32,
+        "stage": np.int8,
+        "current_rate": np.float64,
+        "our_rate": np.float64,
+        "floor": np.float64,
+        "fee_sensitive": np.bool_,
+        "open": np.bool_,
+    }
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.keys: list[str] = []  # row -> key
+        self._rows: dict[str, int] = {}
+        self.states = _Codes()
+        self.segments = _Codes()
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in self._COLUMNS.items()}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def upsert(self, key: str, lead: Lead, is_open: bool = True):
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self.keys)
+            self.keys.append(key)
+            if row == len(self.columns["stage"]):
+                self.columns = {name: np.resize(col, 2 * row) for name, col in self.columns.items()}
+        cols = self.columns
+        cols["state"][row] = self.states.code(lead.state)
+        cols["segment"][row] = self.segments.code(lead.segment)
+        cols["stage"][row] = infer_stage(lead)
+        cols["current_rate"][row] = np.nan if lead.current_rate is None else lead.current_rate
+        cols["our_rate"][row] = np.nan if lead.our_rate is None else lead.our_rate
+        cols["floor"][row] = rate_floor(lead)
+        cols["fee_sensitive"][row] = bool(lead.pricing_concern)
+        cols["open"][row] = is_open
+
+    def remove(self, key: str):
+        # The last row moves into the hole, so the live rows stay 0..n-1.
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.keys[row] = moved
+            self._rows[moved] = row
+            for col in self.columns.values():
+                col[row] = col[last]
+        self.keys.pop()
+
+    def groups(self, by: tuple[str, ...] = ("state", "segment"), open_only: bool = False) -> list[GroupStats]:
+        # One GroupStats per (state, segment) combination that has leads, in
+        # code order (first seen first); `by` may name either, both or neither.
+        n = len(self.keys)
+        cols = {name: col[:n] for name, col in self.columns.items()}
+        if open_only:
+            cols = {name: col[cols["open"]] for name, col in cols.items()}
+        n_states, n_segments = len(self.states.values), len(self.segments.values)
+        state = cols["state"] if "state" in by else np.zeros(len(cols["state"]), np.int32)
+        segment = cols["segment"] if "segment" in by else np.zeros(len(cols["segment"]), np.int32)
+        group = state.astype(np.intp) * n_segments + segment
+        size = n_states * n_segments
+
+        leads = np.bincount(group, minlength=size)
+        stages = np.bincount(group * len(STAGES) + (cols["stage"] - 1), minlength=size * len(STAGES)).reshape(size, len(STAGES))
+        current, offer, floor = cols["current_rate"], cols["our_rate"], cols["floor"]
+        priced = (offer >= floor) & ~np.isnan(current)  # NaN compares False
+        improvement = np.bincount(group, weights=np.where(priced, current - offer, 0.0), minlength=size)
+        improved = np.bincount(group, weights=priced, minlength=size)
+        below = np.bincount(group, weights=offer < floor, minlength=size)
+        fees = np.bincount(group, weights=cols["fee_sensitive"], minlength=size)
+
+        out = []
+        for g in np.flatnonzero(leads):
+            s, seg = divmod(int(g), n_segments)
+            out.append(GroupStats(
+                self.states.values[s],
+                self.segments.values[seg],
+                int(leads[g]),
+                tuple(int(c) for c in stages[g]),
+                float(improvement[g] / improved[g]) if improved[g] else None,
+                int(below[g]),
+                float(fees[g] / leads[g]),
+            ))
+        return out
+
+# -----------------------------------------------------------------------------
+# Kept in step with the session store
+# -----------------------------------------------------------------------------
+class PipelineAnalytics:
+    def __init__(self, store):
+        self.store = store
+        self.table = LeadTable()
+        self.synced = 0  # store change the table reflects
+        self._lock = threading.Lock()
+        self._session_rows: dict[str, str] = {}  # open session id -> row key
+
+    def refresh(self) -> int:
+        # Applies the store's changes since the last refresh; returns how many.
+        with self._lock:
+            upto = self.store.last_change()
+            applied = 0
+            for item in self.store.changes(self.synced, upto, deleted=True):
+                self._apply(item)
+                applied += 1
+            self.synced = upto
+            return applied
+
+    def _apply(self, item):
+        table = self.table
+        if item.source == "conversation":
+            table.upsert(f"c{item.key}", item.lead, is_open=False)
+        elif item.lead is not None:
+            # A chat reopened from the archive is the same lead as its entry.
+            key = f"c{item.conversation_id}" if item.conversation_id is not None else f"s{item.key}"
+            self._session_rows[item.key] = key
+            table.upsert(key, item.lead)
+        else:
+            # Closed. The chat, if any, was archived just before under its
+            # own row; a reopened chat's row is that archive entry already.
+            key = self._session_rows.pop(item.key, None)
+            if key is not None and key.startswith("s"):
+                table.remove(key)
+
+    def groups(self, by: tuple[str, ...] = ("state", "segment"), open_only: bool = False) -> list[GroupStats]:
+        with self._lock:
+            return self.table.groups(by, open_only)
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from typing import AsyncIterator, Callable, Iterator, NamedTuple
+
+from call_prep_engine import (
+    QUESTION_TEXT,
+    AskedTopics,
+    Lead,
+    apply_pricing,
+    guidance_blocks,
+    is_summary_request,
+    prepare_guidance,
+    summary_blocks,
+    topics_in,
+)
+from call_prep_metrics import METRICS, timed
+
+# Pluggable reply backends, for a heavier reply generator behind the chat.
+#
+# The note is still applied to the lead in-process (parsing, pricing, the
+# turn's questions), so the lead, the sidebar and undo behave exactly as
+# without a backend; only the reply text comes from the backend. Backends run
+# on one asyncio loop in a background thread. The script thread only waits
+# for reply blocks, and never longer than the deadlines below:
+#   - no block within first_block_timeout (a slow or busy backend): the
+#     rule-based reply is shown instead;
+#   - reply not finished within timeout: it ends where it is, with a note;
+#   - at most `concurrency` backend requests run at once; the rest wait for a
+#     slot within their first-block deadline, then fall back, so requests
+#     never pile up behind a stalled backend.
+#
+# CALL_PREP_BACKEND_URL selects the backend (unset: replies are built
+# in-process as before):
+#   ws://host:port    a websocket reply server (see call_prep_stub_server.py)
+#   stub              the stub's replies, in-process, for local runs
+#
+# A backend is any object with `name` and an async generator method
+# `generate(request)` yielding markdown blocks.
+
+BACKEND_URL = os.environ.get("CALL_PREP_BACKEND_URL")
+BACKEND_TIMEOUT = float(os.environ.get("CALL_PREP_BACKEND_TIMEOUT") or 10.0)  # whole reply, seconds
+BACKEND_FIRST_BLOCK = float(os.environ.get("CALL_PREP_BACKEND_FIRST_BLOCK") or 2.0)  # seconds
+BACKEND_CONCURRENCY = int(os.environ.get("CALL_PREP_BACKEND_CONCURRENCY") or 16)
+
+CUT_SHORT_NOTE = "\n\n_(The rest of this reply timed out. Send the note again or type `summary`.)_"
+
+class BackendError(RuntimeError):
+    pass
+
+class ReplyRequest(NamedTuple):
+    kind: str  # "guidance" or "summary"
+    note: str
+    lead: dict  # lead fields after the note
+    questions: list[tuple[str, str]]  # (topic, text) to ask this turn; guidance only
+    mask: int  # topic mask of `questions`, for the local reply
+
+    def payload(self) -> dict:
+        return {"kind": self.kind, "note": self.note, "lead": self.lead, "questions": [list(q) for q in self.questions]}
+
+class BackendStats(NamedTuple):
+    requests: int
+    completed: int
+    fallbacks: int  # rule-based reply shown instead
+    cut_short: int
+    timeouts: int  # no first block in time (including no free slot)
+    errors: int
+    in_flight: int
+
+# -----------------------------------------------------------------------------
+# Requests and the local reply
+# -----------------------------------------------------------------------------
+def prepare_reply(lead: Lead, asked: AskedTopics, text: str) -> ReplyRequest:
+    # Applies the note as iter_reply does, without building the reply.
+    if is_summary_request(text):
+        with timed("pricing"):
+            apply_pricing(lead)
+        return ReplyRequest("summary", text, lead.to_dict(), [], 0)
+    mask = prepare_guidance(lead, asked, text)
+    questions = [(topic, QUESTION_TEXT[topic]) for topic in topics_in(mask)]
+    return ReplyRequest("guidance", text, lead.to_dict(), questions, mask)
+
+def local_reply(lead: Lead, request: ReplyRequest) -> Iterator[str]:
+    # The rule-based reply for a prepared request (the fallback).
+    if request.kind == "summary":
+        return summary_blocks(lead)
+    return guidance_blocks(lead, request.mask)
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+class WebSocketBackend:
+    # One connection per reply: the request goes out as one JSON message,
+    # then {"block": ...} messages come back until {"done": true}.
+    def __init__(self, url: str):
+        self.url = url
+        self.name = url
+
+    async def generate(self, request: ReplyRequest) -> AsyncIterator[str]:
+        # Imported here so the app runs without websockets unless a
+        # websocket backend is configured.
+        from websockets.asyncio.client import connect
+
+        async with connect(self.url, max_size=None, open_timeout=None) as ws:
+            await ws.send(json.dumps(request.payload(), ensure_ascii=False))
+            async for message in ws:
+                msg = json.loads(message)
+                if "error" in msg:
+                    raise BackendError(msg["error"])
+                if msg.get("done"):
+                    return
+                yield msg["block"]
+        raise BackendError("connection closed before the reply was done")
+
+def open_backend(url: str):
+    if url == "stub":
+        from call_prep_stub_server import StubBackend
+        return StubBackend()
+    if url.startswith(("ws://", "wss://")):
+        return WebSocketBackend(url)
+    raise ValueError(f"unsupported reply backend {url!r} (expected ws://..., wss://... or stub)")
+
+# -----------------------------------------------------------------------------
+# Gateway: the script thread's side
+# -----------------------------------------------------------------------------
+_BLOCK, _DONE, _FAILED = range(3)
+
+class ReplyStream:
+    # Iterating yields the reply's blocks (for st.write_stream); afterwards
+    # `source` says who wrote it: "backend" or "local" (the fallback).
+    def __init__(self, gateway: "ReplyGateway", request: ReplyRequest, fallback: Callable[[], Iterator[str]]):
+        self._gateway = gateway
+        self._request = request
+        self._fallback = fallback
+        self.source: str | None = None
+
+    def __iter__(self) -> Iterator[str]:
+        return self._gateway._stream(self)
+
+class ReplyGateway:
+    def __init__(
+        self,
+        backend,
+        timeout: float = BACKEND_TIMEOUT,
+        first_block_timeout: float = BACKEND_FIRST_BLOCK,
+        concurrency: int = BACKEND_CONCURRENCY,
+    ):
+        self.backend = backend
+        self.timeout = timeout
+        self.first_block_timeout = min(first_block_timeout, timeout)
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="reply-backend", daemon=True)
+        self._thread.start()
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(("requests", "completed", "fallbacks", "cut_short", "timeouts", "errors", "in_flight"), 0)
+
+    def stream(self, request: ReplyRequest, fallback: Callable[[], Iterator[str]]) -> ReplyStream:
+        return ReplyStream(self, request, fallback)
+
+    def stats(self) -> BackendStats:
+        with self._lock:
+            return BackendStats(**self._counts)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _count(self, name: str, by: int = 1):
+        with self._lock:
+            self._counts[name] += by
+
+    async def _run(self, request: ReplyRequest, out: queue.Queue):
+        # On the loop: waits for a slot, then relays the backend's blocks.
+        # Cancelled by the script thread once it stops waiting.
+        async with self._slots:
+            self._count("in_flight")
+            try:
+                async for block in self.backend.generate(request):
+                    out.put((_BLOCK, block))
+                out.put((_DONE, None))
+            except Exception as exc:
+                out.put((_FAILED, exc))
+            finally:
+                self._count("in_flight", -1)
+
+    def _stream(self, reply: ReplyStream) -> Iterator[str]:
+        self._count("requests")
+        out: queue.Queue = queue.Queue()
+        started = time.monotonic()
+        future = asyncio.run_coroutine_threadsafe(self._run(reply._request, out), self._loop)
+        first = True
+        try:
+            while True:
+                limit = self.first_block_timeout if first else self.timeout
+                try:
+                    kind, value = out.get(timeout=max(0.0, started + limit - time.monotonic()))
+                except queue.Empty:
+                    kind, value = _FAILED, None
+                if kind == _BLOCK:
+                    first = False
+                    reply.source = "backend"
+                    yield value
+                    continue
+                if kind == _DONE and first:
+                    kind, value = _FAILED, BackendError("empty reply")
+                if kind == _DONE:
+                    self._count("completed")
+                    METRICS.observe("backend", time.monotonic() - started)
+                    return
+                self._count("timeouts" if value is None else "errors")
+                if first:
+                    self._count("fallbacks")
+                    reply.source = "local"
+                    yield from reply._fallback()
+                else:
+                    self._count("cut_short")
+                    yield CUT_SHORT_NOTE
+                return
+        finally:
+            future.cancel()
@@ -0,0 +1,227 @@
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import sys
+import time
+from typing import Callable, NamedTuple
+
+from call_prep_corpus import generate_records
+from call_prep_engine import (
+    RESPONSE_CACHE,
+    AskedTopics,
+    Lead,
+    build_guidance,
+    build_summary,
+    extract_name,
+    infer_stage,
+    parse_structured_short_input,
+    parse_us_number,
+    respond,
+)
+
+# Micro-benchmarks for the note parsers and reply builders, run over a
+# synthetic corpus:
+#   python call_prep_bench.py                 # compare against the baseline
+#   python call_prep_bench.py --save          # record a new baseline
+# Exit status 1 when any case's throughput fell more than --threshold below
+# its baseline. Baselines are only comparable on the same machine and Python.
+#
+# Reply builders run on fresh lead copies with the shared reply cache off, so
+# they measure rendering, not cache lookups.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_THRESHOLD = 0.20  # allowed drop in calls/s before a case fails
+DEFAULT_LEADS = 300
+DEFAULT_REPEAT = 5
+MIN_ROUND_SECONDS = 0.05
+
+class Case(NamedTuple):
+    name: str
+    setup: Callable[[list[list[str]]], list[tuple]]  # conversations -> call arguments
+    call: Callable
+    fresh: Callable[[tuple], tuple] | None = None  # per-round copy of arguments the call mutates
+
+class Result(NamedTuple):
+    calls: int
+    ops_per_sec: float  # best round
+    p50_us: float
+    p99_us: float
+
+# -----------------------------------------------------------------------------
+# Cases
+# -----------------------------------------------------------------------------
+_NUMBER_TOKEN = re.compile(r"\d[\d.,]*k?")
+
+def _notes(convos: list[list[str]]) -> list[str]:
+    return [note for notes in convos for note in notes]
+
+def _replayed(convos: list[list[str]]) -> list[tuple[Lead, AskedTopics, str]]:
+    # (lead and asked topics just before the note, note) for every note.
+    states = []
+    for notes in convos:
+        lead, asked = Lead(), AskedTopics()
+        for note in notes:
+            states.append((lead.copy(), asked.copy(), note))
+            respond(lead, asked, note)
+    return states
+
+def _finished(convos: list[list[str]]) -> list[Lead]:
+    leads = []
+    for notes in convos:
+        lead, asked = Lead(), AskedTopics()
+        for note in notes:
+            respond(lead, asked, note)
+        leads.append(lead)
+    return leads
+
+CASES = [
+    Case(
+        "parse_us_number",
+        lambda convos: [(token,) for note in _notes(convos) for token in _NUMBER_TOKEN.findall(note.lower())],
+        parse_us_number,
+    ),
+    Case("extract_name", lambda convos: [(note,) for note in _notes(convos)], extract_name),
+    Case(
+        "parse_structured_short_input",
+        lambda convos: [(Lead(), note) for note in _notes(convos)],
+        parse_structured_short_input,
+        lambda a: (Lead(), a[1]),
+    ),
+    Case("infer_stage", lambda convos: [(lead,) for lead, _, _ in _replayed(convos)], infer_stage),
+    Case(
+        "build_guidance",
+        lambda convos: [state for state in _replayed(convos) if state[2] != "summary"],
+        build_guidance,
+        lambda a: (a[0].copy(), a[1].copy(), a[2]),
+    ),
+    Case("build_summary", lambda convos: [(lead,) for lead in _finished(convos)], build_summary, lambda a: (a[0].copy(),)),
+]
+
+# -----------------------------------------------------------------------------
+# Runner
+# -----------------------------------------------------------------------------
+def conversations(leads: int, seed: int) -> list[list[str]]:
+    convos: dict[int, list[str]] = {}
+    for rec in generate_records(leads, seed):
+        convos.setdefault(rec["lead_id"], []).append(rec["note"])
+    return list(convos.values())
+
+def run_case(case: Case, convos: list[list[str]], repeat: int) -> Result:
+    clock = time.perf_counter_ns
+    call = case.call
+    prepared = case.setup(convos)
+
+    def round_args() -> list[tuple]:
+        return [case.fresh(a) for a in prepared] if case.fresh else prepared
+
+    # An untimed warm-up round sizes the timed ones: fast cases go over their
+    # arguments several times so each round lasts at least MIN_ROUND_SECONDS.
+    args = round_args()
+    started = clock()
+    for a in args:
+        call(*a)
+    loops = max(1, math.ceil(MIN_ROUND_SECONDS * 1e9 / max(clock() - started, 1)))
+    best = float("inf")
+    for _ in range(repeat):
+        batches = [round_args() for _ in range(loops)]
+        started = clock()
+        for args in batches:
+            for a in args:
+                call(*a)
+        best = min(best, (clock() - started) / loops)
+
+    # One more round timing every call on its own for the latency spread.
+    args = round_args()
+    samples = []
+    for a in args:
+        started = clock()
+        call(*a)
+        samples.append(clock() - started)
+    samples.sort()
+    n = len(samples)
+    return Result(
+        n, round(n / (best / 1e9), 1), samples[n // 2] / 1e3, samples[min(n - 1, n * 99 // 100)] / 1e3
+    )
+
+def run(leads: int = DEFAULT_LEADS, seed: int = 0, repeat: int = DEFAULT_REPEAT, only: list[str] | None = None) -> dict[str, Result]:
+    convos = conversations(leads, seed)
+    size = RESPONSE_CACHE.maxsize
+    RESPONSE_CACHE.maxsize = 0
+    RESPONSE_CACHE.clear()
+    try:
+        return {case.name: run_case(case, convos, repeat) for case in CASES if not only or case.name in only}
+    finally:
+        RESPONSE_CACHE.maxsize = size
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor()}
+
+def compare(results: dict[str, Result], baseline: dict, threshold: float) -> list[str]:
+    # Names of the cases whose throughput dropped more than `threshold`.
+    slower = []
+    for name, result in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if base and result.ops_per_sec < base["ops_per_sec"] * (1 - threshold):
+            slower.append(name)
+    return slower
+
+# -----------------------------------------------------------------------------
+# Entry point
+# -----------------------------------------------------------------------------
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the call-prep parsers and reply builders.")
+    parser.add_argument("--leads", type=int, default=DEFAULT_LEADS, help="synthetic leads in the corpus")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed rounds per case (best one counts)")
+    parser.add_argument("--only", action="append", choices=[case.name for case in CASES], help="run just this case (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed throughput drop, e.g. 0.2 for 20%%")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.leads, args.seed, args.repeat, args.only)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    cases = baseline.get("cases", {})
+
+    print(f"{'case':<30} {'calls':>7} {'calls/s':>12} {'p50 µs':>9} {'p99 µs':>9} {'vs base':>8}")
+    for name, r in results.items():
+        base = cases.get(name)
+        change = f"{r.ops_per_sec / base['ops_per_sec'] - 1:+.0%}" if base else "—"
+        print(f"{name:<30} {r.calls:>7,} {r.ops_per_sec:>12,.0f} {r.p50_us:>9.2f} {r.p99_us:>9.2f} {change:>8}")
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(
+                {
+                    "environment": environment(),
+                    "corpus": {"leads": args.leads, "seed": args.seed},
+                    "cases": {name: r._asdict() for name, r in results.items()},
+                },
+                fh,
+                indent=1,
+            )
+            fh.write("\n")
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if baseline and baseline.get("environment") != environment():
+        print("note: baseline was recorded on a different machine or Python", file=sys.stderr)
+    slower = compare(results, baseline, args.threshold)
+    if slower:
+        # Measure the slow cases once more before failing: a busy machine
+        # should not count as a regression.
+        again = run(args.leads, args.seed, args.repeat, slower)
+        slower = compare(again, baseline, args.threshold)
+    if slower:
+        print(f"slower than baseline by more than {args.threshold:.0%}: {', '.join(slower)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
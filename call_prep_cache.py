@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, NamedTuple
+
+# Rendered replies shared across every session in the process.
+#
+# Guidance and summaries are pure functions of the lead's fields, the topics
+# already asked and the kind of reply, so two RMs who type near-identical
+# notes get the same blocks. Entries are bounded by count (least recently
+# used goes first) and by age. The cache belongs to one `generation` at a
+# time; anything that changes how replies are rendered (question catalog,
+# rate floor, rate sheet) changes the generation and empties it.
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_TTL_SECONDS = 900.0
+
+class CacheStats(NamedTuple):
+    size: int
+    hits: int
+    misses: int
+    evictions: int  # dropped for room
+    expirations: int  # dropped for age
+    invalidations: int  # generation changes
+
+class ResponseCache:
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._generation: Hashable = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def _sync(self, generation: Hashable):
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._generation = generation
+
+    def get(self, key: Hashable, generation: Hashable = None):
+        # The cached value, or None.
+        with self._lock:
+            self._sync(generation)
+            hit = self._entries.get(key)
+            if hit is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - hit[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def put(self, key: Hashable, value, generation: Hashable = None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._sync(generation)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                len(self._entries), self.hits, self.misses, self.evictions, self.expirations, self.invalidations
+            )
@@ -0,0 +1,111 @@
+import argparse
+import json
+import sys
+import time
+from typing import Iterable, Iterator
+
+from call_prep_engine import (
+    RESPONSE_CACHE,
+    AskedTopics,
+    Lead,
+    note_result,
+    summary_result,
+)
+from call_prep_pool import DEFAULT_WINDOW, WorkerError, run_parallel
+
+# Batch call prep without the browser UI:
+#   python call_prep_cli.py notes.jsonl -o plans.jsonl
+# Each input line is {"lead_id": ..., "note": ...}. Notes for the same lead are
+# applied in file order, exactly as if the RM had typed them into the chat.
+
+# -----------------------------------------------------------------------------
+# Records
+# -----------------------------------------------------------------------------
+def iter_records(lines: Iterable[str]) -> Iterator[dict]:
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"line {lineno}: invalid JSON ({exc.msg})") from None
+        if not isinstance(rec, dict) or "lead_id" not in rec or "note" not in rec:
+            raise ValueError(f"line {lineno}: expected keys 'lead_id' and 'note'")
+        if not isinstance(rec["lead_id"], str) or not isinstance(rec["note"], str):
+            raise ValueError(f"line {lineno}: 'lead_id' and 'note' must be strings")
+        yield rec
+
+def process_records(records: Iterable[dict], summaries: bool = True) -> Iterator[dict]:
+    sessions: dict[str, tuple[Lead, AskedTopics]] = {}
+    for rec in records:
+        lead_id = str(rec["lead_id"])
+        if lead_id not in sessions:
+            sessions[lead_id] = (Lead(), AskedTopics())
+        lead, asked = sessions[lead_id]
+        yield note_result(lead_id, lead, asked, rec["note"])
+
+    if summaries:
+        for lead_id, (lead, _) in sessions.items():
+            yield summary_result(lead_id, lead)
+
+# -----------------------------------------------------------------------------
+# Entry point
+# -----------------------------------------------------------------------------
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run RM call notes through the call-prep engine.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of {lead_id, note} records ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="where to write JSONL results ('-' for stdout)")
+    parser.add_argument("--no-summaries", action="store_true", help="skip the per-lead call plan at the end")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="worker processes (1 = run in this process)")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="max notes in flight when running with workers")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not report throughput on stderr")
+    args = parser.parse_args(argv)
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    records = iter_records(src)
+    summaries = not args.no_summaries
+    if args.workers > 1:
+        results = run_parallel(records, args.workers, window=args.window, summaries=summaries)
+    else:
+        results = process_records(records, summaries=summaries)
+
+    notes = plans = 0
+    started = time.perf_counter()
+    try:
+        for out in results:
+            if "summary" in out:
+                plans += 1
+            else:
+                notes += 1
+            dst.write(json.dumps(out, ensure_ascii=False) + "\n")
+    except ValueError as exc:
+        print(f"{args.input}: {exc}", file=sys.stderr)
+        return 1
+    except WorkerError as exc:
+        print(f"{args.input}: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+    if not args.quiet:
+        elapsed = time.perf_counter() - started
+        rate = notes / elapsed if elapsed > 0 else 0.0
+        print(
+            f"{notes} notes, {plans} call plans in {elapsed:.2f}s "
+            f"({rate:,.0f} notes/s, {args.workers} worker{'s' if args.workers != 1 else ''})",
+            file=sys.stderr,
+        )
+        if args.workers <= 1:
+            stats = RESPONSE_CACHE.stats()
+            lookups = stats.hits + stats.misses
+            if lookups:
+                print(f"reply cache: {stats.hits / lookups:.0%} hits, {stats.evictions} evictions", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import argparse
+import json
+import random
+import sys
+from typing import Iterator
+
+# Synthetic RM notes in the shapes the app's intro teaches, for benchmarks
+# and load tests. Deterministic for a given seed, so two runs (or a run and
+# its baseline) see exactly the same notes:
+#   python call_prep_corpus.py 5000 > notes.jsonl
+
+FIRST_NAMES = (
+    "Mary", "James", "Ann", "Robert", "Linda", "Michael", "Susan", "David", "Karen", "Daniel",
+    "Nancy", "Paul", "Laura", "Mark", "Emily", "Steven", "Maria", "Kevin", "Julia", "Brian",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Lee", "Brown", "Garcia", "Miller", "Davis", "Martinez", "Wilson", "Clark",
+    "Lewis", "Walker", "Young", "Allen", "King", "Wright", "Scott", "Green", "Baker", "Hill",
+)
+STATES = (
+    "California", "Texas", "Florida", "Ohio", "Georgia", "Michigan", "Arizona", "Washington",
+    "Colorado", "Oregon", "Virginia", "Illinois", "Nevada", "Utah", "Tennessee", "Massachusetts",
+)
+SEGMENT_PHRASES = ("self-employed", "business owner", "private banking", "affluent professional", "salaried", "")
+OPENERS = ("{name} in {state}, refi on primary home", "calling {name} in {state} about a refi", "meeting {name} from {state}, refinance")
+GOAL_NOTES = ("tenure {tenure} daughter college", "son starting college in 3 yrs", "tenure {tenure}, tuition in 4 yrs")
+FILLER_NOTES = ("ok thanks", "customer asked about timing", "will send docs tomorrow", "prefers email")
+
+def lead_notes(rng: random.Random) -> list[str]:
+    # One lead's conversation, in the order an RM would type it.
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    opener = rng.choice(OPENERS).format(name=name, state=rng.choice(STATES))
+    segment = rng.choice(SEGMENT_PHRASES)
+    rate = round(rng.uniform(6.5, 8.5), 1)
+    offer = round(rate - rng.uniform(0.4, 1.6), 1)
+    notes = [
+        f"{opener}, {segment}" if segment else opener,
+        f"rate {rate} pay {rng.randrange(1800, 5200, 50)}",
+        f"bal {rng.randrange(150, 900, 5)}k term {rng.randint(10, 28)} yrs",
+        f"dep {rng.randrange(10, 250, 5)}k surplus {rng.randrange(300, 4000, 50)} travel {rng.randrange(0, 2000, 50)}",
+        f"offer {offer} competitor {round(offer + rng.uniform(-0.2, 0.5), 1)}"
+        + (" fee conscious" if rng.random() < 0.6 else ""),
+    ]
+    if rng.random() < 0.7:
+        notes.append(rng.choice(GOAL_NOTES).format(tenure=rng.randint(1, 25)))
+    if rng.random() < 0.3:
+        notes.insert(rng.randint(1, len(notes)), rng.choice(FILLER_NOTES))
+    if rng.random() < 0.8:
+        notes.append("summary")
+    return notes
+
+def generate_records(leads: int, seed: int = 0, interleave: int = 50) -> Iterator[dict]:
+    # {lead_id, note} records, as call_prep_cli.py reads them. Up to
+    # `interleave` leads are in progress at once, so consecutive records
+    # usually belong to different leads.
+    rng = random.Random(seed)
+    active: list[tuple[int, list[str]]] = []
+    next_id = 1
+    while active or next_id <= leads:
+        while len(active) < interleave and next_id <= leads:
+            active.append((next_id, lead_notes(rng)))
+            next_id += 1
+        i = rng.randrange(len(active))
+        lead_id, notes = active[i]
+        yield {"lead_id": lead_id, "note": notes.pop(0)}
+        if not notes:
+            active[i] = active[-1]
+            active.pop()
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Write a synthetic notes corpus as JSONL for call_prep_cli.py.")
+    parser.add_argument("leads", type=int, help="number of leads")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    for rec in generate_records(args.leads, args.seed):
+        sys.stdout.write(json.dumps(rec) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+from typing import NamedTuple
+
+import numpy as np
+
+# Refinance economics for the side-by-side view: fixed-rate amortization in
+# closed form, evaluated with NumPy broadcasting so one call prices any mix of
+# rates, terms and closing costs (a 3-row comparison or a full what-if grid)
+# without a per-month loop.
+
+DEFAULT_CLOSING_COST_PCT = 2.0  # of the refinanced balance, when no quote is known
+HORIZONS_MONTHS = (60, 84)  # 5- and 7-year interest
+
+class Amortization(NamedTuple):
+    payment: np.ndarray  # monthly principal + interest
+    total_interest: np.ndarray
+    interest_5y: np.ndarray
+    interest_7y: np.ndarray
+
+def monthly_payment(balance, rate_pct, term_years) -> np.ndarray:
+    balance = np.asarray(balance, dtype=float)
+    r = np.asarray(rate_pct, dtype=float) / 1200.0
+    n = np.round(np.asarray(term_years, dtype=float) * 12.0)
+    growth = np.power(1.0 + r, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pay = balance * r * growth / (growth - 1.0)
+        return np.where(r == 0.0, balance / n, pay)
+
+def interest_paid(balance, rate_pct, term_years, months) -> np.ndarray:
+    # Interest over the first `months` payments: what was paid minus the
+    # principal retired, with the remaining balance taken in closed form.
+    balance = np.asarray(balance, dtype=float)
+    r = np.asarray(rate_pct, dtype=float) / 1200.0
+    n = np.round(np.asarray(term_years, dtype=float) * 12.0)
+    k = np.minimum(np.asarray(months, dtype=float), n)
+    pay = monthly_payment(balance, rate_pct, term_years)
+    growth = np.power(1.0 + r, k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        remaining = balance * growth - pay * (growth - 1.0) / r
+        remaining = np.where(r == 0.0, balance - pay * k, remaining)
+    return k * pay - (balance - remaining)
+
+def amortize(balance, rate_pct, term_years) -> Amortization:
+    # All arguments broadcast against each other.
+    pay = monthly_payment(balance, rate_pct, term_years)
+    n = np.round(np.asarray(term_years, dtype=float) * 12.0)
+    total = n * pay - np.asarray(balance, dtype=float)
+    short, long = (interest_paid(balance, rate_pct, term_years, m) for m in HORIZONS_MONTHS)
+    return Amortization(pay, total, short, long)
+
+def breakeven_months(closing_costs, baseline_payment, new_payment) -> np.ndarray:
+    # Months of payment savings needed to recover closing costs; inf when the
+    # new payment is not lower.
+    saving = np.asarray(baseline_payment, dtype=float) - np.asarray(new_payment, dtype=float)
+    costs = np.asarray(closing_costs, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months = np.where(saving > 0.0, costs / saving, np.inf)
+    return np.where(costs <= 0.0, np.where(saving > 0.0, 0.0, np.inf), months)
+
+# -----------------------------------------------------------------------------
+# Side-by-side and what-if grids
+# -----------------------------------------------------------------------------
+SCENARIOS = ("Today", "Your offer", "Competitor")
+
+class Comparison(NamedTuple):
+    rate: np.ndarray  # one entry per SCENARIOS row; NaN where unknown
+    amortization: Amortization
+    closing_costs: np.ndarray
+    breakeven_months: np.ndarray
+
+def side_by_side(
+    balance: float,
+    term_years: float,
+    current_rate: float,
+    our_rate: float | None,
+    competitor_rate: float | None,
+    closing_cost_pct: float = DEFAULT_CLOSING_COST_PCT,
+) -> Comparison:
+    # Today keeps the existing loan; both refinance options take the same
+    # balance over the same remaining term, so payments compare like for like.
+    rate = np.array(
+        [current_rate, np.nan if our_rate is None else our_rate, np.nan if competitor_rate is None else competitor_rate],
+        dtype=float,
+    )
+    am = amortize(balance, rate, term_years)
+    costs = np.array([0.0, 1.0, 1.0]) * balance * closing_cost_pct / 100.0
+    breakeven = breakeven_months(costs, am.payment[0], am.payment)
+    return Comparison(rate, am, costs, breakeven)
+
+class Sweep(NamedTuple):
+    rates: np.ndarray
+    terms_years: np.ndarray
+    closing_costs: np.ndarray
+    amortization: Amortization  # shape (rates, terms, 1)
+    breakeven_months: np.ndarray  # shape (rates, terms, closing_costs)
+
+def sweep(balance: float, rates, terms_years, closing_costs, baseline_payment: float) -> Sweep:
+    # What-if grid: every combination of offer rate, term and closing costs in
+    # one broadcast evaluation.
+    rates = np.asarray(rates, dtype=float)
+    terms = np.asarray(terms_years, dtype=float)
+    costs = np.asarray(closing_costs, dtype=float)
+    am = amortize(balance, rates[:, None, None], terms[None, :, None])
+    breakeven = breakeven_months(costs[None, None, :], baseline_payment, am.payment)
+    return Sweep(rates, terms, costs, am, breakeven)
@@ -0,0 +1,887 @@
+import hashlib
+import math
+import os
+import re
+from array import array
+from operator import itemgetter
+from time import perf_counter as clock
+from typing import Iterator, NamedTuple
+
+from call_prep_cache import ResponseCache
+from call_prep_economics import DEFAULT_CLOSING_COST_PCT, SCENARIOS, side_by_side, sweep
+from call_prep_keywords import KeywordAutomaton
+from call_prep_metrics import METRICS, timed
+from call_prep_pricing import Quote, RateSheet
+
+# Pure call-prep logic: no Streamlit import, so it can run headless (CLI,
+# batch jobs) as well as behind sales_call_prep_chat.py.
+
+RATE_FLOOR = 6.0  # percent; used when the rate sheet has no matching cell
+RATE_SHEET_PATH = os.environ.get("CALL_PREP_RATE_SHEET") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rate_sheet.csv"
+)
+RESPONSE_CACHE_SIZE = int(os.environ.get("CALL_PREP_CACHE_SIZE", "4096"))  # 0 disables the cache
+RESPONSE_CACHE_TTL = float(os.environ.get("CALL_PREP_CACHE_TTL", "900"))  # seconds
+
+# -----------------------------------------------------------------------------
+# Lead state
+# -----------------------------------------------------------------------------
+LEAD_FIELDS = (
+    "name",
+    "state",
+    "segment",
+    "tenure_years",
+    "objective",
+    "current_rate",
+    "current_payment",
+    "remaining_term_years",
+    "remaining_balance",
+    "competitor_rate",
+    "our_rate",
+    "suggested_rate",
+    "rate_floor",
+    "savings_balance",
+    "monthly_surplus",
+    "travel_spend",
+    "pricing_concern",
+    "big_goal",
+)
+
+_FIELD_INDEX = {name: i for i, name in enumerate(LEAD_FIELDS)}
+_NO_STAMPS = array("I", [0]) * len(LEAD_FIELDS)
+
+class Lead:
+    """One refinance lead: fixed slots, no per-instance dict.
+
+    Every real change to a field bumps `version` and stamps that field with
+    the new version, so rendered fragments can be reused until one of their
+    source fields changes (see lead_facts). Writing an unchanged value is free.
+    Stamps are one packed array; the memo of derived values is only created
+    once something is memoized, so an idle lead stays small.
+    """
+
+    __slots__ = LEAD_FIELDS + ("version", "_stamps", "_memo")
+
+    def __init__(self, **fields):
+        init = object.__setattr__
+        for name in LEAD_FIELDS:
+            init(self, name, None)
+        init(self, "pricing_concern", False)
+        init(self, "version", 0)
+        init(self, "_stamps", _NO_STAMPS[:])
+        init(self, "_memo", None)
+        self.update(fields)
+
+    def __setattr__(self, name, value):
+        i = _FIELD_INDEX.get(name)
+        if i is not None:
+            if getattr(self, name) == value:
+                return
+            version = self.version + 1
+            object.__setattr__(self, "version", version)
+            self._stamps[i] = version
+        object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return (Lead.from_dict, (self.to_dict(),))
+
+    def update(self, fields: dict):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def copy(self) -> "Lead":
+        other = Lead.__new__(Lead)
+        init = object.__setattr__
+        for name in LEAD_FIELDS:
+            init(other, name, getattr(self, name))
+        init(other, "version", self.version)
+        init(other, "_stamps", self._stamps[:])
+        init(other, "_memo", None)
+        return other
+
+    def memo(self) -> dict:
+        # Derived values cached on this lead (pricing key, rendered facts).
+        memo = self._memo
+        if memo is None:
+            memo = {}
+            object.__setattr__(self, "_memo", memo)
+        return memo
+
+    def state_key(self) -> tuple:
+        # Every field value, in LEAD_FIELDS order: equal leads, equal keys.
+        memo = self.memo()
+        hit = memo.get("state_key")
+        if hit is None or hit[0] != self.version:
+            hit = memo["state_key"] = (self.version, tuple(getattr(self, name) for name in LEAD_FIELDS))
+        return hit[1]
+
+    def changed_since(self, version: int) -> list[str]:
+        return [name for name, stamp in zip(LEAD_FIELDS, self._stamps) if stamp > version]
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in LEAD_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Lead":
+        return cls(**{name: data[name] for name in LEAD_FIELDS if name in data})
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Lead):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in LEAD_FIELDS)
+
+    def __repr__(self) -> str:
+        filled = ", ".join(f"{name}={getattr(self, name)!r}" for name in LEAD_FIELDS if getattr(self, name) is not None)
+        return f"Lead({filled})"
+
+    # Derived checks shared by infer_stage and the reply builders.
+    @property
+    def has_loan_basics(self) -> bool:
+        return self.current_rate is not None and self.current_payment is not None and self.remaining_balance is not None
+
+    @property
+    def has_cash_picture(self) -> bool:
+        return self.monthly_surplus is not None and self.savings_balance is not None
+
+    @property
+    def has_quotes(self) -> bool:
+        return self.our_rate is not None and self.competitor_rate is not None
+
+def lead_delta(before: Lead, after: Lead) -> dict:
+    return {
+        name: getattr(after, name)
+        for name in LEAD_FIELDS
+        if getattr(before, name) != getattr(after, name)
+    }
+
+# -----------------------------------------------------------------------------
+# Note parsing (with improved rate parsing)
+# -----------------------------------------------------------------------------
+_US_NUMBER = re.compile(r"(\d+(\.\d+)?)(k)?")
+
+def parse_us_number(token: str) -> float | None:
+    token = token.lower().replace(",", "").replace("%", "").strip()
+    m = _US_NUMBER.match(token)
+    if not m:
+        return None
+    val = float(m.group(1))
+    if m.group(3):
+        val *= 1000.0
+    return val
+
+def _digits_to_float(digits: str) -> float:
+    # digits is "[0-9][0-9.,]*" from the scanner; same result as parse_us_number
+    whole, _, frac = digits.replace(",", "").partition(".")
+    frac = frac.partition(".")[0]
+    return float(f"{whole}.{frac}") if frac else float(whole)
+
+# Note labels -> lead fields. Adding a label here adds it to the single scan below.
+NOTE_LABELS = {
+    "tenure": "tenure_years",
+    "current loan rate": "current_rate",
+    "current rate": "current_rate",
+    "rate": "current_rate",
+    "payment": "current_payment",
+    "pay": "current_payment",
+    "term": "remaining_term_years",
+    "balance": "remaining_balance",
+    "bal": "remaining_balance",
+    "savings": "savings_balance",
+    "dep": "savings_balance",
+    "surplus": "monthly_surplus",
+    "travel": "travel_spend",
+    "our rate": "our_rate",
+    "offer": "our_rate",
+}
+
+# One alternation tried left to right at each position: labelled values first
+# (longest label wins, so "our rate 6.9" is never read as "rate 6.9"), then
+# "competitor ... <n>" as a lookahead so later labels are still seen, then any
+# bare number for the current-rate fallback.
+_NOTE_SCANNER = re.compile(
+    r"(?P<label>"
+    + "|".join(re.escape(label) for label in sorted(NOTE_LABELS, key=len, reverse=True))
+    + r")\s+(?P<value>\d[\d.,]*)(?P<k>k)?"
+    r"|competitor(?=\D*?(?P<competitor>\d[\d.,]*)(?P<competitor_k>k)?)"
+    r"|(?P<bare>\d[\d.,]*)"
+)
+
+def scan_note(text: str) -> tuple[dict[str, float], float | None]:
+    """Walk a note once; return {lead field: value} plus the first bare number."""
+    fields: dict[str, float] = {}
+    first_number = None
+    for m in _NOTE_SCANNER.finditer(text.lower()):
+        label = m.group("label")
+        if label is not None:
+            digits, k = m.group("value"), m.group("k")
+            field = NOTE_LABELS[label]
+        elif m.group("competitor") is not None:
+            digits, k = m.group("competitor"), m.group("competitor_k")
+            field = "competitor_rate"
+        else:
+            if first_number is None:
+                first_number = _digits_to_float(m.group("bare"))
+            continue
+        val = _digits_to_float(digits)
+        if first_number is None:
+            first_number = val
+        if field not in fields:
+            fields[field] = val * 1000.0 if k else val
+    return fields, first_number
+
+def extract_name(text: str) -> str | None:
+    m = re.search(
+        r"\b(call(?:ing)?|speaking to|talking to|meeting|meeting with|with)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)",
+        text,
+    )
+    return m.group(2) if m else None
+
+# Whole-word phrases that set a lead field. When several phrases for the same
+# field appear in one note, the one listed first here wins (this is what ranks
+# the segments).
+KEYWORD_VOCABULARY: list[tuple[str, str, object]] = [
+    *(
+        (phrase, "segment", "Self‑employed / business owner")
+        for phrase in ("self-employed", "self employed", "business owner", "business owners", "1099")
+    ),
+    *(
+        (phrase, "segment", "HNW / private banking")
+        for phrase in ("high net worth", "private bank", "private banking", "premier")
+    ),
+    *(
+        (phrase, "segment", "Affluent professional")
+        for phrase in ("affluent", "professional", "professionals")
+    ),
+    *((phrase, "segment", "Salaried") for phrase in ("salary", "salaried", "w2")),
+    *(
+        (phrase, "objective", "refinance existing mortgage and improve cash flow")
+        for phrase in ("refinance", "refinancing", "refi", "refis", "mortgage", "mortgages")
+    ),
+    *(
+        (phrase, "pricing_concern", True)
+        for phrase in ("fees", "pricing", "closing costs", "points", "fee conscious", "fee sensitive")
+    ),
+    *(
+        (phrase, "big_goal", "college / education funding")
+        for phrase in ("college", "education", "tuition", "daughter", "daughters", "son", "sons")
+    ),
+]
+_KEYWORDS = KeywordAutomaton(phrase for phrase, _, _ in KEYWORD_VOCABULARY)
+
+def keyword_fields(text: str) -> dict[str, object]:
+    fields: dict[str, object] = {}
+    hits = _KEYWORDS.matches(text)
+    if hits:
+        for i in sorted(hits):
+            _, field, value = KEYWORD_VOCABULARY[i]
+            if field not in fields:
+                fields[field] = value
+    return fields
+
+def detect_segment(text: str) -> str | None:
+    return keyword_fields(text).get("segment")
+
+SEGMENT_CODES = {
+    "Self‑employed / business owner": "self_employed",
+    "HNW / private banking": "hnw",
+    "Affluent professional": "affluent",
+    "Salaried": "salaried",
+}
+
+def update_lead_from_free_text(lead: Lead, text: str):
+    name = extract_name(text)
+    if name:
+        lead.name = name
+
+    m_state = re.search(r"\b(in|from)\s+([A-Z][a-z]+)", text)
+    if m_state and not lead.state:
+        lead.state = m_state.group(2)
+
+    found = keyword_fields(text)
+    if "segment" in found and not lead.segment:
+        lead.segment = found["segment"]
+    if "objective" in found and not lead.objective:
+        lead.objective = found["objective"]
+    if "pricing_concern" in found:
+        lead.pricing_concern = True
+    if "big_goal" in found:
+        lead.big_goal = found["big_goal"]
+
+def parse_structured_short_input(lead: Lead, text: str):
+    fields, first_number = scan_note(text)
+    for field, value in fields.items():
+        if value:
+            setattr(lead, field, value)
+
+    # bare percentage or number, if rate still missing
+    if lead.current_rate is None and first_number:
+        lead.current_rate = first_number
+
+# -----------------------------------------------------------------------------
+# Stage and replies
+# -----------------------------------------------------------------------------
+def infer_stage(lead: Lead) -> int:
+    if not lead.has_loan_basics:
+        return 1
+    if not lead.has_cash_picture and not lead.pricing_concern:
+        return 2
+    if lead.pricing_concern and not lead.has_quotes:
+        return 3
+    if lead.big_goal is None:
+        return 4
+    return 5
+
+# -----------------------------------------------------------------------------
+# Pricing
+# -----------------------------------------------------------------------------
+RATE_SHEET = RateSheet(RATE_SHEET_PATH, fallback=Quote(None, RATE_FLOOR))
+_PRICING_INDEXES = tuple(_FIELD_INDEX[f] for f in ("state", "segment", "remaining_balance", "remaining_term_years"))
+
+def apply_pricing(lead: Lead):
+    # Sets lead.suggested_rate / lead.rate_floor from the rate sheet. Skipped
+    # unless a pricing input or the sheet itself changed since the last call.
+    RATE_SHEET.refresh()
+    s = lead._stamps
+    a, b, c, d = _PRICING_INDEXES
+    key = (max(s[a], s[b], s[c], s[d]), RATE_SHEET.version)
+    memo = lead.memo()
+    if memo.get("pricing") == key:
+        return
+    quote = RATE_SHEET.lookup(
+        lead.state, SEGMENT_CODES.get(lead.segment), lead.remaining_balance, lead.remaining_term_years
+    )
+    lead.suggested_rate = quote.offer
+    lead.rate_floor = quote.floor
+    memo["pricing"] = key
+
+def invalidate_pricing(lead: Lead):
+    # Makes the next apply_pricing re-price even if the inputs look unchanged:
+    # for fields set back wholesale (undo / redo), whose suggested rate and
+    # floor may predate the current sheet.
+    if lead._memo is not None:
+        lead._memo.pop("pricing", None)
+
+def rate_floor(lead: Lead) -> float:
+    return RATE_FLOOR if lead.rate_floor is None else lead.rate_floor
+
+# -----------------------------------------------------------------------------
+# Question catalog
+# -----------------------------------------------------------------------------
+QUESTIONS_PER_TURN = 5
+
+class Question(NamedTuple):
+    stage: int
+    topic: str
+    text: str
+    priority: int  # lower is asked first within a stage
+    requires: tuple[str, ...] = ()  # lead fields that must be captured first
+    segment: str | None = None  # only for leads in this segment
+
+QUESTION_CATALOG = [
+    Question(1, "balance_term", "About how much do you still owe and how many years are left on the mortgage?", 10),
+    Question(1, "payment_amount", "What is your current monthly mortgage payment (principal + interest)?", 20),
+    Question(1, "current_rate_q", "Do you know your current interest rate, even roughly?", 30),
+    Question(1, "stay_horizon", "How long do you see yourself staying in this home?", 40),
+    Question(1, "refi_reason", "What made you start thinking about refinancing right now?", 50),
+    Question(2, "payment_comfort", "Does your current payment ever force you to cut back on other things in the month?", 10),
+    Question(2, "surplus", "After the mortgage and bills, about how much cash is usually left over each month?", 20),
+    Question(2, "deposits", "Roughly how much do you keep across checking and savings with us today?", 30),
+    Question(2, "shorten_vs_free_cash", "If we reduce your payment, would you rather free up cash or shorten the time to pay off the home?", 40),
+    Question(2, "upcoming_expenses", "Are there any large expenses coming up we should factor in?", 50),
+    Question(3, "fee_concern_detail", "Which specific fees or closing costs are you most concerned about?", 10),
+    Question(3, "competitor_detail", "What has the other lender offered you so far in terms of rate and fees?", 20),
+    Question(3, "compare_focus", "Over the next 5–7 years, what will you compare first – monthly payment, APR, or total cost?", 30),
+    Question(3, "cash_vs_payment", "Would you prefer lower cash to close or the lowest possible payment if we have to trade off?", 40),
+    Question(3, "if_we_beat_comp", "If our offer clearly beats the other one, are you comfortable moving ahead with us?", 50),
+    Question(4, "goals_general", "What big goals do you have over the next 3–5 years, like college or renovations?", 10),
+    Question(4, "liquidity_vs_return", "For those goals, do you value liquidity more, or are you open to locking some money away for better returns?", 20),
+    Question(4, "goal_monthly_commit", "Out of what is left each month, how much would you be comfortable committing toward those goals?", 30),
+    Question(4, "goal_bucket", "Would a separate account or bucket for that goal help you stay on track?", 40),
+    Question(4, "goal_importance", "How important is it that the refinance structure directly supports that goal?", 50),
+    Question(5, "ready_to_move", "If the numbers look good, are you comfortable moving forward with the refinance today?", 10),
+    Question(5, "deal_stoppers", "Is there anything that would stop you from saying yes if we meet your expectations on rate and fees?", 20),
+    Question(5, "comparison_format", "How would you like to see the comparison – side‑by‑side with your current loan and the other offer?", 30),
+    Question(5, "card_timing", "Do you want to decide on any card or banking changes now, or keep that for a quick follow‑up?", 40, requires=("travel_spend",)),
+    Question(5, "delivery_pref", "What is the best way for me to send you the final numbers and next steps?", 50),
+]
+
+# Compiled once at import: each topic gets one bit, assigned in (stage,
+# priority) order so that ascending bits are the order questions are asked.
+_QUESTIONS = sorted(QUESTION_CATALOG, key=lambda q: (q.stage, q.priority))
+TOPIC_BITS = {q.topic: 1 << i for i, q in enumerate(_QUESTIONS)}
+QUESTION_TEXT = {q.topic: q.text for q in _QUESTIONS}
+_STAGE_MASKS: dict[int, int] = {}
+_REQUIRES_MASKS: dict[str, int] = {}
+_SEGMENT_MASKS: dict[str, int] = {}
+for _q in _QUESTIONS:
+    _bit = TOPIC_BITS[_q.topic]
+    _STAGE_MASKS[_q.stage] = _STAGE_MASKS.get(_q.stage, 0) | _bit
+    for _field in _q.requires:
+        _REQUIRES_MASKS[_field] = _REQUIRES_MASKS.get(_field, 0) | _bit
+    if _q.segment is not None:
+        _SEGMENT_MASKS[_q.segment] = _SEGMENT_MASKS.get(_q.segment, 0) | _bit
+_ANY_SEGMENT_MASK = 0
+for _mask in _SEGMENT_MASKS.values():
+    _ANY_SEGMENT_MASK |= _mask
+
+def topics_in(mask: int) -> list[str]:
+    topics = []
+    while mask:
+        low = mask & -mask
+        topics.append(_QUESTIONS[low.bit_length() - 1].topic)
+        mask ^= low
+    return topics
+
+class AskedTopics:
+    """Topics already put to the customer, as a bitset over TOPIC_BITS.
+
+    Bit positions follow the catalog order and move when it changes, so keep
+    topic names (`list(asked)`, `from_topics`) anywhere they outlive the process.
+    """
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+    @classmethod
+    def from_topics(cls, topics) -> "AskedTopics":
+        # Topics no longer in the catalog are dropped.
+        bits = 0
+        for topic in topics:
+            bits |= TOPIC_BITS.get(topic, 0)
+        return cls(bits)
+
+    def __contains__(self, topic: str) -> bool:
+        return bool(self.bits & TOPIC_BITS[topic])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(topics_in(self.bits))
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def add(self, topic: str):
+        self.bits |= TOPIC_BITS[topic]
+
+    def copy(self) -> "AskedTopics":
+        return AskedTopics(self.bits)
+
+    def since(self, before: "AskedTopics") -> list[str]:
+        return topics_in(self.bits & ~before.bits)
+
+def question_mask(lead: Lead, asked: AskedTopics, limit: int = QUESTIONS_PER_TURN) -> int:
+    # Eligible = this stage's bank, minus asked, minus questions whose
+    # preconditions fail; then keep the `limit` highest-priority (lowest) bits.
+    mask = _STAGE_MASKS[infer_stage(lead)] & ~asked.bits
+    for field, requires in _REQUIRES_MASKS.items():
+        if getattr(lead, field) is None:
+            mask &= ~requires
+    if _ANY_SEGMENT_MASK:
+        mask &= ~(_ANY_SEGMENT_MASK & ~_SEGMENT_MASKS.get(lead.segment, 0))
+    picked = 0
+    for _ in range(limit):
+        if not mask:
+            break
+        low = mask & -mask
+        picked |= low
+        mask ^= low
+    return picked
+
+# -----------------------------------------------------------------------------
+# Lead facts (shared by the guidance snapshot and the call summary)
+# -----------------------------------------------------------------------------
+# Each fact renders its snapshot wording and its summary wording together, and
+# the pair is cached on the lead until one of the fact's source fields changes.
+# A view's whole block is additionally cached against lead.version.
+SNAPSHOT, SUMMARY = 0, 1
+
+def _fact_tenure(lead: Lead):
+    if lead.tenure_years is None:
+        return None
+    return (
+        f"- Relationship: **{lead.tenure_years:.0f} yrs** with your bank.",
+        f"- Relationship: **{lead.tenure_years:.0f} years** with your bank.",
+    )
+
+def _fact_mortgage(lead: Lead):
+    if lead.current_rate is None:
+        return None
+    rate = f"{lead.current_rate:.2f}%"
+    pay = f"${lead.current_payment:.0f}/mo" if lead.current_payment else None
+    return (
+        f"- Current mortgage: **{rate}**, {pay or 'payment not captured yet'}.",
+        f"- Current mortgage: **{rate}**, {pay or 'payment not captured'}.",
+    )
+
+def _fact_balance(lead: Lead):
+    if lead.remaining_balance is None:
+        return None
+    yrs_txt = f"{lead.remaining_term_years:.0f} yrs left" if lead.remaining_term_years else "term not captured"
+    line = f"- Remaining balance: **${lead.remaining_balance:.0f}**, {yrs_txt}."
+    return (line, line)
+
+def _fact_suggested(lead: Lead):
+    if lead.suggested_rate is None or lead.our_rate is not None:
+        return None
+    return (
+        f"- Rate sheet offer: **{lead.suggested_rate:.2f}%** for this profile.",
+        f"- Rate sheet offer: **{lead.suggested_rate:.2f}%** (state / segment / balance band).",
+    )
+
+def _fact_offer(lead: Lead):
+    floor = rate_floor(lead)
+    if lead.our_rate is None:
+        return (
+            f"- Pricing guardrail: :red[do not quote below **{floor:.2f}%**].",
+            f"- Pricing guardrail: :red[do not go below **{floor:.2f}%** on rate.]",
+        )
+    rate_txt = f"{lead.our_rate:.2f}%"
+    if lead.our_rate < floor:
+        return (
+            f"- :red[Working offer {rate_txt} is **below** floor {floor:.2f}%. Do **not** go this low.]",
+            f"- :red[Offer {rate_txt} is **below** internal floor **{floor:.2f}%**. Adjust pricing upward before quoting.]",
+        )
+    return (
+        f"- Your working offer: **{rate_txt}** (subject to approval).",
+        f"- Working offer: **{rate_txt}** (subject to underwriting).",
+    )
+
+def _fact_competitor(lead: Lead):
+    if lead.competitor_rate is None:
+        return None
+    return (
+        f"- Competitor mentioned: ~**{lead.competitor_rate:.2f}%**.",
+        f"- Competitor in play: ~**{lead.competitor_rate:.2f}%**.",
+    )
+
+def _fact_deposits(lead: Lead):
+    if lead.savings_balance is None:
+        return None
+    return (
+        f"- Deposits: ~**${lead.savings_balance:.0f}** with your bank.",
+        f"- Deposits: around **${lead.savings_balance:.0f}** on your books.",
+    )
+
+def _fact_surplus(lead: Lead):
+    if lead.monthly_surplus is None:
+        return None
+    return (
+        f"- Monthly surplus: ~**${lead.monthly_surplus:.0f}** after bills.",
+        f"- Monthly surplus: roughly **${lead.monthly_surplus:.0f}** after bills.",
+    )
+
+def _fact_travel(lead: Lead):
+    if lead.travel_spend is None:
+        return None
+    return (
+        f"- Travel / card spend: ~**${lead.travel_spend:.0f}/mo**.",
+        f"- Card / travel spend: about **${lead.travel_spend:.0f} per month**.",
+    )
+
+def _fact_pricing_concern(lead: Lead):
+    if not lead.pricing_concern:
+        return None
+    return (
+        "- Customer is **rate‑ and fee‑sensitive**.",
+        "- Borrower is strongly **price‑ and fee‑sensitive**; structure and cash to close matter.",
+    )
+
+def _fact_goal(lead: Lead):
+    if not lead.big_goal:
+        return None
+    return (
+        "- Long‑term goal discussed: **college / education in ~3–4 years**.",
+        "- Stated goal: **college / education saving in the next few years**, wants liquidity with some growth.",
+    )
+
+def _fact_objective(lead: Lead):
+    if not lead.objective:
+        return None
+    return (None, f"- Your internal goal: **{lead.objective}**.")
+
+# (source fields, renderer), in display order
+FACTS = [
+    (("tenure_years",), _fact_tenure),
+    (("current_rate", "current_payment"), _fact_mortgage),
+    (("remaining_balance", "remaining_term_years"), _fact_balance),
+    (("suggested_rate", "our_rate"), _fact_suggested),
+    (("our_rate", "rate_floor"), _fact_offer),
+    (("competitor_rate",), _fact_competitor),
+    (("savings_balance",), _fact_deposits),
+    (("monthly_surplus",), _fact_surplus),
+    (("travel_spend",), _fact_travel),
+    (("pricing_concern",), _fact_pricing_concern),
+    (("big_goal",), _fact_goal),
+    (("objective",), _fact_objective),
+]
+# Per fact, a getter for the stamps of all its source fields (always a tuple:
+# the first field is repeated) and its renderer.
+_FACT_DEPS = [
+    (itemgetter(*(_FIELD_INDEX[name] for name in deps), _FIELD_INDEX[deps[0]]), render)
+    for deps, render in FACTS
+]
+
+def lead_facts(lead: Lead, view: int) -> list[str]:
+    memo = lead.memo()
+    hit = memo.get(("facts", view))
+    if hit is not None and hit[0] == lead.version:
+        return hit[1]
+    stamps = lead._stamps
+    fact_stamps, fact_lines = memo.get("facts") or memo.setdefault("facts", ([-1] * len(FACTS), [None] * len(FACTS)))
+    lines = []
+    for i, (deps, render) in enumerate(_FACT_DEPS):
+        stamp = max(deps(stamps))
+        if fact_stamps[i] != stamp:
+            fact_stamps[i] = stamp
+            fact_lines[i] = render(lead)
+        pair = fact_lines[i]
+        if pair is not None and pair[view] is not None:
+            lines.append(pair[view])
+    memo[("facts", view)] = (lead.version, lines)
+    return lines
+
+def _memoized(lead: Lead, key: str, build) -> list[str]:
+    memo = lead.memo()
+    hit = memo.get(key)
+    if hit is None or hit[0] != lead.version:
+        hit = memo[key] = (lead.version, list(build(lead)))
+    return hit[1]
+
+# -----------------------------------------------------------------------------
+# Shared reply cache
+# -----------------------------------------------------------------------------
+# Replies are keyed on the kind of reply, the lead's field values and (for
+# guidance) the questions picked, so identical leads in different sessions
+# share one rendering. The generation covers everything else a reply depends
+# on; when it changes the cache is emptied.
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+_CATALOG_DIGEST = hashlib.sha1(repr((QUESTIONS_PER_TURN, _QUESTIONS)).encode()).hexdigest()
+
+def reply_generation() -> tuple:
+    return (_CATALOG_DIGEST, RATE_FLOOR, RATE_SHEET.version)
+
+def _cached(key: tuple, build) -> Iterator[str]:
+    generation = reply_generation()
+    blocks = RESPONSE_CACHE.get(key, generation)
+    if blocks is not None:
+        yield from blocks
+        return
+    rendered = []
+    for block in build():
+        rendered.append(block)
+        yield block
+    RESPONSE_CACHE.put(key, tuple(rendered), generation)
+
+# -----------------------------------------------------------------------------
+# Replies
+# -----------------------------------------------------------------------------
+def iter_guidance(lead: Lead, asked: AskedTopics, text: str) -> Iterator[str]:
+    mask = prepare_guidance(lead, asked, text)
+    yield from guidance_blocks(lead, mask)
+
+def prepare_guidance(lead: Lead, asked: AskedTopics, text: str) -> int:
+    # Applies the note to the lead and picks this turn's questions; returns
+    # their topic mask. One clock read between stages: cheaper than a timer
+    # per stage.
+    t0 = clock()
+    update_lead_from_free_text(lead, text)
+    parse_structured_short_input(lead, text)
+    t1 = clock()
+    apply_pricing(lead)
+    t2 = clock()
+    mask = question_mask(lead, asked)
+    t3 = clock()
+    asked.bits |= mask
+    METRICS.observe("parse", t1 - t0)
+    METRICS.observe("pricing", t2 - t1)
+    METRICS.observe("stage", t3 - t2)
+    return mask
+
+def guidance_blocks(lead: Lead, mask: int) -> Iterator[str]:
+    return METRICS.timed_iter("guidance", _cached(
+        ("guidance", lead.state_key(), mask),
+        lambda: render_guidance(lead, [(topic, QUESTION_TEXT[topic]) for topic in topics_in(mask)]),
+    ))
+
+def render_guidance(lead: Lead, all_questions: list[tuple[str, str]]) -> Iterator[str]:
+    # Pure rendering of an already-updated lead, so a stored reply can be
+    # rebuilt later from lead state and the topics it asked.
+    name = lead.name or "the customer"
+    state = f" in {lead.state}" if lead.state else ""
+
+    lines = [f"**Ask {name}{state} now:**"]
+    for i, (_, q) in enumerate(all_questions[:5], start=1):
+        if i <= 2:
+            lines.append(f"{i}. **\"{q}\"**")
+        else:
+            lines.append(f"{i}. \"{q}\"")
+
+    if not all_questions:
+        lines.append("1. **\"Is there anything else on your mind before we look at the numbers?\"**")
+    yield "\n".join(lines)
+
+    yield from _memoized(lead, "guidance", _guidance_tail)
+
+def _guidance_tail(lead: Lead) -> Iterator[str]:
+    name = lead.name or "the customer"
+    state = f" in {lead.state}" if lead.state else ""
+    snapshot = lead_facts(lead, SNAPSHOT) or ["- Key numbers not captured yet."]
+    yield f"\n\n**Snapshot so far – {name}{state}:**\n" + "\n".join(snapshot)
+
+    need = []
+    if not lead.has_loan_basics:
+        need.append("basic loan details (rate, payment, remaining balance / term).")
+    if not lead.has_cash_picture:
+        need.append("deposits and typical monthly surplus.")
+    if lead.pricing_concern and not lead.has_quotes:
+        need.append("your working offer rate and any competitor quote.")
+    if lead.big_goal is None and infer_stage(lead) >= 3:
+        need.append("any major life goals (college, renovation, etc.).")
+
+    if need:
+        yield "\n\n**Your internal checklist:**\n" + "\n".join(f"- {n}" for n in need)
+
+    yield "\n\nType `summary` any time for a consolidated call plan."
+
+def build_guidance(lead: Lead, asked: AskedTopics, text: str) -> str:
+    return "".join(iter_guidance(lead, asked, text))
+
+def iter_summary(lead: Lead) -> Iterator[str]:
+    # Repeated "summary" requests on an unchanged lead reuse the same blocks.
+    with timed("pricing"):
+        apply_pricing(lead)
+    yield from summary_blocks(lead)
+
+def summary_blocks(lead: Lead) -> Iterator[str]:
+    # For a lead already priced.
+    return METRICS.timed_iter(
+        "summary", _cached(("summary", lead.state_key()), lambda: _memoized(lead, "summary", render_summary))
+    )
+
+def render_summary(lead: Lead) -> Iterator[str]:
+    name = lead.name or "the customer"
+    state = f" in {lead.state}" if lead.state else ""
+    parts = [f"**Call summary – {name}{state}**\n"]
+    parts.extend(lead_facts(lead, SUMMARY))
+    yield "\n".join(parts)
+
+    table = side_by_side_table(lead)
+    if table:
+        yield "\n\n" + "\n".join(table)
+
+    parts = ["", "", "**Key insights**"]
+    floor = rate_floor(lead)
+    if lead.current_rate and lead.our_rate and lead.our_rate >= floor:
+        rate_delta = lead.current_rate - lead.our_rate
+        if rate_delta > 0:
+            parts.append(
+                f"- You have roughly a **{rate_delta:.2f}% rate improvement** above floor {floor:.2f}%. "
+                "Focus on what that does to payment and interest over the first 5–7 years."
+            )
+            step = rate_step_cost(lead)
+            if step is not None:
+                parts.append(f"- Each **0.125%** on your offer moves the payment by about **${step:,.0f}/mo**.")
+    if lead.monthly_surplus:
+        parts.append("- Surplus each month allows you to propose an automatic transfer into a goal bucket without stressing cash flow.")
+    if lead.pricing_concern:
+        parts.append("- A transparent fee breakdown and breakeven view will matter more than chasing tiny extra rate cuts.")
+    if lead.travel_spend:
+        parts.append("- Card spend is large enough that a targeted rewards card can be a natural follow‑up once the refi is agreed.")
+
+    yield "\n".join(parts)
+
+    parts = ["", "", "**How to steer the call**"]
+    parts.append("- Confirm remaining term, stay‑in‑home horizon, and payment comfort one more time.")
+    parts.append("- Present side‑by‑side: today vs your offer vs competitor (payment, APR, cash to close, breakeven years).")
+    parts.append("- Tie savings from the refi to a specific monthly amount into their college or remodel fund.")
+    if lead.travel_spend is not None:
+        parts.append("- Offer to review card options only after they are comfortable with the refinance numbers.")
+    parts.append("- Finish with a clear checklist of documents, rate‑lock expectations, and how/when you will send final numbers.")
+    yield "\n".join(parts)
+
+def _money(value: float) -> str:
+    return f"${value:,.0f}" if math.isfinite(value) else "—"
+
+def _breakeven(months: float) -> str:
+    if months == 0:
+        return "now"
+    if not math.isfinite(months):
+        return "never"
+    return f"{months:.0f} mo ({months / 12:.1f} yrs)"
+
+def side_by_side_table(lead: Lead) -> list[str]:
+    # Today vs offer vs competitor, once the loan basics and at least one
+    # alternative rate are known.
+    if not (lead.remaining_balance and lead.remaining_term_years and lead.current_rate):
+        return []
+    if lead.our_rate is None and lead.competitor_rate is None:
+        return []
+    cmp = side_by_side(
+        lead.remaining_balance, lead.remaining_term_years, lead.current_rate, lead.our_rate, lead.competitor_rate
+    )
+    am = cmp.amortization
+    lines = [
+        "**Side‑by‑side**",
+        "",
+        "| | Rate | Payment | Interest 5 yrs | Interest 7 yrs | Total interest | Cash to close | Breakeven |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for i, label in enumerate(SCENARIOS):
+        if math.isnan(cmp.rate[i]):
+            continue
+        lines.append(
+            f"| {label} | {cmp.rate[i]:.2f}% | {_money(am.payment[i])} | {_money(am.interest_5y[i])} "
+            f"| {_money(am.interest_7y[i])} | {_money(am.total_interest[i])} | {_money(cmp.closing_costs[i])} "
+            f"| {'—' if i == 0 else _breakeven(cmp.breakeven_months[i])} |"
+        )
+    lines.append("")
+    lines.append(
+        "_Same remaining term for every option; cash to close assumes "
+        f"~{DEFAULT_CLOSING_COST_PCT:.0f}% closing costs until quoted._"
+    )
+    return lines
+
+def rate_step_cost(lead: Lead) -> float | None:
+    if not (lead.remaining_balance and lead.remaining_term_years and lead.our_rate):
+        return None
+    grid = sweep(
+        lead.remaining_balance,
+        [lead.our_rate, lead.our_rate + 0.125],
+        [lead.remaining_term_years],
+        [0.0],
+        baseline_payment=0.0,
+    )
+    pay = grid.amortization.payment[:, 0, 0]
+    return float(pay[1] - pay[0])
+
+def build_summary(lead: Lead) -> str:
+    return "".join(iter_summary(lead))
+
+def is_summary_request(text: str) -> bool:
+    return "summary" in text.strip().lower()
+
+def iter_reply(lead: Lead, asked: AskedTopics, text: str) -> Iterator[str]:
+    # Reply blocks in the order the RM reads them ("Ask ... now" first), so the
+    # UI can render each one as soon as it is ready.
+    if is_summary_request(text):
+        return iter_summary(lead)
+    return iter_guidance(lead, asked, text)
+
+def respond(lead: Lead, asked: AskedTopics, text: str) -> str:
+    return "".join(iter_reply(lead, asked, text))
+
+# -----------------------------------------------------------------------------
+# Batch records (shared by the CLI and the worker pool)
+# -----------------------------------------------------------------------------
+def note_result(lead_id: str, lead: Lead, asked: AskedTopics, note: str) -> dict:
+    reply = respond(lead, asked, note)
+    return {"lead_id": lead_id, "stage": infer_stage(lead), "reply": reply}
+
+def summary_result(lead_id: str, lead: Lead) -> dict:
+    return {
+        "lead_id": lead_id,
+        "stage": infer_stage(lead),
+        "lead": lead.to_dict(),
+        "summary": build_summary(lead),
+    }
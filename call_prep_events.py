@@ -0,0 +1,110 @@
+from bisect import bisect_right
+from typing import Iterable, NamedTuple
+
+from call_prep_engine import Lead
+
+# The lead's history as an append-only log of field changes.
+#
+# Every reply that changed the lead is one event: the fields it set, each
+# with its value before and after. Undo and redo are events too (they set
+# the fields back, or forward again), so the log is never rewritten and
+# replaying it always gives the current lead. A full copy of the fields is
+# kept every SNAPSHOT_EVERY events, so the lead as of any message is rebuilt
+# from the nearest snapshot and a handful of events, not from the start.
+#
+# The log is derived from the transcript (each reply carries its delta), so
+# it needs no storage of its own: a stored transcript rebuilds it in one pass.
+
+SNAPSHOT_EVERY = 32
+UNDO, REDO = "undo", "redo"
+
+class LeadEvent(NamedTuple):
+    message: int  # transcript index of the message carrying the event
+    kind: str  # reply kind ("guidance", "summary"), UNDO or REDO
+    changes: dict[str, tuple]  # field -> (before, after)
+    target: int | None = None  # UNDO / REDO: seq of the event undone or redone
+
+class EventLog:
+    def __init__(self):
+        self.events: list[LeadEvent] = []
+        self._messages: list[int] = []  # events[i].message, for bisection
+        self._snapshots: list[dict] = []  # fields after events[: (i + 1) * SNAPSHOT_EVERY]
+        self._state = Lead().to_dict()
+        self._undo: list[int] = []  # seqs of events that can be undone, newest last
+        self._redo: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[dict]) -> "EventLog":
+        log = cls()
+        for i, msg in enumerate(messages):
+            if "kind" in msg:
+                log.record(i, msg.get("delta") or {}, msg["kind"], msg.get("target"))
+        return log
+
+    def record(self, message: int, delta: dict, kind: str, target: int | None = None) -> LeadEvent | None:
+        # Appends the event for a message whose reply set `delta`; returns
+        # None when nothing actually changed. An undo or redo moves its target
+        # to the other stack either way, so the buttons never stick on it.
+        state = self._state
+        changes = {name: (state.get(name), value) for name, value in delta.items() if state.get(name) != value}
+        seq = len(self.events)
+        if kind == UNDO:
+            self._undo.remove(target)
+            self._redo.append(target)
+        elif kind == REDO:
+            self._redo.remove(target)
+            self._undo.append(target)
+        elif changes:
+            self._undo.append(seq)
+            self._redo.clear()
+        if not changes:
+            return None
+        event = LeadEvent(message, kind, changes, target)
+        self.events.append(event)
+        self._messages.append(message)
+        state.update((name, after) for name, (_, after) in changes.items())
+        if len(self.events) % SNAPSHOT_EVERY == 0:
+            self._snapshots.append(dict(state))
+        return event
+
+    # -------------------------------------------------------------------------
+    # Undo / redo
+    # -------------------------------------------------------------------------
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def undo_delta(self) -> tuple[int, dict] | None:
+        # (seq of the event to undo, field values that undo it)
+        if not self._undo:
+            return None
+        seq = self._undo[-1]
+        return seq, {name: before for name, (before, _) in self.events[seq].changes.items()}
+
+    def redo_delta(self) -> tuple[int, dict] | None:
+        if not self._redo:
+            return None
+        seq = self._redo[-1]
+        return seq, {name: after for name, (_, after) in self.events[seq].changes.items()}
+
+    # -------------------------------------------------------------------------
+    # Replay
+    # -------------------------------------------------------------------------
+    def fields_at(self, message: int) -> dict:
+        # Lead fields as they stood once message `message` was handled.
+        count = bisect_right(self._messages, message)
+        base = min(count // SNAPSHOT_EVERY, len(self._snapshots))
+        fields = dict(self._snapshots[base - 1]) if base else Lead().to_dict()
+        for event in self.events[base * SNAPSHOT_EVERY:count]:
+            fields.update((name, after) for name, (_, after) in event.changes.items())
+        return fields
+
+    def lead_at(self, message: int) -> Lead:
+        return Lead.from_dict(self.fields_at(message))
@@ -0,0 +1,173 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import IO, Iterable, Iterator
+
+from call_prep_engine import LEAD_FIELDS, build_summary, infer_stage
+from call_prep_store import LeadChange, SQLiteSessionStore
+
+# Export of call plans and lead fields for the CRM: one row per lead, with
+# the `summary` call plan and every structured lead field, as CSV or JSONL.
+#   python call_prep_export.py -o leads.csv                         # everything
+#   python call_prep_export.py -o leads.csv --watermark crm.mark    # changed since the last run
+# Rows are rendered and written one lead at a time, so a day's sessions are
+# never held in memory together.
+#
+# Incremental exports go by the session store's change counter: every commit
+# and every archived chat takes the next number. The watermark file keeps the
+# last number exported and is only advanced once the whole export has been
+# written, so a failed run is simply repeated. A lead written twice between
+# runs is exported once, in its latest state.
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_COLUMNS = ("source", "id", "conversation_id", "title", "change", "updated_at", *LEAD_FIELDS, "stage", "summary")
+
+MIME_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# -----------------------------------------------------------------------------
+# Rows
+# -----------------------------------------------------------------------------
+def export_row(item: LeadChange) -> dict:
+    lead = item.lead
+    summary = build_summary(lead)  # prices the lead first, so fields come after
+    row = {
+        "source": item.source,
+        "id": item.key,
+        "conversation_id": item.conversation_id,  # a reopened chat's session joins its archive row
+        "title": item.title,
+        "change": item.change,
+        "updated_at": datetime.fromtimestamp(item.updated_at, timezone.utc).isoformat(timespec="seconds"),
+    }
+    row.update(lead.to_dict())
+    row["stage"] = infer_stage(lead)
+    row["summary"] = summary
+    return row
+
+def export_rows(
+    store, since: int = 0, upto: int | None = None, workspace: str | None = None, archived: bool = True
+) -> Iterator[dict]:
+    # Every lead, or one workspace's open leads and (with `archived`) its
+    # closed chats.
+    prefix = "" if workspace is None else f"{workspace}/"
+    for item in store.changes(since, upto, prefix=prefix, archived=archived, workspace=workspace):
+        yield export_row(item)
+
+# -----------------------------------------------------------------------------
+# Writers
+# -----------------------------------------------------------------------------
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+def iter_csv(rows: Iterable[dict]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([_csv_value(row[name]) for name in EXPORT_COLUMNS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    # The header alone when there were no rows.
+    if buf.tell():
+        yield buf.getvalue()
+
+def iter_jsonl(rows: Iterable[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+def iter_export(rows: Iterable[dict], fmt: str) -> Iterator[str]:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    return iter_csv(rows) if fmt == "csv" else iter_jsonl(rows)
+
+def write_export(rows: Iterable[dict], dst: IO[str], fmt: str) -> int:
+    # Returns the number of rows written.
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    for chunk in iter_export(counted(), fmt):
+        dst.write(chunk)
+    return count
+
+def export_bytes(store, fmt: str, workspace: str | None = None, archived: bool = True) -> bytes:
+    # For a download button, which serves the file from memory anyway.
+    buf = io.BytesIO()
+    for chunk in iter_export(export_rows(store, workspace=workspace, archived=archived), fmt):
+        buf.write(chunk.encode("utf-8"))
+    return buf.getvalue()
+
+# -----------------------------------------------------------------------------
+# Watermark
+# -----------------------------------------------------------------------------
+def read_watermark(path: str) -> int:
+    # 0 (export everything) until the first export has been recorded.
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return int(json.load(fh)["change"])
+    except FileNotFoundError:
+        return 0
+    except (ValueError, KeyError, TypeError):  # JSONDecodeError is a ValueError
+        raise ValueError(f"{path}: not a watermark file (fix or remove it, or pass --since)") from None
+
+def write_watermark(path: str, change: int):
+    body = json.dumps({"change": change, "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds")})
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(body + "\n")
+    os.replace(tmp, path)
+
+# -----------------------------------------------------------------------------
+# Entry point
+# -----------------------------------------------------------------------------
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Export call plans and lead fields from the session store.")
+    parser.add_argument("--db", default=os.environ.get("CALL_PREP_DB") or "call_prep_sessions.db", help="session store (SQLite)")
+    parser.add_argument("-o", "--output", default="-", help="where to write the export ('-' for stdout)")
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS, help="default: from the output file name, else jsonl")
+    parser.add_argument("--watermark", help="file holding the last exported change; only later changes are exported, then it is advanced")
+    parser.add_argument("--since", type=int, help="export changes after this change number (overrides --watermark's value)")
+    parser.add_argument("--workspace", help="only this workspace's leads and closed chats")
+    parser.add_argument("--no-archived", action="store_true", help="skip archived chats")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    if not os.path.exists(args.db):
+        print(f"{args.db}: no such session store", file=sys.stderr)
+        return 1
+    try:
+        since = args.since if args.since is not None else read_watermark(args.watermark) if args.watermark else 0
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    store = SQLiteSessionStore(args.db)
+    upto = store.last_change()
+    rows = export_rows(store, since, upto, workspace=args.workspace, archived=not args.no_archived)
+
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        count = write_export(rows, dst, fmt)
+    finally:
+        if dst is not sys.stdout:
+            dst.close()
+    # Everything up to `upto` has been looked at, exported or not (a
+    # workspace export still advances past other workspaces' changes).
+    if args.watermark:
+        write_watermark(args.watermark, max(since, upto))
+    print(f"{count} leads exported, changes up to {upto}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
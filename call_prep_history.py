@@ -0,0 +1,100 @@
+import re
+from bisect import bisect_left
+from typing import Iterable, NamedTuple
+
+from call_prep_engine import AskedTopics, Lead
+from call_prep_keywords import tokenize
+
+# Archived conversations and the term index the sidebar searches.
+#
+# A conversation is indexed under every word the RM typed, the lead's name and
+# state, and its rates (normalised, so "7.80" finds 7.8). A query matches the
+# conversations that contain all of its words; the last word also matches as
+# a prefix while it is still being typed.
+
+class ConversationInfo(NamedTuple):
+    conversation_id: int
+    title: str
+    archived_at: float
+    name: str | None
+    state: str | None
+
+class StoredConversation(NamedTuple):
+    info: ConversationInfo
+    lead: Lead
+    asked: AskedTopics
+    messages: list[dict]
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+RATE_FIELDS = ("current_rate", "our_rate", "competitor_rate")
+
+def _number_term(token: str) -> str:
+    return f"{float(token):g}"
+
+def _words(text: str) -> list[str]:
+    return [token.decode("ascii") for token in tokenize(text)]
+
+def conversation_terms(lead: Lead, messages: Iterable[dict]) -> set[str]:
+    terms: set[str] = set()
+    for msg in messages:
+        if msg["role"] == "user" and msg["content"]:
+            terms.update(_words(msg["content"]))
+            terms.update(_number_term(n) for n in _NUMBER.findall(msg["content"]))
+    for text in (lead.name, lead.state):
+        if text:
+            terms.update(_words(text))
+    for field in RATE_FIELDS:
+        rate = getattr(lead, field)
+        if rate is not None:
+            terms.add(f"{rate:g}")
+    return terms
+
+def parse_query(query: str) -> tuple[list[str], str | None]:
+    # (words that must match exactly, prefix of the word being typed)
+    terms = []
+    for piece in query.split():
+        if _NUMBER.fullmatch(piece):
+            terms.append(_number_term(piece))
+        else:
+            terms.extend(_words(piece))
+    if not terms or query[-1:].isspace():
+        return terms, None
+    return terms[:-1], terms[-1]
+
+# -----------------------------------------------------------------------------
+# In-memory index (the SQLite store keeps the same postings in a table)
+# -----------------------------------------------------------------------------
+class TermIndex:
+    def __init__(self):
+        self._postings: dict[str, set[int]] = {}
+        self._terms: list[str] = []  # sorted, for prefix ranges
+
+    def add(self, doc_id: int, terms: Iterable[str]):
+        for term in terms:
+            docs = self._postings.get(term)
+            if docs is None:
+                docs = self._postings[term] = set()
+                self._terms.insert(bisect_left(self._terms, term), term)
+            docs.add(doc_id)
+
+    def remove(self, doc_id: int, terms: Iterable[str]):
+        for term in terms:
+            docs = self._postings.get(term)
+            if docs is not None:
+                docs.discard(doc_id)
+
+    def search(self, query: str) -> set[int] | None:
+        # None means "no query" (everything matches).
+        exact, prefix = parse_query(query)
+        if not exact and prefix is None:
+            return None
+        sets = [self._postings.get(term, set()) for term in exact]
+        if prefix is not None:
+            matched: set[int] = set()
+            i = bisect_left(self._terms, prefix)
+            while i < len(self._terms) and self._terms[i].startswith(prefix):
+                matched |= self._postings[self._terms[i]]
+                i += 1
+            sets.append(matched)
+        sets.sort(key=len)
+        return set.intersection(*sets) if len(sets) > 1 else set(sets[0])
@@ -0,0 +1,89 @@
+import csv
+import io
+import itertools
+import json
+from typing import BinaryIO, Iterable, Iterator
+
+from call_prep_engine import (
+    Lead,
+    apply_pricing,
+    parse_structured_short_input,
+    update_lead_from_free_text,
+)
+
+# Notes files (CRM exports, earlier call notes) applied to one lead, exactly
+# as if every note had been typed into the chat, minus the replies.
+#
+# The file is decoded as a stream and read one record at a time, so memory
+# use does not grow with its size. ingest_notes() yields after every chunk so
+# the caller can report progress.
+
+INGEST_TYPES = ("txt", "csv", "jsonl")
+CHUNK_NOTES = 500
+# Column (CSV) or key (JSONL) holding the note text, first match wins.
+NOTE_KEYS = ("note", "notes", "text", "body", "content", "comment", "comments", "description")
+
+def iter_file_notes(fp: BinaryIO, filename: str) -> Iterator[str]:
+    # .txt: one note per non-blank line. .csv: the note column, or the whole
+    # row when the first row names none. .jsonl: a string, or the note key of
+    # an object.
+    text = io.TextIOWrapper(fp, encoding="utf-8-sig", errors="replace", newline="")
+    kind = filename.rsplit(".", 1)[-1].lower()
+    try:
+        if kind == "csv":
+            yield from _csv_notes(text)
+        elif kind == "jsonl":
+            yield from _jsonl_notes(text)
+        else:
+            for line in text:
+                line = line.strip()
+                if line:
+                    yield line
+    finally:
+        text.detach()  # the caller owns fp
+
+def _csv_notes(text: io.TextIOWrapper) -> Iterator[str]:
+    # Row 1 is a header only when it names a note column; otherwise it is
+    # the first note (exports without a header row).
+    reader = csv.reader(text)
+    try:
+        first = next(reader, [])
+        header = [cell.strip().lower() for cell in first]
+        column = next((header.index(key) for key in NOTE_KEYS if key in header), None)
+        rows = reader if column is not None else itertools.chain([first], reader)
+        for row in rows:
+            if column is not None:
+                note = row[column].strip() if column < len(row) else ""
+            else:
+                note = ", ".join(cell.strip() for cell in row if cell.strip())
+            if note:
+                yield note
+    except csv.Error as exc:
+        raise ValueError(f"line {reader.line_num}: {exc}") from None
+
+def _jsonl_notes(text: io.TextIOWrapper) -> Iterator[str]:
+    for lineno, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"line {lineno}: invalid JSON ({exc.msg})") from None
+        if isinstance(rec, dict):
+            rec = next((rec[key] for key in NOTE_KEYS if isinstance(rec.get(key), str)), None)
+        if isinstance(rec, str) and rec.strip():
+            yield rec.strip()
+
+def ingest_notes(lead: Lead, notes: Iterable[str], chunk: int = CHUNK_NOTES) -> Iterator[int]:
+    # Applies each note in order; yields the running count after every
+    # `chunk` notes and once at the end.
+    count = 0
+    for note in notes:
+        update_lead_from_free_text(lead, note)
+        parse_structured_short_input(lead, note)
+        count += 1
+        if count % chunk == 0:
+            yield count
+    apply_pricing(lead)
+    yield count
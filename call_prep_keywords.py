@@ -0,0 +1,83 @@
+from collections import deque
+from typing import Iterable
+
+# Multi-phrase keyword matching in one pass over a note.
+#
+# Phrases are matched on whole words: the note is split into lowercase
+# ASCII alphanumeric tokens and run through an Aho–Corasick automaton whose edges
+# are tokens rather than characters. "son" therefore never matches inside
+# "reason", hyphenated and spaced spellings ("self-employed", "self employed")
+# are the same phrase, and the cost per note depends on its length, not on
+# how many phrases the vocabulary holds.
+
+# ASCII letters and digits are kept (lowercased); everything else separates
+# words. Other non-ASCII characters are escaped to a backslash sequence and
+# the backslash is kept, so "josé" stays one token no ASCII phrase can match.
+_WORD_BYTES = bytes(
+    c if chr(c).isalnum() or c == ord("\\") else ord(" ") for c in range(128)
+).lower() + b" " * 128
+_UNICODE_SEPARATORS = str.maketrans({c: " " for c in "\u00a0\u2010\u2011\u2012\u2013\u2014\u2018\u2019\u201c\u201d\u2026"})
+
+def tokenize(text: str) -> list[bytes]:
+    if not text.isascii():
+        text = text.translate(_UNICODE_SEPARATORS)
+    return text.encode("ascii", "backslashreplace").translate(_WORD_BYTES).split()
+
+class KeywordAutomaton:
+    def __init__(self, phrases: Iterable[str]):
+        self._goto: list[dict[bytes, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[int, ...]] = [()]  # phrase ids ending at this state
+        self.phrases: list[str] = []
+        for phrase in phrases:
+            self._add(phrase)
+        self._link()
+
+    def _add(self, phrase: str):
+        tokens = tokenize(phrase)
+        if not tokens:
+            raise ValueError(f"keyword phrase {phrase!r} has no words")
+        state = 0
+        for token in tokens:
+            nxt = self._goto[state].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += (len(self.phrases),)
+        self.phrases.append(phrase)
+
+    def _link(self):
+        # Breadth-first failure links; each state's outputs absorb those of
+        # its failure state, so a hit never needs a walk up the fail chain.
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())  # depth-1 states fail to the root
+        while queue:
+            state = queue.popleft()
+            for token, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and token not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(token, 0)
+                out[nxt] += out[fail[nxt]]
+
+    def matches(self, text: str) -> list[int]:
+        # Ids of every phrase found, in the order their last word appears.
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        hits: list[int] = []
+        state = 0
+        for token in tokenize(text):
+            if state:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+            else:
+                state = root.get(token, 0)
+            if out[state]:
+                hits.extend(out[state])
+        return hits
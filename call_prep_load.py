@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import NamedTuple
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from call_prep_corpus import FILLER_NOTES, lead_notes
+
+# Load test for the real app: starts `streamlit run sales_call_prep_chat.py`
+# and drives many RM sessions at once over Streamlit's websocket protocol,
+# exactly as browsers would (a chat turn is a fragment rerun carrying the chat
+# input's value). Each session replays a scripted conversation; every rerun is
+# timed from sending the note to the server's script-finished message.
+#   python call_prep_load.py --sessions 10,50,200 --turns 7,28
+# One step runs per (sessions, turns) pair and reports rerun latency
+# percentiles, reruns/s and the server's resident memory.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_call_prep_chat.py")
+SERVER_START_TIMEOUT = 60.0
+RSS_SAMPLE_SECONDS = 0.25
+
+_FINAL_STATUSES = {
+    ForwardMsg.ScriptFinishedStatus.FINISHED_SUCCESSFULLY,
+    ForwardMsg.ScriptFinishedStatus.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+    ForwardMsg.ScriptFinishedStatus.FINISHED_WITH_COMPILE_ERROR,
+}
+
+class StepResult(NamedTuple):
+    sessions: int
+    turns: int
+    reruns: int
+    errors: int
+    seconds: float
+    reruns_per_sec: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    rss_mb: float | None  # server, at the end of the step
+    peak_rss_mb: float | None  # server, highest sample during the step
+
+# -----------------------------------------------------------------------------
+# Conversations
+# -----------------------------------------------------------------------------
+def conversation(rng: random.Random, turns: int) -> list[str]:
+    # intro (name/state), rate/pay, bal/term, dep/surplus, offer/competitor,
+    # then `summary`; padded with filler notes to `turns` notes.
+    notes = [note for note in lead_notes(rng) if note not in FILLER_NOTES][:5]
+    while len(notes) < turns - 1:
+        notes.insert(rng.randint(1, len(notes)), rng.choice(FILLER_NOTES))
+    return notes[: max(turns - 1, 1)] + ["summary"]
+
+# -----------------------------------------------------------------------------
+# One simulated browser session
+# -----------------------------------------------------------------------------
+class Session:
+    def __init__(self, url: str, workspace_id: str):
+        self.url = url
+        self.query_string = f"session={workspace_id}"
+        self.chat_input_id: str | None = None
+        self.fragment_id = ""
+        self.errors = 0
+        self._ws = None
+
+    async def open(self) -> float:
+        self._ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+        return await self._rerun()
+
+    async def send_note(self, note: str) -> float:
+        widget = WidgetState(id=self.chat_input_id)
+        widget.chat_input_value.data = note
+        return await self._rerun([widget], self.fragment_id)
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def _rerun(self, widgets: list[WidgetState] = (), fragment_id: str = "") -> float:
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(widgets)
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+        started = time.perf_counter()
+        await self._ws.send(msg.SerializeToString())
+        # A note reruns only the chat fragment; the turn is done when that
+        # run finishes.
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self._ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "chat_input":
+                    self.chat_input_id = element.chat_input.id
+                    self.fragment_id = fwd.delta.fragment_id
+                elif element_type == "exception":
+                    self.errors += 1
+            elif kind == "script_finished" and fwd.script_finished in _FINAL_STATUSES:
+                return time.perf_counter() - started
+
+async def run_session(url: str, workspace_id: str, notes: list[str], think: float, start_delay: float) -> tuple[list[float], int]:
+    await asyncio.sleep(start_delay)
+    session = Session(url, workspace_id)
+    latencies = []
+    try:
+        latencies.append(await session.open())
+        for note in notes:
+            if think:
+                await asyncio.sleep(think)
+            latencies.append(await session.send_note(note))
+    except (OSError, websockets.WebSocketException):
+        session.errors += 1
+    finally:
+        await session.close()
+    return latencies, session.errors
+
+# -----------------------------------------------------------------------------
+# Server
+# -----------------------------------------------------------------------------
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", APP_PATH,
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+            "--logger.level", "error",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+async def wait_for_server(url: str):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            ws = await websockets.connect(url, subprotocols=["streamlit"])
+            await ws.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"app server did not come up within {SERVER_START_TIMEOUT:.0f}s")
+            await asyncio.sleep(0.2)
+
+def rss_mb(pid: int | None) -> float | None:
+    # Resident memory of the server process (Linux /proc only).
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+# -----------------------------------------------------------------------------
+# Steps
+# -----------------------------------------------------------------------------
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3 if ordered else 0.0
+
+async def run_step(url: str, pid: int | None, sessions: int, turns: int, think: float, ramp: float, seed: int, tag: str) -> StepResult:
+    rng = random.Random(seed)
+    peak = [rss_mb(pid)]
+
+    async def sample_rss():
+        while True:
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+            rss = rss_mb(pid)
+            if rss is not None and (peak[0] is None or rss > peak[0]):
+                peak[0] = rss
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_session(url, f"load-{tag}-{i}", conversation(rng, turns), think, ramp * i / sessions)
+        for i in range(sessions)
+    ))
+    seconds = time.perf_counter() - started
+    sampler.cancel()
+
+    latencies = sorted(t for session, _ in results for t in session)
+    errors = sum(e for _, e in results)
+    return StepResult(
+        sessions,
+        turns,
+        len(latencies),
+        errors,
+        round(seconds, 3),
+        round(len(latencies) / seconds, 1) if seconds else 0.0,
+        _percentile(latencies, 0.50),
+        _percentile(latencies, 0.95),
+        _percentile(latencies, 0.99),
+        latencies[-1] * 1e3 if latencies else 0.0,
+        rss_mb(pid),
+        peak[0],
+    )
+
+def _mb(value: float | None) -> str:
+    return "—" if value is None else f"{value:,.0f}"
+
+async def run_steps(args, url: str, pid: int | None) -> list[StepResult]:
+    await wait_for_server(url)
+    print(
+        f"{'sessions':>8} {'turns':>5} {'reruns':>7} {'errors':>6} {'reruns/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'RSS MB':>7} {'peak MB':>8}"
+    )
+    results = []
+    for turns in args.turns:
+        for sessions in args.sessions:
+            r = await run_step(url, pid, sessions, turns, args.think, args.ramp, args.seed, f"{sessions}x{turns}")
+            results.append(r)
+            print(
+                f"{r.sessions:>8} {r.turns:>5} {r.reruns:>7} {r.errors:>6} {r.reruns_per_sec:>9,.1f} "
+                f"{r.p50_ms:>8.1f} {r.p95_ms:>8.1f} {r.p99_ms:>8.1f} {r.max_ms:>8.1f} "
+                f"{_mb(r.rss_mb):>7} {_mb(r.peak_rss_mb):>8}",
+                flush=True,
+            )
+    return results
+
+# -----------------------------------------------------------------------------
+# Entry point
+# -----------------------------------------------------------------------------
+def _counts(text: str) -> list[int]:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive concurrent RM sessions against the running app.")
+    parser.add_argument("--sessions", type=_counts, default=[10, 50, 100], help="comma-separated session counts, one step each")
+    parser.add_argument("--turns", type=_counts, default=[7], help="comma-separated notes per session (conversation length)")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each RM waits between notes")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which sessions connect (0: all at once)")
+    parser.add_argument("--seed", type=int, default=0, help="conversation seed")
+    parser.add_argument("--url", help="websocket URL of an already running app (ws://host:port/_stcore/stream)")
+    parser.add_argument("--pid", type=int, help="server pid for RSS, with --url")
+    parser.add_argument("--db", help="session store for the started server (default: a fresh temporary SQLite file)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            url, pid = args.url, args.pid
+        else:
+            port = free_port()
+            env = dict(os.environ, CALL_PREP_DB=args.db or os.path.join(tmp, "sessions.db"))
+            server = start_server(port, env)
+            url, pid = f"ws://127.0.0.1:{port}/_stcore/stream", server.pid
+        try:
+            results = asyncio.run(run_steps(args, url, pid))
+        except RuntimeError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump([r._asdict() for r in results], fh, indent=1)
+            fh.write("\n")
+    return 1 if any(r.errors for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Iterable, Iterator, NamedTuple
+
+# Per-stage latency histograms for the hot path, cheap enough to leave on in
+# production.
+#
+# Every observation lands in one of a fixed set of log-spaced buckets (each
+# ~19% wider than the last, 1 µs to ~60 s), so recording is a bisection and
+# an increment and memory does not grow with traffic. Quantiles are read back
+# from the buckets, accurate to about ±10%. Each thread records into its own
+# histograms, so the hot path takes no lock; shards of finished threads are
+# folded together when a new thread starts and when a snapshot is taken. A
+# background thread can write a snapshot to a file every few seconds, as JSON
+# or Prometheus text.
+
+METRICS_ENABLED = os.environ.get("CALL_PREP_METRICS", "1") != "0"
+EXPORT_INTERVAL_SECONDS = 15.0
+QUANTILES = (0.5, 0.9, 0.99)
+
+_BUCKET_GROWTH = 2 ** 0.25
+_BOUNDS = [1e-6 * _BUCKET_GROWTH ** i for i in range(104)]  # upper bounds, seconds
+
+class StageStats(NamedTuple):
+    count: int
+    total: float  # seconds
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)  # the last bucket is overflow
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        # Geometric middle of the bucket holding the q-th observation,
+        # clamped to the largest value seen.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                if i == len(_BOUNDS):
+                    return self.max
+                mid = _BOUNDS[i] / _BUCKET_GROWTH ** 0.5
+                return min(mid, self.max)
+        return self.max
+
+    def stats(self) -> StageStats:
+        p50, p90, p99 = (self.quantile(q) for q in QUANTILES)
+        return StageStats(self.count, self.total, p50, p90, p99, self.max)
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+class Registry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._shards: list[tuple[threading.Thread, dict[str, Histogram]]] = []
+        self._retired: dict[str, Histogram] = {}  # folded shards of finished threads
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        stages = getattr(self._local, "stages", None)
+        if stages is None:
+            stages = self._new_shard()
+        hist = stages.get(stage)
+        if hist is None:
+            hist = stages[stage] = Histogram()
+        hist.observe(seconds)
+
+    def _new_shard(self) -> dict[str, Histogram]:
+        stages = self._local.stages = {}
+        with self._lock:
+            self._fold_finished()
+            self._shards.append((threading.current_thread(), stages))
+        return stages
+
+    def _fold_finished(self):
+        live = []
+        for thread, stages in self._shards:
+            if thread.is_alive():
+                live.append((thread, stages))
+                continue
+            for stage, hist in stages.items():
+                self._retired.setdefault(stage, Histogram()).merge(hist)
+        self._shards = live
+
+    def timed(self, stage: str) -> "_Timer":
+        return _Timer(self, stage)
+
+    def timed_iter(self, stage: str, blocks: Iterable[str]) -> Iterator[str]:
+        # Records the time spent producing the blocks, not the time the
+        # consumer spends on each one in between.
+        if not self.enabled:
+            yield from blocks
+            return
+        clock = time.perf_counter
+        spent = 0.0
+        it = iter(blocks)
+        while True:
+            started = clock()
+            block = next(it, None)
+            spent += clock() - started
+            if block is None:
+                break
+            yield block
+        self.observe(stage, spent)
+
+    def snapshot(self) -> dict[str, StageStats]:
+        # Live shards are read while their threads may still be writing; a
+        # snapshot can be off by the observations in flight.
+        with self._lock:
+            self._fold_finished()
+            merged: dict[str, Histogram] = {}
+            for stages in [self._retired] + [stages for _, stages in self._shards]:
+                for stage, hist in list(stages.items()):
+                    merged.setdefault(stage, Histogram()).merge(hist)
+        return {stage: hist.stats() for stage, hist in sorted(merged.items())}
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for _, stages in self._shards:
+                stages.clear()
+
+class _Timer:
+    __slots__ = ("registry", "stage", "started")
+
+    def __init__(self, registry: Registry, stage: str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+METRICS = Registry(METRICS_ENABLED)
+
+def timed(stage: str) -> _Timer:
+    return METRICS.timed(stage)
+
+# -----------------------------------------------------------------------------
+# Export
+# -----------------------------------------------------------------------------
+def to_json(snapshot: dict[str, StageStats]) -> str:
+    return json.dumps(
+        {"written_at": time.time(), "stages": {stage: s._asdict() for stage, s in snapshot.items()}},
+        indent=1,
+    )
+
+def to_prometheus(snapshot: dict[str, StageStats]) -> str:
+    name = "call_prep_stage_seconds"
+    lines = [f"# HELP {name} Time spent per call-prep stage.", f"# TYPE {name} summary"]
+    for stage, s in snapshot.items():
+        for q, value in zip(QUANTILES, (s.p50, s.p90, s.p99)):
+            lines.append(f'{name}{{stage="{stage}",quantile="{q:g}"}} {value:.9f}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {s.total:.9f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {s.count}')
+    return "\n".join(lines) + "\n"
+
+def write_snapshot(path: str, registry: Registry = METRICS):
+    # JSON for *.json, Prometheus text format otherwise (e.g. a node_exporter
+    # textfile-collector *.prom file). Replaced atomically.
+    snapshot = registry.snapshot()
+    body = to_json(snapshot) if path.endswith(".json") else to_prometheus(snapshot)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(body)
+    os.replace(tmp, path)
+
+def start_exporter(path: str, interval: float = EXPORT_INTERVAL_SECONDS, registry: Registry = METRICS) -> threading.Thread:
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(path, registry)
+            except OSError:
+                pass  # try again next interval
+
+    thread = threading.Thread(target=run, name="call-prep-metrics", daemon=True)
+    thread.start()
+    return thread
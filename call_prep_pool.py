@@ -0,0 +1,151 @@
+import multiprocessing as mp
+import queue
+import traceback
+import zlib
+from typing import Iterable, Iterator
+
+from call_prep_engine import AskedTopics, Lead, note_result, summary_result
+
+# Bulk call prep across a pool of worker processes.
+#
+# Every lead is pinned to one worker (crc32 of lead_id), so that worker holds
+# the lead's state and applies its notes in input order. Results come back
+# tagged with their input sequence number and are re-ordered here, with at most
+# `window` notes in flight, so output order and memory do not depend on how
+# fast individual workers are. Notes travel in batches to keep queue and
+# pickling overhead well below the cost of the work itself.
+
+DEFAULT_WINDOW = 2048
+DEFAULT_BATCH = 64
+POLL_SECONDS = 1.0  # how often a waiting driver checks that its workers are still alive
+
+class WorkerError(RuntimeError):
+    pass
+
+# -----------------------------------------------------------------------------
+# Worker side
+# -----------------------------------------------------------------------------
+def _worker(index: int, inbox, outbox, summaries: bool):
+    sessions: dict[str, tuple[Lead, AskedTopics]] = {}
+    try:
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                break
+            results = []
+            for seq, lead_id, note in batch:
+                if lead_id not in sessions:
+                    sessions[lead_id] = (Lead(), AskedTopics())
+                lead, asked = sessions[lead_id]
+                results.append((seq, note_result(lead_id, lead, asked, note)))
+            outbox.put(("replies", index, results))
+        if summaries:
+            plans = [(lead_id, summary_result(lead_id, lead)) for lead_id, (lead, _) in sessions.items()]
+            outbox.put(("summaries", index, plans))
+    except Exception:
+        outbox.put(("error", index, traceback.format_exc()))
+    outbox.put(("done", index, None))
+
+def shard_for(lead_id: str, workers: int) -> int:
+    return zlib.crc32(lead_id.encode("utf-8")) % workers
+
+# -----------------------------------------------------------------------------
+# Driver side
+# -----------------------------------------------------------------------------
+def run_parallel(
+    records: Iterable[dict],
+    workers: int,
+    window: int = DEFAULT_WINDOW,
+    summaries: bool = True,
+    batch: int = DEFAULT_BATCH,
+) -> Iterator[dict]:
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    if window < 1:
+        raise ValueError("window must be >= 1")
+    batch = max(1, min(batch, window // workers or 1))
+
+    ctx = mp.get_context()
+    outbox = ctx.Queue()
+    inboxes = [ctx.Queue() for _ in range(workers)]
+    procs = [
+        ctx.Process(target=_worker, args=(i, inbox, outbox, summaries), daemon=True)
+        for i, inbox in enumerate(inboxes)
+    ]
+    for proc in procs:
+        proc.start()
+
+    buffers: list[list[tuple[int, str, str]]] = [[] for _ in range(workers)]
+    pending: dict[int, dict] = {}
+    lead_order: dict[str, int] = {}
+    summary_buf: list[tuple[int, dict]] = []
+    done: set[int] = set()
+    sent = 0
+    next_seq = 0
+
+    def receive():
+        # A worker that died without saying "done" (killed, out of memory)
+        # fails the run, but only once a second poll finds nothing more from
+        # it: its last messages may still be on their way.
+        lost: set[int] = set()
+        while True:
+            try:
+                kind, worker, payload = outbox.get(timeout=POLL_SECONDS)
+                break
+            except queue.Empty:
+                dead = {i for i, proc in enumerate(procs) if i not in done and not proc.is_alive()}
+                if dead & lost:
+                    i = min(dead & lost)
+                    raise WorkerError(f"call-prep worker {i} exited unexpectedly (exit code {procs[i].exitcode})")
+                lost = dead
+        if kind == "replies":
+            pending.update(payload)
+        elif kind == "summaries":
+            summary_buf.extend((lead_order[lead_id], plan) for lead_id, plan in payload)
+        elif kind == "error":
+            raise WorkerError(f"call-prep worker {worker} failed:\n{payload}")
+        else:
+            done.add(worker)
+
+    def flush():
+        for shard, buf in enumerate(buffers):
+            if buf:
+                inboxes[shard].put(buf)
+                buffers[shard] = []
+
+    try:
+        for rec in records:
+            lead_id = str(rec["lead_id"])
+            lead_order.setdefault(lead_id, len(lead_order))
+            shard = shard_for(lead_id, workers)
+            buffers[shard].append((sent, lead_id, rec["note"]))
+            sent += 1
+            if len(buffers[shard]) >= batch:
+                inboxes[shard].put(buffers[shard])
+                buffers[shard] = []
+            if sent - next_seq >= window:
+                flush()
+            while sent - next_seq >= window:
+                receive()
+                while next_seq in pending:
+                    yield pending.pop(next_seq)
+                    next_seq += 1
+
+        flush()
+        for inbox in inboxes:
+            inbox.put(None)
+        while len(done) < workers:
+            receive()
+            while next_seq in pending:
+                yield pending.pop(next_seq)
+                next_seq += 1
+
+        # Summaries come last, in the order leads first appeared in the input.
+        summary_buf.sort(key=lambda item: item[0])
+        for _, payload in summary_buf:
+            yield payload
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
@@ -0,0 +1,158 @@
+import csv
+import os
+import time
+from bisect import bisect_right
+from typing import NamedTuple
+
+# Rate-sheet lookup: suggested offer and pricing floor by state, segment,
+# balance band and remaining term.
+#
+# The sheet is a CSV with one row per cell:
+#   state,segment,min_balance,min_term_years,offer_rate,floor_rate
+# `*` in state or segment matches anything; a blank offer_rate means "no
+# suggested offer, floor only". It is compiled into one sorted balance-band
+# list per (state, segment) and one sorted term list per band, so a lookup is
+# a dict hit and two bisections. Each band's term list also carries the
+# quotes of the bands below it, for terms the band itself does not price.
+# The file is re-read when its mtime changes, checked at most every
+# RELOAD_CHECK_SECONDS.
+
+RELOAD_CHECK_SECONDS = 1.0
+SHEET_COLUMNS = ("state", "segment", "min_balance", "min_term_years", "offer_rate", "floor_rate")
+WILDCARD = "*"
+
+class Quote(NamedTuple):
+    offer: float | None  # suggested rate, percent
+    floor: float  # lowest rate the RM may quote, percent
+
+# (balance band starts, per band: (term starts, quotes)), all ascending
+_Group = tuple[list[float], list[tuple[list[float], list[Quote]]]]
+
+def _key(value: str | None) -> str:
+    return value.strip().lower() if value else WILDCARD
+
+def _rate(cell: str, lineno: int, column: str) -> float | None:
+    cell = cell.strip()
+    if not cell:
+        return None
+    try:
+        return float(cell.rstrip("%"))
+    except ValueError:
+        raise ValueError(f"line {lineno}: {column} {cell!r} is not a rate") from None
+
+def compile_sheet(lines) -> dict[tuple[str, str], _Group]:
+    cells: dict[tuple[str, str], dict[float, dict[float, Quote]]] = {}
+    header: list[str] | None = None
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        values = [cell.strip() for cell in next(csv.reader([line]))]
+        if header is None:
+            header = values
+            missing = set(SHEET_COLUMNS) - set(header)
+            if missing:
+                raise ValueError(f"line {lineno}: missing columns {', '.join(sorted(missing))}")
+            continue
+        row = dict(zip(header, values))
+        try:
+            min_balance = float(row["min_balance"] or 0)
+            min_term = float(row["min_term_years"] or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"line {lineno}: min_balance / min_term_years must be numbers") from None
+        floor = _rate(row.get("floor_rate") or "", lineno, "floor_rate")
+        if floor is None:
+            raise ValueError(f"line {lineno}: floor_rate is required")
+        quote = Quote(_rate(row.get("offer_rate") or "", lineno, "offer_rate"), floor)
+        terms = cells.setdefault((_key(row.get("state")), _key(row.get("segment"))), {}).setdefault(min_balance, {})
+        if min_term in terms:
+            raise ValueError(f"line {lineno}: duplicate cell for this state, segment, balance and term")
+        terms[min_term] = quote
+
+    groups: dict[tuple[str, str], _Group] = {}
+    for key, bands in cells.items():
+        starts = sorted(bands)
+        compiled: list[tuple[list[float], list[Quote]]] = []
+        below: tuple[list[float], list[Quote]] = ([], [])
+        for b in starts:
+            # A term the band does not price (none of its terms is short
+            # enough) takes the quote the bands below would give.
+            own = sorted(bands[b])
+            terms = sorted(set(own) | set(below[0]))
+            quotes = []
+            for term in terms:
+                j = bisect_right(own, term) - 1
+                quotes.append(bands[b][own[j]] if j >= 0 else below[1][bisect_right(below[0], term) - 1])
+            below = (terms, quotes)
+            compiled.append(below)
+        groups[key] = (starts, compiled)
+    return groups
+
+def _find(group: _Group, balance: float, term: float) -> Quote | None:
+    # The highest balance band at or below `balance` that has a term at or
+    # below `term`, carried up at compile time: a band without a short enough
+    # term defers to the bands under it before the lookup falls back to a
+    # wider group.
+    starts, bands = group
+    i = bisect_right(starts, balance) - 1
+    if i < 0:
+        return None
+    terms, quotes = bands[i]
+    j = bisect_right(terms, term) - 1
+    return quotes[j] if j >= 0 else None
+
+class RateSheet:
+    def __init__(self, path: str, fallback: Quote):
+        self.path = path
+        self.fallback = fallback
+        self.version = 0  # bumped on every successful (re)load
+        self.error: str | None = None  # last reload failure; the previous sheet stays live
+        self._groups: dict[tuple[str, str], _Group] = {}
+        self._mtime: float | None = None
+        self._checked = float("-inf")
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_CHECK_SECONDS:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        try:
+            if mtime is None:
+                groups = {}
+            else:
+                with open(self.path, encoding="utf-8", newline="") as fp:
+                    groups = compile_sheet(fp)
+        except (OSError, ValueError) as exc:
+            self.error = f"{self.path}: {exc}"
+            self._mtime = mtime  # do not re-parse the same broken file every check
+            if force and self.version == 0:
+                raise ValueError(self.error) from None
+            return
+        self._groups, self._mtime, self.error = groups, mtime, None
+        self.version += 1
+
+    def lookup(
+        self,
+        state: str | None,
+        segment: str | None,
+        balance: float | None = None,
+        term_years: float | None = None,
+    ) -> Quote:
+        # Most specific match wins: (state, segment), (state, *), (*, segment), (*, *).
+        self.refresh()
+        state, segment = _key(state), _key(segment)
+        balance, term_years = balance or 0.0, term_years or 0.0
+        groups = self._groups
+        for key in ((state, segment), (state, WILDCARD), (WILDCARD, segment), (WILDCARD, WILDCARD)):
+            group = groups.get(key)
+            if group is not None:
+                quote = _find(group, balance, term_years)
+                if quote is not None:
+                    return quote
+        return self.fallback
@@ -0,0 +1,527 @@
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterator, NamedTuple
+
+from call_prep_engine import LEAD_FIELDS, AskedTopics, Lead
+from call_prep_history import (
+    ConversationInfo,
+    StoredConversation,
+    TermIndex,
+    conversation_terms,
+    parse_query,
+)
+
+# Persistent session state, so any app worker can pick up an RM's session and
+# a restart loses nothing.
+#
+# A session row holds the lead (one column per field), the asked topics (by
+# name: bit positions change with the question catalog), the archived
+# conversation it was reopened from (if any) and a version. Each
+# turn commits only what changed: the lead fields written since the last
+# commit and the messages appended since then. Commits are optimistic: they name the version they started from
+# and fail with StaleSessionError if another worker committed in between.
+#
+# Conversations the RM has left are archived with their final lead and indexed
+# for the sidebar search (see call_prep_history). Each belongs to the
+# workspace it was closed in, and is only listed, searched and reopened there.
+#
+# Every session commit, archived conversation and deleted session also takes
+# the next number from one store-wide change counter, so changes(since) lists
+# exactly the leads written (or closed) after a given point (see
+# call_prep_export and call_prep_analytics).
+#
+# SQLiteSessionStore is the shared backend (WAL mode, one connection per
+# thread). MemorySessionStore has the same interface for local runs and tests.
+
+class StaleSessionError(RuntimeError):
+    pass
+
+class StoredSession(NamedTuple):
+    version: int
+    lead: Lead
+    asked: AskedTopics
+    conversation_id: int | None  # archive entry this chat was reopened from
+    messages: list[dict]
+
+class LeadChange(NamedTuple):
+    change: int  # store-wide change number of the lead's last write
+    source: str  # "session" (open lead) or "conversation" (archived chat)
+    key: str  # session id or conversation id
+    updated_at: float
+    title: str | None  # archived chats only
+    conversation_id: int | None  # sessions: archive entry the chat was reopened from
+    lead: Lead | None  # None: the session was deleted (its lead closed)
+
+def _session_from(version: int, fields: dict, asked: list[str], conversation_id, messages: list[dict]) -> StoredSession:
+    return StoredSession(version, Lead.from_dict(fields), AskedTopics.from_topics(asked), conversation_id, messages)
+
+def _encode(messages: list[dict]) -> str:
+    return json.dumps(messages, ensure_ascii=False)
+
+# -----------------------------------------------------------------------------
+# In-memory stand-in
+# -----------------------------------------------------------------------------
+class MemorySessionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # session_id -> [version, lead fields, asked topics, conversation id, encoded messages, change, updated at]
+        self._rows: dict[str, list] = {}
+        # conversation id -> (info, lead fields, asked topics, encoded messages, terms, change, workspace)
+        self._archive: dict[int, tuple] = {}
+        self._index = TermIndex()
+        self._next_conversation = 1
+        self._change = 0
+        self._deleted: dict[str, tuple[int, float]] = {}  # session_id -> (change, deleted at)
+
+    def version(self, session_id: str) -> int:
+        row = self._rows.get(session_id)
+        return row[0] if row else 0
+
+    def session_ids(self, prefix: str) -> list[str]:
+        return sorted(sid for sid in self._rows if sid.startswith(prefix))
+
+    def load(self, session_id: str, with_messages: bool = True) -> StoredSession | None:
+        with self._lock:
+            row = self._rows.get(session_id)
+            if row is None:
+                return None
+            version, fields, asked, conversation_id, encoded = row[:5]
+            messages = [json.loads(m) for m in encoded] if with_messages else []
+            return _session_from(version, dict(fields), asked, conversation_id, messages)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            if self._rows.pop(session_id, None) is not None:
+                self._change += 1
+                self._deleted[session_id] = (self._change, time.time())
+
+    def commit(
+        self,
+        session_id: str,
+        expected_version: int,
+        lead_fields: dict,
+        asked_topics: list[str],
+        messages: list[dict],
+        conversation_id: int | None = None,
+    ) -> int:
+        with self._lock:
+            row = self._rows.get(session_id)
+            if (row[0] if row else 0) != expected_version:
+                raise StaleSessionError(session_id)
+            if row is None:
+                row = self._rows[session_id] = [0, {}, (), None, [], 0, 0.0]
+            self._change += 1
+            row[0] = expected_version + 1
+            row[1].update(lead_fields)
+            row[2] = tuple(asked_topics)
+            row[3] = conversation_id
+            row[4].extend(json.dumps(m, ensure_ascii=False) for m in messages)
+            row[5] = self._change
+            row[6] = time.time()
+            return row[0]
+
+    def archive_conversation(
+        self,
+        workspace: str,
+        conversation_id: int | None,
+        title: str,
+        lead: Lead,
+        asked_topics: list[str],
+        messages: list[dict],
+    ) -> int:
+        # Replaces the entry when the chat was reopened from the archive.
+        terms = conversation_terms(lead, messages)
+        with self._lock:
+            old = self._archive.get(conversation_id)
+            if old is not None and old[6] != workspace:
+                old = None
+            if old is not None:
+                self._index.remove(conversation_id, old[4])
+            else:
+                conversation_id = self._next_conversation
+                self._next_conversation += 1
+            info = ConversationInfo(conversation_id, title, time.time(), lead.name, lead.state)
+            self._change += 1
+            self._archive[conversation_id] = (
+                info, lead.to_dict(), tuple(asked_topics), _encode(messages), terms, self._change, workspace
+            )
+            self._index.add(conversation_id, terms)
+            return conversation_id
+
+    def conversations(self, workspace: str, query: str = "", offset: int = 0, limit: int = 10) -> list[ConversationInfo]:
+        # The workspace's chats, newest first; `query` narrows to those
+        # matching every word.
+        with self._lock:
+            ids = self._index.search(query)
+            infos = [
+                entry[0] for cid, entry in self._archive.items()
+                if entry[6] == workspace and (ids is None or cid in ids)
+            ]
+        infos.sort(key=lambda info: info.archived_at, reverse=True)
+        return infos[offset:offset + limit]
+
+    def load_conversation(self, workspace: str, conversation_id: int) -> StoredConversation | None:
+        entry = self._archive.get(conversation_id)
+        if entry is None or entry[6] != workspace:
+            return None
+        info, fields, asked, encoded = entry[:4]
+        return StoredConversation(info, Lead.from_dict(fields), AskedTopics.from_topics(asked), json.loads(encoded))
+
+    def last_change(self) -> int:
+        return self._change
+
+    def changes(
+        self,
+        since: int = 0,
+        upto: int | None = None,
+        prefix: str = "",
+        archived: bool = True,
+        deleted: bool = False,
+        workspace: str | None = None,
+    ) -> Iterator[LeadChange]:
+        # Leads last written after change `since` (and at or before `upto`),
+        # oldest change first; `prefix` narrows the open sessions to one
+        # workspace, `archived` adds archived chats (only `workspace`'s, if
+        # given) and `deleted` the sessions deleted since (with lead None).
+        upto = self._change if upto is None else upto
+        with self._lock:
+            found = [
+                LeadChange(row[5], "session", sid, row[6], None, row[3], Lead.from_dict(row[1]))
+                for sid, row in self._rows.items()
+                if since < row[5] <= upto and sid.startswith(prefix)
+            ]
+            if deleted:
+                found += [
+                    LeadChange(change, "session", sid, at, None, None, None)
+                    for sid, (change, at) in self._deleted.items()
+                    if since < change <= upto and sid.startswith(prefix)
+                ]
+            if archived:
+                found += [
+                    LeadChange(entry[5], "conversation", str(cid), entry[0].archived_at, entry[0].title, cid, Lead.from_dict(entry[1]))
+                    for cid, entry in self._archive.items()
+                    if since < entry[5] <= upto and (workspace is None or entry[6] == workspace)
+                ]
+        found.sort()
+        yield from found
+
+# -----------------------------------------------------------------------------
+# SQLite (WAL)
+# -----------------------------------------------------------------------------
+class SQLiteSessionStore:
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        lead_columns = "".join(f", {name} TEXT" for name in LEAD_FIELDS)
+        conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                asked_topics TEXT NOT NULL DEFAULT '[]',
+                conversation_id INTEGER,
+                updated_at REAL NOT NULL,
+                change_seq INTEGER{lead_columns}
+            );
+            CREATE INDEX IF NOT EXISTS sessions_by_change ON sessions (change_seq);
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                archived_at REAL NOT NULL,
+                name TEXT,
+                state TEXT,
+                lead TEXT NOT NULL,
+                asked_topics TEXT NOT NULL,
+                messages TEXT NOT NULL,
+                change_seq INTEGER,
+                workspace TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS conversations_by_workspace ON conversations (workspace, archived_at);
+            CREATE INDEX IF NOT EXISTS conversations_by_change ON conversations (change_seq);
+            CREATE TABLE IF NOT EXISTS history_terms (
+                term TEXT NOT NULL,
+                conversation_id INTEGER NOT NULL,
+                PRIMARY KEY (term, conversation_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS history_terms_by_conversation ON history_terms (conversation_id);
+            CREATE TABLE IF NOT EXISTS deleted_sessions (
+                session_id TEXT PRIMARY KEY,
+                change_seq INTEGER NOT NULL,
+                deleted_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS deleted_sessions_by_change ON deleted_sessions (change_seq);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def _next_change(self, conn: sqlite3.Connection) -> int:
+        # Inside the caller's write transaction, so numbers are never reused.
+        return conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('change', 1)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + 1 RETURNING value"
+        ).fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self, session_id: str) -> int:
+        row = self._conn().execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def session_ids(self, prefix: str) -> list[str]:
+        rows = self._conn().execute(
+            "SELECT session_id FROM sessions WHERE session_id >= ? AND session_id < ? ORDER BY session_id",
+            (prefix, prefix + "\uffff"),
+        )
+        return [sid for (sid,) in rows]
+
+    def load(self, session_id: str, with_messages: bool = True) -> StoredSession | None:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                f"SELECT version, asked_topics, conversation_id, {', '.join(LEAD_FIELDS)} FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            bodies = []
+            if with_messages:
+                bodies = conn.execute(
+                    "SELECT body FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+                ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        fields = {name: json.loads(value) for name, value in zip(LEAD_FIELDS, row[3:]) if value is not None}
+        return _session_from(row[0], fields, json.loads(row[1]), row[2], [json.loads(b) for (b,) in bodies])
+
+    def commit(
+        self,
+        session_id: str,
+        expected_version: int,
+        lead_fields: dict,
+        asked_topics: list[str],
+        messages: list[dict],
+        conversation_id: int | None = None,
+    ) -> int:
+        conn = self._conn()
+        version = expected_version + 1
+        sets = {
+            "version": version,
+            "updated_at": time.time(),
+            "asked_topics": json.dumps(list(asked_topics)),
+            "conversation_id": conversation_id,
+        }
+        sets.update((name, json.dumps(value, ensure_ascii=False)) for name, value in lead_fields.items())
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            sets["change_seq"] = self._next_change(conn)
+            if expected_version == 0:
+                try:
+                    conn.execute(
+                        f"INSERT INTO sessions (session_id, {', '.join(sets)}) VALUES (?{', ?' * len(sets)})",
+                        (session_id, *sets.values()),
+                    )
+                except sqlite3.IntegrityError:
+                    raise StaleSessionError(session_id) from None
+            else:
+                cur = conn.execute(
+                    f"UPDATE sessions SET {', '.join(f'{name} = ?' for name in sets)} WHERE session_id = ? AND version = ?",
+                    (*sets.values(), session_id, expected_version),
+                )
+                if cur.rowcount != 1:
+                    raise StaleSessionError(session_id)
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO messages (session_id, seq, body) VALUES (?, ?, ?)",
+                ((session_id, seq + i, json.dumps(m, ensure_ascii=False)) for i, m in enumerate(messages)),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return version
+
+    def delete(self, session_id: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            if conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount:
+                conn.execute(
+                    "INSERT OR REPLACE INTO deleted_sessions (session_id, change_seq, deleted_at) VALUES (?, ?, ?)",
+                    (session_id, self._next_change(conn), time.time()),
+                )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def archive_conversation(
+        self,
+        workspace: str,
+        conversation_id: int | None,
+        title: str,
+        lead: Lead,
+        asked_topics: list[str],
+        messages: list[dict],
+    ) -> int:
+        # Replaces the entry when the chat was reopened from the archive.
+        conn = self._conn()
+        row = (title, time.time(), lead.name, lead.state, json.dumps(lead.to_dict()), json.dumps(list(asked_topics)), _encode(messages))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row += (self._next_change(conn),)
+            cur = conn.execute(
+                "UPDATE conversations SET title = ?, archived_at = ?, name = ?, state = ?, lead = ?, asked_topics = ?,"
+                " messages = ?, change_seq = ? WHERE conversation_id = ? AND workspace = ?",
+                (*row, conversation_id, workspace),
+            )
+            if cur.rowcount:
+                conn.execute("DELETE FROM history_terms WHERE conversation_id = ?", (conversation_id,))
+            else:
+                conversation_id = conn.execute(
+                    "INSERT INTO conversations (title, archived_at, name, state, lead, asked_topics, messages, change_seq,"
+                    " workspace) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*row, workspace),
+                ).lastrowid
+            conn.executemany(
+                "INSERT INTO history_terms (term, conversation_id) VALUES (?, ?)",
+                ((term, conversation_id) for term in conversation_terms(lead, messages)),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return conversation_id
+
+    def conversations(self, workspace: str, query: str = "", offset: int = 0, limit: int = 10) -> list[ConversationInfo]:
+        # The workspace's chats, newest first; `query` narrows to those
+        # matching every word.
+        exact, prefix = parse_query(query)
+        postings = ["SELECT conversation_id FROM history_terms WHERE term = ?"] * len(exact)
+        params: list = list(exact)
+        if prefix is not None:
+            postings.append("SELECT conversation_id FROM history_terms WHERE term >= ? AND term < ?")
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        where = f"AND conversation_id IN ({' INTERSECT '.join(postings)})" if postings else ""
+        rows = self._conn().execute(
+            f"SELECT conversation_id, title, archived_at, name, state FROM conversations WHERE workspace = ? {where}"
+            " ORDER BY archived_at DESC LIMIT ? OFFSET ?",
+            (workspace, *params, limit, offset),
+        )
+        return [ConversationInfo(*row) for row in rows]
+
+    def load_conversation(self, workspace: str, conversation_id: int) -> StoredConversation | None:
+        row = self._conn().execute(
+            "SELECT conversation_id, title, archived_at, name, state, lead, asked_topics, messages"
+            " FROM conversations WHERE conversation_id = ? AND workspace = ?",
+            (conversation_id, workspace),
+        ).fetchone()
+        if row is None:
+            return None
+        lead = Lead.from_dict(json.loads(row[5]))
+        return StoredConversation(ConversationInfo(*row[:5]), lead, AskedTopics.from_topics(json.loads(row[6])), json.loads(row[7]))
+
+    def last_change(self) -> int:
+        row = self._conn().execute("SELECT value FROM counters WHERE name = 'change'").fetchone()
+        return row[0] if row else 0
+
+    def changes(
+        self,
+        since: int = 0,
+        upto: int | None = None,
+        prefix: str = "",
+        archived: bool = True,
+        deleted: bool = False,
+        workspace: str | None = None,
+        page: int = 500,
+    ) -> Iterator[LeadChange]:
+        # Leads last written after change `since` (and at or before `upto`,
+        # by default the change current when the call starts), oldest change
+        # first; `prefix` narrows the open sessions to one workspace,
+        # `archived` adds archived chats (only `workspace`'s, if given) and
+        # `deleted` the sessions deleted since (with lead None). Rows are read
+        # `page` at a time by change number, so no read transaction stays open
+        # across a long export: a lead written meanwhile gets a change after
+        # `upto` and is left for the next call.
+        upto = self.last_change() if upto is None else upto
+        streams = [self._session_changes(since, upto, prefix, page)]
+        if archived:
+            streams.append(self._conversation_changes(since, upto, workspace, page))
+        if deleted:
+            streams.append(self._deleted_sessions(since, upto, prefix, page))
+        yield from heapq.merge(*streams)
+
+    def _session_changes(self, since: int, upto: int, prefix: str, page: int) -> Iterator[LeadChange]:
+        query = (
+            f"SELECT change_seq, session_id, updated_at, conversation_id, {', '.join(LEAD_FIELDS)} FROM sessions"
+            " WHERE change_seq > ? AND change_seq <= ? AND session_id >= ? AND session_id < ?"
+            " ORDER BY change_seq LIMIT ?"
+        )
+        while True:
+            rows = self._conn().execute(query, (since, upto, prefix, prefix + "\uffff", page)).fetchall()
+            for row in rows:
+                fields = {name: json.loads(value) for name, value in zip(LEAD_FIELDS, row[4:]) if value is not None}
+                yield LeadChange(row[0], "session", row[1], row[2], None, row[3], Lead.from_dict(fields))
+            if len(rows) < page:
+                return
+            since = rows[-1][0]
+
+    def _conversation_changes(self, since: int, upto: int, workspace: str | None, page: int) -> Iterator[LeadChange]:
+        scope = "" if workspace is None else " AND workspace = ?"
+        query = (
+            "SELECT change_seq, conversation_id, archived_at, title, lead FROM conversations"
+            f" WHERE change_seq > ? AND change_seq <= ?{scope} ORDER BY change_seq LIMIT ?"
+        )
+        while True:
+            params = (since, upto) if workspace is None else (since, upto, workspace)
+            rows = self._conn().execute(query, (*params, page)).fetchall()
+            for change, cid, archived_at, title, lead in rows:
+                yield LeadChange(change, "conversation", str(cid), archived_at, title, cid, Lead.from_dict(json.loads(lead)))
+            if len(rows) < page:
+                return
+            since = rows[-1][0]
+
+    def _deleted_sessions(self, since: int, upto: int, prefix: str, page: int) -> Iterator[LeadChange]:
+        query = (
+            "SELECT change_seq, session_id, deleted_at FROM deleted_sessions"
+            " WHERE change_seq > ? AND change_seq <= ? AND session_id >= ? AND session_id < ?"
+            " ORDER BY change_seq LIMIT ?"
+        )
+        while True:
+            rows = self._conn().execute(query, (since, upto, prefix, prefix + "\uffff", page)).fetchall()
+            for change, sid, deleted_at in rows:
+                yield LeadChange(change, "session", sid, deleted_at, None, None, None)
+            if len(rows) < page:
+                return
+            since = rows[-1][0]
+
+def open_store(path: str) -> MemorySessionStore | SQLiteSessionStore:
+    # ":memory:" keeps sessions in this process only.
+    if path == ":memory:":
+        return MemorySessionStore()
+    return SQLiteSessionStore(path)
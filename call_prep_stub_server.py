@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+from typing import AsyncIterator
+
+from call_prep_engine import Lead, render_guidance, render_summary
+
+# Local stand-in for a reply backend, for testing the app against a slow or
+# unreliable generator:
+#   python call_prep_stub_server.py --port 8765 --delay 0.3 --stall 0.1 --fail 0.05
+#   CALL_PREP_BACKEND_URL=ws://127.0.0.1:8765 streamlit run sales_call_prep_chat.py
+# It answers with the rule-based reply for the lead it is sent (so a stub
+# reply reads like the local one), one block at a time after `delay` seconds
+# (± `jitter`). `stall` is the share of requests that hang before their first
+# block, `fail` the share that fail with an error instead.
+
+STALL_SECONDS = 3600.0
+
+class StubBackend:
+    # The stub's replies, also usable in-process (CALL_PREP_BACKEND_URL=stub).
+    name = "stub"
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, stall: float = 0.0, fail: float = 0.0, seed: int | None = None):
+        self.delay = delay
+        self.jitter = jitter
+        self.stall = stall
+        self.fail = fail
+        self._rng = random.Random(seed)
+
+    async def generate(self, request) -> AsyncIterator[str]:
+        payload = request if isinstance(request, dict) else request.payload()
+        roll = self._rng.random()
+        if roll < self.stall:
+            await asyncio.sleep(STALL_SECONDS)
+        elif roll < self.stall + self.fail:
+            raise RuntimeError("stub failure")
+        lead = Lead.from_dict(payload["lead"])
+        if payload["kind"] == "summary":
+            blocks = render_summary(lead)
+        else:
+            blocks = render_guidance(lead, [tuple(q) for q in payload["questions"]])
+        for block in blocks:
+            if self.delay or self.jitter:
+                await asyncio.sleep(max(0.0, self.delay + self._rng.uniform(-self.jitter, self.jitter)))
+            yield block
+
+async def handle(ws, backend: StubBackend):
+    async for message in ws:
+        try:
+            async for block in backend.generate(json.loads(message)):
+                await ws.send(json.dumps({"block": block}, ensure_ascii=False))
+        except Exception as exc:
+            await ws.send(json.dumps({"error": str(exc)}))
+        else:
+            await ws.send(json.dumps({"done": True}))
+
+async def run(host: str, port: int, backend: StubBackend):
+    # Imported here: the in-process stub (CALL_PREP_BACKEND_URL=stub) needs
+    # only StubBackend.
+    from websockets.asyncio.server import serve
+
+    async with serve(lambda ws: handle(ws, backend), host, port, max_size=None) as server:
+        print(f"stub reply backend on ws://{host}:{port}", file=sys.stderr, flush=True)
+        await server.serve_forever()
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve stub call-prep replies over websockets.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each reply block")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random ± seconds on each delay")
+    parser.add_argument("--stall", type=float, default=0.0, help="share of requests that never answer")
+    parser.add_argument("--fail", type=float, default=0.0, help="share of requests that fail with an error")
+    parser.add_argument("--seed", type=int, help="seed for jitter, stalls and failures")
+    args = parser.parse_args(argv)
+    backend = StubBackend(args.delay, args.jitter, args.stall, args.fail, args.seed)
+    try:
+        asyncio.run(run(args.host, args.port, backend))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+import json
+import os
+import tempfile
+import uuid
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Iterator
+
+from call_prep_engine import QUESTION_TEXT, Lead, build_summary, render_guidance
+from call_prep_events import EventLog
+
+# Per-session chat transcript with a resident-memory budget.
+#
+# The newest `hot` messages are kept verbatim. Older assistant replies are
+# compacted to what produced them (the lead-field delta of that turn and the
+# topics it asked) and re-rendered from the lead state at that point (see
+# call_prep_events) if anyone scrolls back to them. When the resident size still exceeds the budget, the
+# oldest messages are spilled to a JSONL file and read back on demand.
+
+DEFAULT_BUDGET_BYTES = 256 * 1024
+HOT_MESSAGES = 40
+REBUILDABLE_KINDS = ("guidance", "summary")
+RENDER_CACHE_SIZE = 64
+SPILL_DIR = os.environ.get("CALL_PREP_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "call_prep_spill")
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _encoded(msg: dict) -> bytes:
+    return json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n"
+
+class Transcript:
+    def __init__(
+        self,
+        budget_bytes: int = DEFAULT_BUDGET_BYTES,
+        hot: int = HOT_MESSAGES,
+        spill_dir: str = SPILL_DIR,
+    ):
+        self.id = uuid.uuid4().hex
+        self.title: str | None = None
+        self.budget_bytes = budget_bytes
+        self.hot = hot
+        self._spill_path = os.path.join(spill_dir, f"{self.id}.jsonl")
+        self._offsets = array("q")  # byte offset of each spilled message
+        self._resident: list[dict] = []
+        self._sizes: list[int] = []
+        self._resident_bytes = 0
+        self._compacted = 0  # resident messages [0, _compacted) are already compacted
+        self._rendered: OrderedDict[int, tuple[str, str]] = OrderedDict()
+        self.events = EventLog()
+        # Sessions that simply expire never call discard(); drop their spill
+        # file when the transcript is garbage-collected.
+        weakref.finalize(self, _remove_quietly, self._spill_path)
+
+    # -------------------------------------------------------------------------
+    # Sequence protocol
+    # -------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._resident)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, idx: int) -> dict:
+        if idx < 0:
+            idx += len(self)
+        spilled = len(self._offsets)
+        if idx >= spilled:
+            return self._resident[idx - spilled]
+        with open(self._spill_path, "rb") as fp:
+            fp.seek(self._offsets[idx])
+            return json.loads(fp.readline())
+
+    def __iter__(self) -> Iterator[dict]:
+        return self._iter_from(0)
+
+    def _iter_from(self, start: int) -> Iterator[dict]:
+        spilled = len(self._offsets)
+        if start < spilled:
+            with open(self._spill_path, "rb") as fp:
+                fp.seek(self._offsets[start])
+                for _ in range(spilled - start):
+                    yield json.loads(fp.readline())
+            start = spilled
+        yield from self._resident[start - spilled:]
+
+    @property
+    def spilled(self) -> int:
+        return len(self._offsets)
+
+    # -------------------------------------------------------------------------
+    # Writing
+    # -------------------------------------------------------------------------
+    def append(
+        self,
+        role: str,
+        content: str,
+        kind: str | None = None,
+        delta: dict | None = None,
+        topics: list[str] | None = None,
+        target: int | None = None,
+        backend: str | None = None,
+    ):
+        # `kind` marks a message that changed the lead: an assistant reply the
+        # engine can rebuild ("guidance" or "summary"; only those are ever
+        # compacted), or an undo / redo of the event `target`. `backend` names
+        # the reply backend that wrote a reply; the engine cannot rebuild
+        # those, so they are never compacted.
+        msg: dict = {"role": role, "content": content}
+        if kind is not None:
+            msg["kind"] = kind
+            msg["delta"] = delta or {}
+            msg["topics"] = topics or []
+            if target is not None:
+                msg["target"] = target
+            if backend is not None:
+                msg["backend"] = backend
+            self.events.record(len(self), msg["delta"], kind, target)
+        if role == "user" and self.title is None:
+            self.title = content
+        self._resident.append(msg)
+        size = len(_encoded(msg))
+        self._sizes.append(size)
+        self._resident_bytes += size
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        cold = len(self._resident) - self.hot
+        while self._compacted < cold:
+            i = self._compacted
+            msg = self._resident[i]
+            if msg.get("kind") in REBUILDABLE_KINDS and "backend" not in msg and msg.get("content") is not None:
+                msg["content"] = None
+                size = len(_encoded(msg))
+                self._resident_bytes += size - self._sizes[i]
+                self._sizes[i] = size
+            self._compacted += 1
+
+        spill = 0
+        over = self._resident_bytes - self.budget_bytes
+        while over > 0 and spill < cold:
+            over -= self._sizes[spill]
+            spill += 1
+        if spill:
+            self._spill(spill)
+
+    def _spill(self, count: int):
+        os.makedirs(os.path.dirname(self._spill_path), exist_ok=True)
+        with open(self._spill_path, "ab") as fp:
+            for msg in self._resident[:count]:
+                self._offsets.append(fp.tell())
+                fp.write(_encoded(msg))
+        self._resident_bytes -= sum(self._sizes[:count])
+        del self._resident[:count]
+        del self._sizes[:count]
+        self._compacted -= count
+
+    def discard(self):
+        self._resident.clear()
+        self._sizes.clear()
+        self._rendered.clear()
+        self.events = EventLog()
+        self._resident_bytes = 0
+        self._compacted = 0
+        del self._offsets[:]
+        _remove_quietly(self._spill_path)
+
+    # -------------------------------------------------------------------------
+    # Reading back
+    # -------------------------------------------------------------------------
+    def lead_at(self, idx: int) -> Lead:
+        if idx < 0:
+            idx += len(self)
+        return self.events.lead_at(idx)
+
+    def render(self, idx: int) -> tuple[str, str]:
+        # (role, markdown) for message idx. Verbatim resident messages are
+        # served as is; spilled or compacted ones are loaded/rebuilt once and
+        # then served from a small LRU.
+        if idx < 0:
+            idx += len(self)
+        spilled = len(self._offsets)
+        if idx >= spilled and self._resident[idx - spilled]["content"] is not None:
+            msg = self._resident[idx - spilled]
+            return msg["role"], msg["content"]
+        cached = self._rendered.get(idx)
+        if cached is not None:
+            self._rendered.move_to_end(idx)
+            return cached
+        msg = self[idx]
+        text = msg["content"]
+        if text is None:
+            lead = self.lead_at(idx)
+            if msg["kind"] == "summary":
+                text = build_summary(lead)
+            else:
+                questions = [(topic, QUESTION_TEXT[topic]) for topic in msg["topics"]]
+                text = "".join(render_guidance(lead, questions))
+        self._rendered[idx] = (msg["role"], text)
+        if len(self._rendered) > RENDER_CACHE_SIZE:
+            self._rendered.popitem(last=False)
+        return msg["role"], text
+
+    def resident_bytes(self) -> int:
+        cached = sum(len(text) for _, text in self._rendered.values())
+        return self._resident_bytes + cached
@@ -0,0 +1,184 @@
+from bisect import bisect_left, insort
+from typing import NamedTuple
+
+from call_prep_engine import AskedTopics, Lead, infer_stage
+from call_prep_transcript import Transcript
+
+# Several leads open at once (an RM's call list), each with its own lead
+# state, asked topics and transcript, plus indexes for the sidebar filters.
+#
+# Index entries are refreshed only for leads whose version moved since they
+# were last indexed, and only the keys that actually changed are moved, so
+# filtering and name-prefix search stay set intersections and a bisection
+# however many leads are open.
+
+class LeadSession:
+    __slots__ = (
+        "key",
+        "lead",
+        "asked",
+        "messages",  # None until the lead is first opened (loaded lazily)
+        "conversation_id",  # archive entry this lead was reopened from
+        "store_version",
+        "saved_lead_version",
+        "saved_messages",
+        "indexed_version",
+    )
+
+    def __init__(
+        self,
+        key: str,
+        lead: Lead | None = None,
+        asked: AskedTopics | None = None,
+        messages: Transcript | None = None,
+        conversation_id: int | None = None,
+        store_version: int = 0,
+    ):
+        self.key = key
+        self.lead = lead if lead is not None else Lead()
+        self.asked = asked if asked is not None else AskedTopics()
+        self.messages = messages
+        self.conversation_id = conversation_id
+        self.store_version = store_version  # 0: not in the session store yet
+        # What the store already has; a lead that was never stored has nothing.
+        self.saved_lead_version = self.lead.version if store_version else 0
+        self.saved_messages = len(messages) if store_version and messages is not None else 0
+        self.indexed_version = -1
+
+class IndexKey(NamedTuple):
+    name: str  # lowercased; "" when not captured yet
+    state: str | None
+    stage: int
+    segment: str | None
+    pricing_concern: bool
+
+def index_key(lead: Lead) -> IndexKey:
+    return IndexKey((lead.name or "").lower(), lead.state, infer_stage(lead), lead.segment, bool(lead.pricing_concern))
+
+class Workspace:
+    def __init__(self):
+        self.leads: dict[str, LeadSession] = {}  # insertion order is list order
+        self.active: str | None = None
+        self._next_key = 1
+        self._indexed: dict[str, IndexKey] = {}
+        self._names: list[tuple[str, str]] = []  # sorted (name, key)
+        self._by_state: dict[str | None, set[str]] = {}
+        self._by_stage: dict[int, set[str]] = {}
+        self._by_segment: dict[str | None, set[str]] = {}
+        self._pricing: set[str] = set()
+        self._order: dict[str, int] = {}  # key -> add sequence, for a stable list order
+        self._added = 0
+
+    def __len__(self) -> int:
+        return len(self.leads)
+
+    def new_key(self) -> str:
+        key = str(self._next_key)
+        self._next_key += 1
+        return key
+
+    def add(self, entry: LeadSession):
+        self.leads[entry.key] = entry
+        self._order[entry.key] = self._added
+        self._added += 1
+        if entry.key.isdigit():
+            self._next_key = max(self._next_key, int(entry.key) + 1)
+        self.reindex(entry.key)
+
+    def replace(self, entry: LeadSession):
+        # Swaps in a reloaded copy of an open lead, keeping its place.
+        self.leads[entry.key] = entry
+        self.reindex(entry.key)
+
+    def remove(self, key: str) -> LeadSession:
+        entry = self.leads.pop(key)
+        self._unindex(key)
+        del self._order[key]
+        if self.active == key:
+            self.active = next(reversed(self.leads), None)
+        return entry
+
+    @property
+    def current(self) -> LeadSession | None:
+        return self.leads.get(self.active) if self.active is not None else None
+
+    # -------------------------------------------------------------------------
+    # Indexes
+    # -------------------------------------------------------------------------
+    def reindex(self, key: str):
+        entry = self.leads[key]
+        if entry.indexed_version == entry.lead.version:
+            return
+        entry.indexed_version = entry.lead.version
+        new = index_key(entry.lead)
+        old = self._indexed.get(key)
+        if old == new:
+            return
+        if old is not None:
+            self._unindex(key, keep=new)
+        if old is None or old.name != new.name:
+            insort(self._names, (new.name, key))
+        if old is None or old.state != new.state:
+            self._by_state.setdefault(new.state, set()).add(key)
+        if old is None or old.stage != new.stage:
+            self._by_stage.setdefault(new.stage, set()).add(key)
+        if old is None or old.segment != new.segment:
+            self._by_segment.setdefault(new.segment, set()).add(key)
+        if new.pricing_concern:
+            self._pricing.add(key)
+        self._indexed[key] = new
+
+    def _unindex(self, key: str, keep: IndexKey | None = None):
+        # Drops `key` from every index whose value differs from `keep`.
+        old = self._indexed.pop(key, None)
+        if old is None:
+            return
+        if keep is None or old.name != keep.name:
+            i = bisect_left(self._names, (old.name, key))
+            del self._names[i]
+        if keep is None or old.state != keep.state:
+            self._by_state[old.state].discard(key)
+        if keep is None or old.stage != keep.stage:
+            self._by_stage[old.stage].discard(key)
+        if keep is None or old.segment != keep.segment:
+            self._by_segment[old.segment].discard(key)
+        if keep is None or not keep.pricing_concern:
+            self._pricing.discard(key)
+
+    def states(self) -> list[str]:
+        return sorted(state for state, keys in self._by_state.items() if state and keys)
+
+    def segments(self) -> list[str]:
+        return sorted(segment for segment, keys in self._by_segment.items() if segment and keys)
+
+    def find(
+        self,
+        name_prefix: str = "",
+        state: str | None = None,
+        stage: int | None = None,
+        segment: str | None = None,
+        pricing_concern: bool = False,
+    ) -> list[str]:
+        # Keys of the matching leads, in the order they were opened.
+        sets: list[set[str]] = []
+        if state is not None:
+            sets.append(self._by_state.get(state, set()))
+        if stage is not None:
+            sets.append(self._by_stage.get(stage, set()))
+        if segment is not None:
+            sets.append(self._by_segment.get(segment, set()))
+        if pricing_concern:
+            sets.append(self._pricing)
+        prefix = name_prefix.strip().lower()
+        if prefix:
+            named = set()
+            i = bisect_left(self._names, (prefix, ""))
+            while i < len(self._names) and self._names[i][0].startswith(prefix):
+                named.add(self._names[i][1])
+                i += 1
+            sets.append(named)
+        if not sets:
+            return list(self.leads)
+        sets.sort(key=len)
+        keys = set.intersection(*sets) if len(sets) > 1 else sets[0]
+        return sorted(keys, key=self._order.__getitem__)
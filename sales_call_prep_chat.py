@@ -1,7 +1,34 @@
+import os
 import time
-import re
+import uuid
+
 import streamlit as st
 
+from call_prep_analytics import GROUPINGS, STAGES, PipelineAnalytics
+from call_prep_backend import (
+    BACKEND_URL,
+    ReplyGateway,
+    local_reply,
+    open_backend,
+    prepare_reply,
+)
+from call_prep_engine import (
+    LEAD_FIELDS,
+    RESPONSE_CACHE,
+    infer_stage,
+    invalidate_pricing,
+    is_summary_request,
+    iter_reply,
+    lead_delta,
+)
+from call_prep_events import REDO, UNDO
+from call_prep_export import EXPORT_FORMATS, MIME_TYPES, export_bytes
+from call_prep_ingest import INGEST_TYPES, ingest_notes, iter_file_notes
+from call_prep_metrics import EXPORT_INTERVAL_SECONDS, METRICS, start_exporter, timed
+from call_prep_store import StaleSessionError, open_store
+from call_prep_transcript import Transcript
+from call_prep_workspace import LeadSession, Workspace, index_key
+
 # -----------------------------------------------------------------------------
 # Page config
 # -----------------------------------------------------------------------------
@@ -12,187 +39,217 @@ st.set_page_config(
 
 LOGO_URL = "https://www.ylconsulting.com/wp-content/uploads/2024/11/logo.webp"
 
+TRANSCRIPT_WINDOW = 20  # most recent messages shown per rerun
+TRANSCRIPT_PAGE = 20  # extra messages revealed by "Load earlier"
+LEADS_PAGE = 25  # open leads listed per "Show more" in the sidebar
+HISTORY_PAGE = 10  # archived chats listed per "Show more" in the sidebar
+SESSION_DB = os.environ.get("CALL_PREP_DB") or "call_prep_sessions.db"  # ":memory:" for this process only
+METRICS_FILE = os.environ.get("CALL_PREP_METRICS_FILE")  # *.json, or Prometheus text otherwise
+METRICS_INTERVAL = float(os.environ.get("CALL_PREP_METRICS_INTERVAL") or EXPORT_INTERVAL_SECONDS)
+DEBUG = os.environ.get("CALL_PREP_DEBUG") == "1"  # or ?debug=1 in the URL
+
+page_started = time.perf_counter()
+
 # -----------------------------------------------------------------------------
 # Global styling
 # -----------------------------------------------------------------------------
-st.markdown(
-    """
-    <style>
-    body {
-        background-color: #f5f5f7;
-    }
-    .block-container {
-        padding-top: 2.2rem !important;  /* push content below Streamlit header */
-        padding-left: 0 !important;
-        padding-right: 0 !important;
-        max-width: 100% !important;
-    }
-
-    /* Custom top bar (centered, below Streamlit header) */
-    .top-shell {
-        width: 100%;
-        display: flex;
-        justify-content: center;
-        margin-bottom: 0.5rem;
-    }
-    .top-bar {
-        width: 72rem;
-        max-width: 96%;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        border-radius: 999px;
-        padding: 0.4rem 1.2rem;
-        background: rgba(255,255,255,0.96);
-        box-shadow: 0 0 0 1px rgba(15,23,42,0.04), 0 10px 28px rgba(15,23,42,0.12);
-        backdrop-filter: blur(8px);
-    }
-
-    .top-title {
-        font-size: 0.95rem;
-        font-weight: 600;
-        color: #111827;
-    }
-    .top-subtitle {
-        font-size: 0.86rem;
-        color: #6b7280;
-    }
-    .top-center {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        gap: 1.25rem;
-    }
-    .top-nav-pill {
-        border-radius: 999px;
-        padding: 0.4rem 0.9rem;
-        font-size: 0.9rem;
-        font-weight: 500;
-        color: #111827;
-        background: #eef2ff;
-        border: 1px solid #2563eb;
-    }
-
-    /* Left rail (sidebar) */
-    section[data-testid="stSidebar"] {
-        background: #f9fafb;
-        border-right: 1px solid #e5e7eb;
-    }
-    section[data-testid="stSidebar"] .block-container {
-        padding-top: 1.6rem !important;
-        padding-left: 1.2rem !important;
-        padding-right: 1.0rem !important;
-        max-width: 260px !important;
-    }
-
-    .yl-logo {
-        width: 84px;  /* ~3x compared to original small logo */
-        margin-bottom: 1.6rem;
-    }
-
-    .nav-section-label {
-        font-size: 0.82rem;
-        text-transform: uppercase;
-        letter-spacing: 0.12em;
-        color: #9ca3af;
-        margin-bottom: 0.45rem;
-    }
+# Static markup is built once per server process; only a full rerun (first
+# load, "New chat") re-emits it. Chat turns rerun the chat fragment alone.
+@st.cache_resource
+def page_css() -> str:
+    return (
+        """
+        <style>
+        body {
+            background-color: #f5f5f7;
+        }
+        .block-container {
+            padding-top: 2.2rem !important;  /* push content below Streamlit header */
+            padding-left: 0 !important;
+            padding-right: 0 !important;
+            max-width: 100% !important;
+        }
+
+        /* Custom top bar (centered, below Streamlit header) */
+        .top-shell {
+            width: 100%;
+            display: flex;
+            justify-content: center;
+            margin-bottom: 0.5rem;
+        }
+        .top-bar {
+            width: 72rem;
+            max-width: 96%;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            border-radius: 999px;
+            padding: 0.4rem 1.2rem;
+            background: rgba(255,255,255,0.96);
+            box-shadow: 0 0 0 1px rgba(15,23,42,0.04), 0 10px 28px rgba(15,23,42,0.12);
+            backdrop-filter: blur(8px);
+        }
+
+        .top-title {
+            font-size: 0.95rem;
+            font-weight: 600;
+            color: #111827;
+        }
+        .top-subtitle {
+            font-size: 0.86rem;
+            color: #6b7280;
+        }
+        .top-center {
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            gap: 1.25rem;
+        }
+        .top-nav-pill {
+            border-radius: 999px;
+            padding: 0.4rem 0.9rem;
+            font-size: 0.9rem;
+            font-weight: 500;
+            color: #111827;
+            background: #eef2ff;
+            border: 1px solid #2563eb;
+        }
+
+        /* Left rail (sidebar) */
+        section[data-testid="stSidebar"] {
+            background: #f9fafb;
+            border-right: 1px solid #e5e7eb;
+        }
+        section[data-testid="stSidebar"] .block-container {
+            padding-top: 1.6rem !important;
+            padding-left: 1.2rem !important;
+            padding-right: 1.0rem !important;
+            max-width: 260px !important;
+        }
+
+        .yl-logo {
+            width: 84px;  /* ~3x compared to original small logo */
+            margin-bottom: 1.6rem;
+        }
+
+        .nav-section-label {
+            font-size: 0.82rem;
+            text-transform: uppercase;
+            letter-spacing: 0.12em;
+            color: #9ca3af;
+            margin-bottom: 0.45rem;
+        }
+
+        .nav-item {
+            display: flex;
+            align-items: center;
+            gap: 0.55rem;
+            padding: 0.45rem 0.7rem;
+            border-radius: 999px;
+            cursor: pointer;
+            font-size: 0.9rem;
+            color: #111827;
+            margin-bottom: 0.25rem;
+        }
+        .nav-item:hover {
+            background: #e5f0ff;
+            color: #1d4ed8;
+        }
+        .nav-icon {
+            width: 26px;
+            height: 26px;
+            border-radius: 999px;
+            background: #e0edff;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-size: 1rem;
+            color: #2563eb;
+        }
+        .nav-footer {
+            margin-top: 1.8rem;
+            font-size: 0.8rem;
+            color: #9ca3af;
+        }
+
+        /* Main area */
+        .main-wrapper {
+            display: flex;
+            justify-content: center;
+        }
+        .main-card {
+            margin-top: 0.4rem;
+            background: #ffffff;
+            border-radius: 1.25rem;
+            padding: 1.75rem 2.0rem 1.3rem 2.0rem;
+            box-shadow: 0 12px 35px rgba(15,23,42,0.08);
+            width: 72rem;
+            max-width: 96%;
+        }
+
+        /* Chat input with static attach + mic icons inside box */
+        div[data-testid="stChatInput"] > div {
+            border-radius: 999px !important;
+            border: 1px solid #e5e7eb !important;
+            box-shadow: 0 6px 18px rgba(15,23,42,0.06);
+            background: #ffffff;
+            position: relative;
+            padding-right: 3.6rem !important;  /* leave room for the mic icon */
+        }
+        .input-icons-right {
+            position: absolute;
+            right: 0.9rem;
+            top: 50%;
+            transform: translateY(-50%);
+            display: flex;
+            align-items: center;
+            gap: 0.35rem;
+            color: #6b7280;
+            font-size: 0.95rem;
+            pointer-events: none;  /* purely visual */
+        }
+        .input-icon-circle {
+            width: 26px;
+            height: 26px;
+            border-radius: 999px;
+            border: 1px solid #e5e7eb;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            background: #f9fafb;
+        }
+
+        /* Typography for chat */
+        div[data-testid="stMarkdown"] p {
+            font-size: 0.95rem;
+            line-height: 1.55;
+        }
+        </style>
+        """
+    )
 
-    .nav-item {
-        display: flex;
-        align-items: center;
-        gap: 0.55rem;
-        padding: 0.45rem 0.7rem;
-        border-radius: 999px;
-        cursor: pointer;
-        font-size: 0.9rem;
-        color: #111827;
-        margin-bottom: 0.25rem;
-    }
-    .nav-item:hover {
-        background: #e5f0ff;
-        color: #1d4ed8;
-    }
-    .nav-icon {
-        width: 26px;
-        height: 26px;
-        border-radius: 999px;
-        background: #e0edff;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1rem;
-        color: #2563eb;
-    }
-    .nav-footer {
-        margin-top: 1.8rem;
-        font-size: 0.8rem;
-        color: #9ca3af;
-    }
+st.markdown(page_css(), unsafe_allow_html=True)
 
-    /* Main area */
-    .main-wrapper {
-        display: flex;
-        justify-content: center;
-    }
-    .main-card {
-        margin-top: 0.4rem;
-        background: #ffffff;
-        border-radius: 1.25rem;
-        padding: 1.75rem 2.0rem 1.3rem 2.0rem;
-        box-shadow: 0 12px 35px rgba(15,23,42,0.08);
-        width: 72rem;
-        max-width: 96%;
-    }
+@st.cache_resource
+def metrics_exporter():
+    return start_exporter(METRICS_FILE, METRICS_INTERVAL) if METRICS_FILE else None
 
-    /* Chat input with static attach + mic icons inside box */
-    div[data-testid="stChatInput"] > div {
-        border-radius: 999px !important;
-        border: 1px solid #e5e7eb !important;
-        box-shadow: 0 6px 18px rgba(15,23,42,0.06);
-        background: #ffffff;
-        position: relative;
-        padding-right: 5.3rem !important;  /* leave room for icons */
-    }
-    .input-icons-right {
-        position: absolute;
-        right: 0.9rem;
-        top: 50%;
-        transform: translateY(-50%);
-        display: flex;
-        align-items: center;
-        gap: 0.35rem;
-        color: #6b7280;
-        font-size: 0.95rem;
-        pointer-events: none;  /* purely visual */
-    }
-    .input-icon-circle {
-        width: 26px;
-        height: 26px;
-        border-radius: 999px;
-        border: 1px solid #e5e7eb;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        background: #f9fafb;
-    }
+metrics_exporter()
 
-    /* Typography for chat */
-    div[data-testid="stMarkdown"] p {
-        font-size: 0.95rem;
-        line-height: 1.55;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+@st.cache_resource
+def reply_gateway():
+    # CALL_PREP_BACKEND_URL moves reply generation to a backend (see
+    # call_prep_backend); one gateway, and so one concurrency cap, per process.
+    return ReplyGateway(open_backend(BACKEND_URL)) if BACKEND_URL else None
 
 # -----------------------------------------------------------------------------
 # Custom top bar (centered)
 # -----------------------------------------------------------------------------
-st.markdown('<div class="top-shell"><div class="top-bar">', unsafe_allow_html=True)
-st.markdown(
-    """
+@st.cache_resource
+def top_bar_html() -> tuple[str, str, str]:
+    return (
+        '<div class="top-shell"><div class="top-bar">',
+        """
     <div class="top-center">
         <div>
             <div class="top-title">US Mortgage Coach</div>
@@ -201,111 +258,326 @@ st.markdown(
         <div class="top-nav-pill">Guide</div>
     </div>
     """,
-    unsafe_allow_html=True,
-)
-st.markdown('</div></div>', unsafe_allow_html=True)
+        '</div></div>',
+    )
+
+for html in top_bar_html():
+    st.markdown(html, unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
 # Session state
 # -----------------------------------------------------------------------------
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "asked_topics" not in st.session_state:
-    st.session_state.asked_topics = set()
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "lead" not in st.session_state:
-    st.session_state.lead = {}
-
-def reset_lead():
-    st.session_state.lead = {
-        "name": None,
-        "state": None,
-        "segment": None,
-        "tenure_years": None,
-        "objective": None,
-        "current_rate": None,
-        "current_payment": None,
-        "remaining_term_years": None,
-        "remaining_balance": None,
-        "competitor_rate": None,
-        "our_rate": None,
-        "savings_balance": None,
-        "monthly_surplus": None,
-        "travel_spend": None,
-        "pricing_concern": False,
-        "big_goal": None,
-    }
+# The URL carries ?session=<id>, naming the RM's workspace: a call list of
+# leads, each stored as its own session "<id>/<key>" in the session store, so
+# any app worker (or this one after a restart) can resume it. The Workspace in
+# st.session_state is this connection's working copy. A lead's transcript is
+# only loaded once the lead is opened, and a lead is reloaded whenever another
+# worker has committed a newer version of it.
+@st.cache_resource
+def session_store():
+    return open_store(SESSION_DB)
+
+store = session_store()
+
+def session_key(key: str) -> str:
+    return f"{st.session_state.workspace_id}/{key}"
+
+def transcript_from(stored: list[dict]) -> Transcript:
+    messages = Transcript()
+    for msg in stored:
+        messages.append(
+            msg["role"],
+            msg["content"],
+            msg.get("kind"),
+            msg.get("delta"),
+            msg.get("topics"),
+            msg.get("target"),
+            msg.get("backend"),
+        )
+    return messages
+
+def load_lead(key: str, with_messages: bool = True) -> LeadSession | None:
+    saved = store.load(session_key(key), with_messages)
+    if saved is None:
+        return None
+    messages = transcript_from(saved.messages) if with_messages else None
+    return LeadSession(key, saved.lead, saved.asked, messages, saved.conversation_id, saved.version)
+
+def open_workspace(workspace_id: str):
+    ss = st.session_state
+    ss.workspace_id = workspace_id
+    ws = Workspace()
+    prefix = session_key("")
+    for sid in store.session_ids(prefix):
+        entry = load_lead(sid[len(prefix):], with_messages=False)
+        if entry is not None:
+            ws.add(entry)
+    ss.workspace = ws
+    if ws:
+        activate(next(reversed(ws.leads)))
+    else:
+        new_lead()
+
+def sync_lead(entry: LeadSession) -> LeadSession:
+    # Loads the transcript on first use and picks up commits from other workers.
+    if entry.messages is not None and store.version(session_key(entry.key)) == entry.store_version:
+        return entry
+    fresh = load_lead(entry.key) or LeadSession(entry.key, messages=Transcript())
+    if entry.messages is not None:
+        entry.messages.discard()
+    st.session_state.workspace.replace(fresh)
+    return fresh
+
+def persist_lead(entry: LeadSession):
+    # Commits what changed since the last commit: lead fields, asked topics
+    # and new messages.
+    lead, messages = entry.lead, entry.messages
+    fields = {name: getattr(lead, name) for name in lead.changed_since(entry.saved_lead_version)}
+    new_messages = [messages[i] for i in range(entry.saved_messages, len(messages))]
+    entry.store_version = store.commit(
+        session_key(entry.key),
+        entry.store_version,
+        fields,
+        list(entry.asked),
+        new_messages,
+        conversation_id=entry.conversation_id,
+    )
+    entry.saved_lead_version = lead.version
+    entry.saved_messages = len(messages)
 
-if not st.session_state.lead:
-    reset_lead()
+def current_lead() -> LeadSession:
+    ws = st.session_state.workspace
+    return sync_lead(ws.current)
 
 # -----------------------------------------------------------------------------
-# Sidebar (left rail)
+# Workspace and history actions (button callbacks)
 # -----------------------------------------------------------------------------
-with st.sidebar:
-    st.markdown(f'<img src="{LOGO_URL}" class="yl-logo"/>', unsafe_allow_html=True)
-
-    # New chat on one line
-    new_chat_clicked = st.button("＋ New chat", key="new_chat_sidebar")
+def activate(key: str):
+    st.session_state.workspace.active = key
+    st.session_state.transcript_window = TRANSCRIPT_WINDOW
+
+def pick_lead(key: str):
+    activate(key)
+    st.session_state.lead_picked = True
+
+def new_lead():
+    ws = st.session_state.workspace
+    entry = LeadSession(ws.new_key(), messages=Transcript())
+    ws.add(entry)
+    activate(entry.key)
+
+def close_lead():
+    # Files the open lead under History (replacing its entry if it was
+    # reopened from there) and drops it from the workspace.
+    ws = st.session_state.workspace
+    entry = current_lead()
+    if entry.messages.title is not None:
+        store.archive_conversation(
+            st.session_state.workspace_id,
+            entry.conversation_id,
+            entry.messages.title[:48],
+            entry.lead,
+            list(entry.asked),
+            list(entry.messages),
+        )
+    store.delete(session_key(entry.key))
+    entry.messages.discard()
+    ws.remove(entry.key)
+    if ws:
+        activate(ws.active)
+    else:
+        new_lead()
+
+def open_conversation(conversation_id: int):
+    ws = st.session_state.workspace
+    for key, entry in ws.leads.items():
+        if entry.conversation_id == conversation_id:
+            activate(key)
+            return
+    saved = store.load_conversation(st.session_state.workspace_id, conversation_id)
+    if saved is None:
+        return
+    entry = LeadSession(ws.new_key(), saved.lead, saved.asked, transcript_from(saved.messages), conversation_id)
+    ws.add(entry)
+    activate(entry.key)
+    try:
+        persist_lead(entry)
+    except StaleSessionError:
+        sync_lead(entry)
+
+def more_leads():
+    st.session_state.leads_limit += LEADS_PAGE
+
+def more_history():
+    st.session_state.history_limit += HISTORY_PAGE
+
+def reset_history_page():
+    st.session_state.history_limit = HISTORY_PAGE
+
+if "session" not in st.query_params:
+    st.query_params["session"] = uuid.uuid4().hex
+if st.session_state.get("workspace_id") != st.query_params["session"]:
+    open_workspace(st.query_params["session"])
+if "history_limit" not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE
+if "leads_limit" not in st.session_state:
+    st.session_state.leads_limit = LEADS_PAGE
 
-    # Bell icon under new chat
-    st.markdown(
-        """
+# -----------------------------------------------------------------------------
+# Sidebar (left rail)
+# -----------------------------------------------------------------------------
+@st.cache_resource
+def sidebar_chrome_html() -> dict[str, str]:
+    return {
+        "logo": f'<img src="{LOGO_URL}" class="yl-logo"/>',
+        "bell": """
         <div style="margin-top:0.6rem;margin-bottom:1.0rem;">
           <div class="nav-icon">🔔</div>
         </div>
         """,
-        unsafe_allow_html=True,
-    )
-
-    st.markdown('<div class="nav-section-label">History</div>', unsafe_allow_html=True)
-    if st.session_state.chat_history:
-        for idx, title in enumerate(st.session_state.chat_history[:10]):
-            st.markdown(
-                f"""
-                <div class="nav-item">
-                    <div class="nav-icon">💬</div>
-                    <span>{title}</span>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-    else:
-        st.caption("No previous chats yet.")
-
-    st.markdown('<div style="margin-top:1.2rem;" class="nav-section-label">Library</div>', unsafe_allow_html=True)
-    st.markdown(
-        """
+        "leads_label": '<div class="nav-section-label">Leads</div>',
+        "history_label": '<div style="margin-top:1.2rem;" class="nav-section-label">History</div>',
+        "links": """
+        <div style="margin-top:1.2rem;" class="nav-section-label">Library</div>
         <div class="nav-item">
             <div class="nav-icon">📘</div>
             <span>Library</span>
         </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    st.markdown('<div style="margin-top:1.2rem;" class="nav-section-label">More</div>', unsafe_allow_html=True)
-    st.markdown(
-        """
+        <div style="margin-top:1.2rem;" class="nav-section-label">More</div>
         <div class="nav-item">
             <div class="nav-icon">⋯</div>
             <span>More</span>
         </div>
+        <div class="nav-footer">US Mortgage Coach – Internal RM Tool</div>
         """,
-        unsafe_allow_html=True,
-    )
-
-    st.markdown('<div class="nav-footer">US Mortgage Coach – Internal RM Tool</div>', unsafe_allow_html=True)
+    }
 
-# New chat behaviour
-if new_chat_clicked:
-    if st.session_state.messages:
-        first_user = next((m["content"] for m in st.session_state.messages if m["role"] == "user"), "New chat")
-        st.session_state.chat_history.insert(0, first_user[:48])
-    st.session_state.messages = []
-    st.session_state.asked_topics = set()
-    reset_lead()
+def lead_label(entry: LeadSession) -> str:
+    lead = entry.lead
+    state = f" · {lead.state}" if lead.state else ""
+    return f"👤 {lead.name or f'Lead {entry.key}'}{state} · stage {infer_stage(lead)}"
+
+def performance_panel():
+    # Per-stage latency since the process started (all sessions).
+    with st.expander("Performance", expanded=True):
+        rows = [
+            f"| {stage} | {s.count:,} | {s.p50 * 1e3:.2f} | {s.p99 * 1e3:.2f} | {s.max * 1e3:.2f} |"
+            for stage, s in METRICS.snapshot().items()
+        ]
+        if rows:
+            st.markdown("| Stage | n | p50 ms | p99 ms | max ms |\n|---|--:|--:|--:|--:|\n" + "\n".join(rows))
+        else:
+            st.caption("No timings recorded yet.")
+        cache = RESPONSE_CACHE.stats()
+        lookups = cache.hits + cache.misses
+        if lookups:
+            st.caption(f"Reply cache: {cache.size:,} entries, {cache.hits / lookups:.0%} hits, {cache.evictions:,} evictions.")
+        gateway = reply_gateway()
+        if gateway is not None:
+            b = gateway.stats()
+            st.caption(
+                f"Reply backend: {b.requests:,} requests, {b.in_flight} in flight, {b.fallbacks:,} fallbacks, "
+                f"{b.cut_short:,} cut short ({b.timeouts:,} timeouts, {b.errors:,} errors)."
+            )
+        st.button("Refresh", key="perf_refresh", type="tertiary")
+
+def export_panel():
+    # This workspace's leads (optionally with its closed chats) as CSV or
+    # JSONL; the file is only built once the button is clicked.
+    with st.expander("Export leads"):
+        fmt = st.radio("Format", EXPORT_FORMATS, key="export_format", horizontal=True, format_func=str.upper)
+        archived = st.checkbox("Include closed chats", key="export_archived")
+        workspace = st.session_state.workspace_id
+        st.download_button(
+            "⬇ Download",
+            lambda: export_bytes(store, fmt, workspace=workspace, archived=archived),
+            file_name=f"call_prep_leads.{fmt}",
+            mime=MIME_TYPES[fmt],
+            key="export_download",
+            on_click="ignore",
+        )
+
+ANY = "Any"
+
+@st.fragment
+def leads_list():
+    # A fragment, so filtering and paging rerun only the list. The chat
+    # fragment updates the workspace index but not this list: a note that
+    # renames or moves the open lead shows here on the list's next run.
+    if st.session_state.pop("lead_picked", False):
+        st.rerun()  # the chat has to switch to the lead picked below
+    ws = st.session_state.workspace
+    with st.expander("Filter leads"):
+        name_prefix = st.text_input("Name starts with", key="lead_filter_name")
+        state = st.selectbox("State", [ANY, *ws.states()], key="lead_filter_state")
+        stage = st.selectbox("Stage", [ANY, 1, 2, 3, 4, 5], key="lead_filter_stage")
+        segment = st.selectbox("Segment", [ANY, *ws.segments()], key="lead_filter_segment")
+        fee_sensitive = st.checkbox("Fee‑sensitive only", key="lead_filter_fees")
+    keys = ws.find(
+        name_prefix,
+        state=None if state == ANY else state,
+        stage=None if stage == ANY else stage,
+        segment=None if segment == ANY else segment,
+        pricing_concern=fee_sensitive,
+    )
+    limit = st.session_state.leads_limit
+    for key in keys[:limit]:
+        st.button(
+            lead_label(ws.leads[key]),
+            key=f"lead_{key}",
+            type="secondary" if key == ws.active else "tertiary",
+            on_click=pick_lead,
+            args=(key,),
+        )
+    if len(keys) > limit:
+        st.button(f"Show more ({len(keys) - limit})", key="leads_more", type="tertiary", on_click=more_leads)
+    if not keys:
+        st.caption("No leads match these filters.")
+
+chrome = sidebar_chrome_html()
+with st.sidebar:
+    st.markdown(chrome["logo"], unsafe_allow_html=True)
+
+    # New lead on one line (a button outside the chat fragment, so a click
+    # reruns the whole page and refreshes the lists below)
+    st.button("＋ New lead", key="new_lead_sidebar", on_click=new_lead)
+
+    # Bell icon under new lead
+    st.markdown(chrome["bell"], unsafe_allow_html=True)
+
+    st.markdown(chrome["leads_label"], unsafe_allow_html=True)
+    leads_list()
+    st.button("✕ Close current lead", key="close_lead", type="tertiary", on_click=close_lead)
+    export_panel()
+
+    st.markdown(chrome["history_label"], unsafe_allow_html=True)
+    query = st.text_input(
+        "Search history",
+        key="history_query",
+        placeholder="Search name, state, rate…",
+        label_visibility="collapsed",
+        on_change=reset_history_page,
+    )
+    # One page more than shown, to know whether "Show more" has anything left.
+    limit = st.session_state.history_limit
+    found = store.conversations(st.session_state.workspace_id, query, 0, limit + 1)
+    for info in found[:limit]:
+        st.button(
+            f"💬 {info.title}",
+            key=f"conversation_{info.conversation_id}",
+            type="tertiary",
+            on_click=open_conversation,
+            args=(info.conversation_id,),
+        )
+    if len(found) > limit:
+        st.button("Show more", key="history_more", type="tertiary", on_click=more_history)
+    if not found:
+        st.caption("No matching chats." if query else "No previous chats yet.")
+
+    st.markdown(chrome["links"], unsafe_allow_html=True)
+
+    if DEBUG or st.query_params.get("debug") == "1":
+        performance_panel()
 
 # -----------------------------------------------------------------------------
 # Main card
@@ -313,420 +585,242 @@ if new_chat_clicked:
 st.markdown('<div class="main-wrapper"><div class="main-card">', unsafe_allow_html=True)
 
 st.markdown("### 💬 Sales Call Preparation – US Mortgage Coach")
-st.caption("One refinance lead at a time. Short RM notes in, clear next questions out.")
-
-RATE_FLOOR = 6.0  # percent
-
-def add_message(role, content):
-    st.session_state.messages.append({"role": role, "content": content})
-
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
-
-if not st.session_state.messages:
-    intro = (
-        "Good day. This assistant helps you prepare for a **US mortgage refinance** call.\n\n"
-        "Tell me who you are calling and that it is a refi, for example:\n"
-        "`Mary Smith in California, refi on primary home`.\n\n"
-        "As you learn facts, drop in short notes like `rate 7.8 pay 3100`, "
-        "`bal 410k term 19 yrs`, `dep 65k surplus 1800 travel 900`, "
-        "`offer 6.9 competitor 7.1 fee conscious`. Type **summary** any time for a call plan.\n\n"
-        ":red[Note: internal rate floor is **6.00%**. Do not position offers below this.]"
+st.caption("Your call list, one chat per lead. Short RM notes in, clear next questions out.")
+
+INTRO = (
+    "Good day. This assistant helps you prepare for a **US mortgage refinance** call.\n\n"
+    "Tell me who you are calling and that it is a refi, for example:\n"
+    "`Mary Smith in California, refi on primary home`.\n\n"
+    "As you learn facts, drop in short notes like `rate 7.8 pay 3100`, "
+    "`bal 410k term 19 yrs`, `dep 65k surplus 1800 travel 900`, "
+    "`offer 6.9 competitor 7.1 fee conscious`. Type **summary** any time for a call plan.\n\n"
+    ":red[Note: internal rate floor is **6.00%**. Do not position offers below this.]"
+)
+
+@st.cache_resource
+def pipeline_analytics():
+    return PipelineAnalytics(store)
+
+def _rate(value: float | None) -> str:
+    return "—" if value is None else f"{value:.2f}%"
+
+@st.fragment
+def pipeline_view():
+    # Every RM's leads in the session store, brought up to date with the
+    # store's latest changes on each view; changing the grouping reruns only
+    # this fragment.
+    if not st.toggle("📊 Pipeline analytics", key="show_pipeline"):
+        return
+    grouping = st.selectbox("Group by", list(GROUPINGS), key="pipeline_group")
+    open_only = st.checkbox("Open leads only", key="pipeline_open")
+    analytics = pipeline_analytics()
+    with timed("analytics"):
+        analytics.refresh()
+        groups = analytics.groups(GROUPINGS[grouping], open_only)
+    if not groups:
+        st.caption("No leads yet.")
+        return
+    by = GROUPINGS[grouping]
+    groups.sort(key=lambda g: g.leads, reverse=True)
+    rows = [
+        f"| {' · '.join((g.state if name == 'state' else g.segment) or '—' for name in by) or 'All leads'} | {g.leads:,} | "
+        + " | ".join(f"{count:,}" for count in g.stages)
+        + f" | {_rate(g.avg_rate_improvement)} | {g.below_floor:,} | {g.fee_sensitive:.0%} |"
+        for g in groups
+    ]
+    stages = " | ".join(f"Stage {stage}" for stage in STAGES)
+    st.markdown(
+        f"| {grouping} | Leads | {stages} | Avg rate improvement | Offers below floor | Fee‑sensitive |\n"
+        f"|---|--:|{'--:|' * len(STAGES)}--:|--:|--:|\n" + "\n".join(rows)
+    )
+    st.caption("Rate improvement: current rate minus the working offer, for offers at or above the lead's floor.")
+
+def load_earlier():
+    st.session_state.transcript_window += TRANSCRIPT_PAGE
+
+def render_transcript(messages: Transcript):
+    # Only the newest `transcript_window` messages of the open lead are
+    # emitted, so a rerun costs the same on turn 5 and on turn 500, and with
+    # one lead open or three hundred.
+    started = time.perf_counter()
+    start = max(0, len(messages) - st.session_state.transcript_window)
+    if start:
+        st.button(f"Load earlier ({start} more)", key="load_earlier", on_click=load_earlier)
+    for idx in range(start, len(messages)):
+        # Transcript.render caches payloads it had to load from disk or
+        # rebuild from a compacted reply.
+        role, text = messages.render(idx)
+        with st.chat_message(role):
+            st.markdown(text)
+    METRICS.observe("replay", time.perf_counter() - started)
+
+def stream_reply(entry: LeadSession, note: str, lead_before, asked_before):
+    lead, asked = entry.lead, entry.asked
+    gateway = reply_gateway()
+    backend = None
+    # Reply blocks stream in as they are built; there is no artificial delay.
+    with st.chat_message("assistant"), timed("emit"):
+        if gateway is None:
+            reply = st.write_stream(iter_reply(lead, asked, note))
+        else:
+            request = prepare_reply(lead, asked, note)
+            blocks = gateway.stream(request, lambda: local_reply(lead, request))
+            reply = st.write_stream(blocks)
+            if blocks.source == "backend":
+                backend = gateway.backend.name
+    entry.messages.append(
+        "assistant",
+        reply,
+        kind="summary" if is_summary_request(note) else "guidance",
+        delta=lead_delta(lead_before, lead),
+        topics=asked.since(asked_before),
+        backend=backend,
     )
-    add_message("assistant", intro)
-    with st.chat_message("assistant"):
-        st.markdown(intro)
+
+def answer_note(entry: LeadSession, note: str):
+    entry.messages.append("user", note)
+    with st.chat_message("user"):
+        st.markdown(note)
+    stream_reply(entry, note, entry.lead.copy(), entry.asked.copy())
+
+def import_notes(entry: LeadSession, upload):
+    # Streams an attached notes file into the lead, then replies once with
+    # the questions for wherever the lead has got to.
+    lead_before, asked_before = entry.lead.copy(), entry.asked.copy()
+    progress = st.progress(0.0, text=f"Reading {upload.name}…")
+    count, error = 0, None
+    try:
+        for count in ingest_notes(entry.lead, iter_file_notes(upload, upload.name)):
+            progress.progress(min(upload.tell() / max(upload.size, 1), 1.0), text=f"{upload.name}: {count:,} notes read")
+    except ValueError as exc:
+        error = f"{upload.name}: {exc}"
+    progress.empty()
+
+    shown = f"📎 `{upload.name}` – {count:,} notes imported"
+    entry.messages.append("user", shown)
+    with st.chat_message("user"):
+        st.markdown(shown)
+        if error:
+            st.error(error)
+    stream_reply(entry, "", lead_before, asked_before)
 
 # -----------------------------------------------------------------------------
-# Helper functions (with improved rate parsing)
+# Undo / redo and the lead as of an earlier message
 # -----------------------------------------------------------------------------
-def parse_us_number(token: str) -> float | None:
-    token = token.lower().replace(",", "").replace("%", "").strip()
-    m = re.match(r"(\d+(\.\d+)?)(k)?", token)
-    if not m:
-        return None
-    val = float(m.group(1))
-    if m.group(3):
-        val *= 1000.0
-    return val
-
-def extract_name(text: str) -> str | None:
-    m = re.search(
-        r"\b(call(?:ing)?|speaking to|talking to|meeting|meeting with|with)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)",
-        text,
+def _field_value(value) -> str:
+    if value is None:
+        return "not set"
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+def change_notice(entry: LeadSession, kind: str, seq: int, fields: dict) -> str:
+    event = entry.messages.events.events[seq]
+    note = entry.messages[event.message - 1] if event.message else None
+    what = f" `{note['content']}`" if note and note["role"] == "user" else " the last change"
+    changes = ", ".join(f"{name.replace('_', ' ')} → **{_field_value(value)}**" for name, value in fields.items())
+    return f"{'↩ Undid' if kind == UNDO else '↪ Redid'}{what}: {changes}."
+
+def undo_redo(kind: str):
+    entry = current_lead()
+    log = entry.messages.events
+    step = log.undo_delta() if kind == UNDO else log.redo_delta()
+    if step is None:
+        return
+    seq, fields = step
+    lead_before = entry.lead.copy()
+    entry.lead.update(fields)
+    invalidate_pricing(entry.lead)
+    entry.messages.append(
+        "assistant",
+        change_notice(entry, kind, seq, fields),
+        kind=kind,
+        delta=lead_delta(lead_before, entry.lead),
+        target=seq,
     )
-    return m.group(2) if m else None
-
-def detect_segment(text: str) -> str | None:
-    t = text.lower()
-    if any(w in t for w in ["self-employed", "business owner", "1099"]):
-        return "Self‑employed / business owner"
-    if any(w in t for w in ["high net worth", "private bank", "premier"]):
-        return "HNW / private banking"
-    if "affluent" in t or "professional" in t:
-        return "Affluent professional"
-    if "salary" in t or "w2" in t:
-        return "Salaried"
-    return None
-
-def update_lead_from_free_text(text: str):
-    lead = st.session_state.lead
-    name = extract_name(text)
-    if name:
-        lead["name"] = name
-
-    m_state = re.search(r"\b(in|from)\s+([A-Z][a-z]+)", text)
-    if m_state and not lead["state"]:
-        lead["state"] = m_state.group(2)
-
-    seg = detect_segment(text)
-    if seg and not lead["segment"]:
-        lead["segment"] = seg
-
-    low = text.lower()
-    if any(w in low for w in ["refinance", "refi", "mortgage"]):
-        if not lead["objective"]:
-            lead["objective"] = "refinance existing mortgage and improve cash flow"
-    if any(w in low for w in ["fees", "pricing", "closing costs", "points", "fee conscious", "fee sensitive"]):
-        lead["pricing_concern"] = True
-    if any(w in low for w in ["college", "education", "tuition", "daughter", "son"]):
-        lead["big_goal"] = "college / education funding"
-
-def parse_structured_short_input(text: str):
-    lead = st.session_state.lead
-    t = text.lower()
-
-    # tenure
-    m = re.search(r"tenure\s+([0-9.,k%]+)", t)
-    if m:
-        n = parse_us_number(m.group(1))
-        if n:
-            lead["tenure_years"] = n
-
-    # rate with label
-    m = re.search(r"(current loan rate|current rate|rate)\s+([0-9.,k%]+)", t)
-    if m:
-        r = parse_us_number(m.group(2))
-        if r:
-            lead["current_rate"] = r
-
-    # bare percentage or number, if rate still missing
-    if lead["current_rate"] is None:
-        m = re.search(r"([0-9][0-9.,]*)\s*%?", t)
-        if m:
-            r = parse_us_number(m.group(1))
-            if r:
-                lead["current_rate"] = r
-
-    # payment
-    m = re.search(r"(payment|pay)\s+([0-9.,k]+)", t)
-    if m:
-        p = parse_us_number(m.group(2))
-        if p:
-            lead["current_payment"] = p
-
-    # term
-    m = re.search(r"term\s+([0-9.,k]+)", t)
-    if m:
-        n = parse_us_number(m.group(1))
-        if n:
-            lead["remaining_term_years"] = n
-
-    # balance
-    m = re.search(r"(bal|balance)\s+([0-9.,k]+)", t)
-    if m:
-        b = parse_us_number(m.group(2))
-        if b:
-            lead["remaining_balance"] = b
-
-    # deposits
-    m = re.search(r"(dep|savings)\s+([0-9.,k]+)", t)
-    if m:
-        b = parse_us_number(m.group(2))
-        if b:
-            lead["savings_balance"] = b
-
-    # surplus
-    m = re.search(r"surplus\s+([0-9.,k]+)", t)
-    if m:
-        s = parse_us_number(m.group(1))
-        if s:
-            lead["monthly_surplus"] = s
-
-    # travel
-    m = re.search(r"travel\s+([0-9.,k]+)", t)
-    if m:
-        tv = parse_us_number(m.group(1))
-        if tv:
-            lead["travel_spend"] = tv
-
-    # our rate
-    m = re.search(r"(our rate|offer)\s+([0-9.,k%]+)", t)
-    if m:
-        r = parse_us_number(m.group(2))
-        if r:
-            lead["our_rate"] = r
-
-    # competitor
-    m = re.search(r"competitor.*?([0-9.,k%]+)", t)
-    if m:
-        r = parse_us_number(m.group(1))
-        if r:
-            lead["competitor_rate"] = r
-
-def infer_stage(lead) -> int:
-    if lead["current_rate"] is None or lead["current_payment"] is None or lead["remaining_balance"] is None:
-        return 1
-    if (lead["monthly_surplus"] is None or lead["savings_balance"] is None) and not lead["pricing_concern"]:
-        return 2
-    if lead["pricing_concern"] and (lead["our_rate"] is None or lead["competitor_rate"] is None):
-        return 3
-    if lead["big_goal"] is None:
-        return 4
-    return 5
-
-def build_guidance(text: str) -> str:
-    lead = st.session_state.lead
-    update_lead_from_free_text(text)
-    parse_structured_short_input(text)
-
-    name = lead["name"] or "the customer"
-    state = f" in {lead['state']}" if lead["state"] else ""
-    stage = infer_stage(lead)
-    asked = st.session_state.asked_topics
-
-    lines: list[str] = []
-    all_questions = []
-
-    if stage == 1:
-        if "balance_term" not in asked:
-            all_questions.append(("balance_term", "About how much do you still owe and how many years are left on the mortgage?"))
-        if "payment_amount" not in asked:
-            all_questions.append(("payment_amount", "What is your current monthly mortgage payment (principal + interest)?"))
-        if "current_rate_q" not in asked:
-            all_questions.append(("current_rate_q", "Do you know your current interest rate, even roughly?"))
-        if "stay_horizon" not in asked:
-            all_questions.append(("stay_horizon", "How long do you see yourself staying in this home?"))
-        if "refi_reason" not in asked:
-            all_questions.append(("refi_reason", "What made you start thinking about refinancing right now?"))
-    elif stage == 2:
-        if "payment_comfort" not in asked:
-            all_questions.append(("payment_comfort", "Does your current payment ever force you to cut back on other things in the month?"))
-        if "surplus" not in asked:
-            all_questions.append(("surplus", "After the mortgage and bills, about how much cash is usually left over each month?"))
-        if "deposits" not in asked:
-            all_questions.append(("deposits", "Roughly how much do you keep across checking and savings with us today?"))
-        if "shorten_vs_free_cash" not in asked:
-            all_questions.append(("shorten_vs_free_cash", "If we reduce your payment, would you rather free up cash or shorten the time to pay off the home?"))
-        if "upcoming_expenses" not in asked:
-            all_questions.append(("upcoming_expenses", "Are there any large expenses coming up we should factor in?"))
-    elif stage == 3:
-        if "fee_concern_detail" not in asked:
-            all_questions.append(("fee_concern_detail", "Which specific fees or closing costs are you most concerned about?"))
-        if "competitor_detail" not in asked:
-            all_questions.append(("competitor_detail", "What has the other lender offered you so far in terms of rate and fees?"))
-        if "compare_focus" not in asked:
-            all_questions.append(("compare_focus", "Over the next 5–7 years, what will you compare first – monthly payment, APR, or total cost?"))
-        if "cash_vs_payment" not in asked:
-            all_questions.append(("cash_vs_payment", "Would you prefer lower cash to close or the lowest possible payment if we have to trade off?"))
-        if "if_we_beat_comp" not in asked:
-            all_questions.append(("if_we_beat_comp", "If our offer clearly beats the other one, are you comfortable moving ahead with us?"))
-    elif stage == 4:
-        if "goals_general" not in asked:
-            all_questions.append(("goals_general", "What big goals do you have over the next 3–5 years, like college or renovations?"))
-        if "liquidity_vs_return" not in asked:
-            all_questions.append(("liquidity_vs_return", "For those goals, do you value liquidity more, or are you open to locking some money away for better returns?"))
-        if "goal_monthly_commit" not in asked:
-            all_questions.append(("goal_monthly_commit", "Out of what is left each month, how much would you be comfortable committing toward those goals?"))
-        if "goal_bucket" not in asked:
-            all_questions.append(("goal_bucket", "Would a separate account or bucket for that goal help you stay on track?"))
-        if "goal_importance" not in asked:
-            all_questions.append(("goal_importance", "How important is it that the refinance structure directly supports that goal?"))
-    else:
-        if "ready_to_move" not in asked:
-            all_questions.append(("ready_to_move", "If the numbers look good, are you comfortable moving forward with the refinance today?"))
-        if "deal_stoppers" not in asked:
-            all_questions.append(("deal_stoppers", "Is there anything that would stop you from saying yes if we meet your expectations on rate and fees?"))
-        if "comparison_format" not in asked:
-            all_questions.append(("comparison_format", "How would you like to see the comparison – side‑by‑side with your current loan and the other offer?"))
-        if "card_timing" not in asked and lead["travel_spend"] is not None:
-            all_questions.append(("card_timing", "Do you want to decide on any card or banking changes now, or keep that for a quick follow‑up?"))
-        if "delivery_pref" not in asked:
-            all_questions.append(("delivery_pref", "What is the best way for me to send you the final numbers and next steps?"))
-
-    for topic, _ in all_questions:
-        asked.add(topic)
-
-    lines.append(f"**Ask {name}{state} now:**")
-    for i, (_, q) in enumerate(all_questions[:5], start=1):
-        if i <= 2:
-            lines.append(f"{i}. **\"{q}\"**")
-        else:
-            lines.append(f"{i}. \"{q}\"")
-
-    if not all_questions:
-        lines.append("1. **\"Is there anything else on your mind before we look at the numbers?\"**")
-
-    lines.append("")
-    lines.append(f"**Snapshot so far – {name}{state}:**")
-    snapshot = []
-    if lead["tenure_years"] is not None:
-        snapshot.append(f"- Relationship: **{lead['tenure_years']:.0f} yrs** with your bank.")
-    if lead["current_rate"] is not None:
-        pay_txt = f"${lead['current_payment']:.0f}/mo" if lead["current_payment"] else "payment not captured yet"
-        snapshot.append(f"- Current mortgage: **{lead['current_rate']:.2f}%**, {pay_txt}.")
-    if lead["remaining_balance"] is not None:
-        bal_txt = f"${lead['remaining_balance']:.0f}"
-        yrs_txt = f"{lead['remaining_term_years']:.0f} yrs left" if lead["remaining_term_years"] else "term not captured"
-        snapshot.append(f"- Remaining balance: **{bal_txt}**, {yrs_txt}.")
-    if lead["our_rate"] is not None:
-        rate_txt = f"{lead['our_rate']:.2f}%"
-        if lead["our_rate"] < RATE_FLOOR:
-            snapshot.append(f"- :red[Working offer {rate_txt} is **below** floor {RATE_FLOOR:.2f}%. Do **not** go this low.]")
-        else:
-            snapshot.append(f"- Your working offer: **{rate_txt}** (subject to approval).")
-    else:
-        snapshot.append(f"- Pricing guardrail: :red[do not quote below **{RATE_FLOOR:.2f}%**].")
-    if lead["competitor_rate"] is not None:
-        snapshot.append(f"- Competitor mentioned: ~**{lead['competitor_rate']:.2f}%**.")
-    if lead["savings_balance"] is not None:
-        snapshot.append(f"- Deposits: ~**${lead['savings_balance']:.0f}** with your bank.")
-    if lead["monthly_surplus"] is not None:
-        snapshot.append(f"- Monthly surplus: ~**${lead['monthly_surplus']:.0f}** after bills.")
-    if lead["travel_spend"] is not None:
-        snapshot.append(f"- Travel / card spend: ~**${lead['travel_spend']:.0f}/mo**.")
-    if lead["pricing_concern"]:
-        snapshot.append("- Customer is **rate‑ and fee‑sensitive**.")
-    if lead["big_goal"]:
-        snapshot.append("- Long‑term goal discussed: **college / education in ~3–4 years**.")
-
-    if not snapshot:
-        snapshot.append("- Key numbers not captured yet.")
-
-    lines.extend(snapshot)
-
-    need = []
-    if lead["current_rate"] is None or lead["current_payment"] is None or lead["remaining_balance"] is None:
-        need.append("basic loan details (rate, payment, remaining balance / term).")
-    if lead["savings_balance"] is None or lead["monthly_surplus"] is None:
-        need.append("deposits and typical monthly surplus.")
-    if lead["pricing_concern"] and (lead["our_rate"] is None or lead["competitor_rate"] is None):
-        need.append("your working offer rate and any competitor quote.")
-    if lead["big_goal"] is None and infer_stage(lead) >= 3:
-        need.append("any major life goals (college, renovation, etc.).")
-
-    if need:
-        lines.append("")
-        lines.append("**Your internal checklist:**")
-        for n in need:
-            lines.append(f"- {n}")
-
-    lines.append("")
-    lines.append("Type `summary` any time for a consolidated call plan.")
-    return "\n".join(lines)
-
-def build_summary() -> str:
-    lead = st.session_state.lead
-    name = lead["name"] or "the customer"
-    state = f" in {lead['state']}" if lead["state"] else ""
-    parts: list[str] = []
-
-    parts.append(f"**Call summary – {name}{state}**\n")
-
-    if lead["tenure_years"] is not None:
-        parts.append(f"- Relationship: **{lead['tenure_years']:.0f} years** with your bank.")
-    if lead["current_rate"] is not None:
-        pay_txt = f"${lead['current_payment']:.0f}/mo" if lead["current_payment"] else "payment not captured"
-        parts.append(f"- Current mortgage: **{lead['current_rate']:.2f}%**, {pay_txt}.")
-    if lead["remaining_balance"] is not None:
-        term_txt = f"{lead['remaining_term_years']:.0f} yrs left" if lead["remaining_term_years"] else "term not captured"
-        parts.append(f"- Remaining balance: **${lead['remaining_balance']:.0f}**, {term_txt}.")
-    if lead["our_rate"] is not None:
-        txt = f"{lead['our_rate']:.2f}%"
-        if lead["our_rate"] < RATE_FLOOR:
-            parts.append(f"- :red[Offer {txt} is **below** internal floor **{RATE_FLOOR:.2f}%**. Adjust pricing upward before quoting.]")
-        else:
-            parts.append(f"- Working offer: **{txt}** (subject to underwriting).")
-    else:
-        parts.append(f"- Pricing guardrail: :red[do not go below **{RATE_FLOOR:.2f}%** on rate.]")
-    if lead["competitor_rate"] is not None:
-        parts.append(f"- Competitor in play: ~**{lead['competitor_rate']:.2f}%**.")
-    if lead["savings_balance"] is not None:
-        parts.append(f"- Deposits: around **${lead['savings_balance']:.0f}** on your books.")
-    if lead["monthly_surplus"] is not None:
-        parts.append(f"- Monthly surplus: roughly **${lead['monthly_surplus']:.0f}** after bills.")
-    if lead["travel_spend"] is not None:
-        parts.append(f"- Card / travel spend: about **${lead['travel_spend']:.0f} per month**.")
-    if lead["pricing_concern"]:
-        parts.append("- Borrower is strongly **price‑ and fee‑sensitive**; structure and cash to close matter.")
-    if lead["big_goal"]:
-        parts.append("- Stated goal: **college / education saving in the next few years**, wants liquidity with some growth.")
-    if lead["objective"]:
-        parts.append(f"- Your internal goal: **{lead['objective']}**.")
-
-    parts.append("")
-    parts.append("**Key insights**")
-    if lead["current_rate"] and lead["our_rate"] and lead["our_rate"] >= RATE_FLOOR:
-        rate_delta = lead["current_rate"] - lead["our_rate"]
-        if rate_delta > 0:
-            parts.append(
-                f"- You have roughly a **{rate_delta:.2f}% rate improvement** above floor {RATE_FLOOR:.2f}%. "
-                "Focus on what that does to payment and interest over the first 5–7 years."
-            )
-    if lead["monthly_surplus"]:
-        parts.append("- Surplus each month allows you to propose an automatic transfer into a goal bucket without stressing cash flow.")
-    if lead["pricing_concern"]:
-        parts.append("- A transparent fee breakdown and breakeven view will matter more than chasing tiny extra rate cuts.")
-    if lead["travel_spend"]:
-        parts.append("- Card spend is large enough that a targeted rewards card can be a natural follow‑up once the refi is agreed.")
-
-    parts.append("")
-    parts.append("**How to steer the call**")
-    parts.append("- Confirm remaining term, stay‑in‑home horizon, and payment comfort one more time.")
-    parts.append("- Present side‑by‑side: today vs your offer vs competitor (payment, APR, cash to close, breakeven years).")
-    parts.append("- Tie savings from the refi to a specific monthly amount into their college or remodel fund.")
-    if lead["travel_spend"] is not None:
-        parts.append("- Offer to review card options only after they are comfortable with the refinance numbers.")
-    parts.append("- Finish with a clear checklist of documents, rate‑lock expectations, and how/when you will send final numbers.")
-    return "\n".join(parts)
+    try:
+        persist_lead(entry)
+    except StaleSessionError:
+        sync_lead(entry)
+        return
+    if index_key(lead_before) != index_key(entry.lead):
+        st.session_state.workspace.reindex(entry.key)
+
+def history_controls(entry: LeadSession):
+    messages = entry.messages
+    undo_col, redo_col, _ = st.columns([1, 1, 4])
+    undo_col.button("↩ Undo", key="undo", disabled=not messages.events.can_undo, on_click=undo_redo, args=(UNDO,))
+    redo_col.button("↪ Redo", key="redo", disabled=not messages.events.can_redo, on_click=undo_redo, args=(REDO,))
+    if len(messages) > 1:
+        with st.expander("Lead as of an earlier message"):
+            n = st.slider("Message", 1, len(messages), len(messages), key="as_of_message")
+            lead = messages.lead_at(n - 1)
+            rows = [
+                f"| {name.replace('_', ' ')} | {_field_value(getattr(lead, name))} |"
+                for name in LEAD_FIELDS
+                if getattr(lead, name) not in (None, False)
+            ]
+            st.markdown("| Field | Value |\n|---|---|\n" + "\n".join(rows) if rows else "Nothing captured yet.")
 
 # -----------------------------------------------------------------------------
-# Chat input (with static attach/mic icons inside box)
+# Chat (fragment: submitting a note reruns only this function)
 # -----------------------------------------------------------------------------
-user_msg = st.chat_input(
-    "Short notes only (e.g., 'Mary Smith CA refi', 'rate 7.8 pay 3100', 'bal 410k term 19 yrs', or 'summary')..."
-)
+@st.fragment
+def chat_panel():
+    with timed("rerun"):
+        chat_turn()
+
+def chat_turn():
+    entry = current_lead()
+    messages = entry.messages
+    render_transcript(messages)
+
+    if not messages:
+        messages.append("assistant", INTRO)
+        with st.chat_message("assistant"):
+            st.markdown(INTRO)
+
+    # Chat input; the attach button takes notes files (txt / csv / jsonl)
+    # exported from the CRM. The mic icon is static.
+    submission = st.chat_input(
+        "Short notes only (e.g., 'Mary Smith CA refi', 'rate 7.8 pay 3100', 'bal 410k term 19 yrs', or 'summary')...",
+        accept_file="multiple",
+        file_type=list(INGEST_TYPES),
+    )
 
-st.markdown(
-    """
-    <div class="input-icons-right">
-        <div class="input-icon-circle">📎</div>
-        <div class="input-icon-circle">🎤</div>
-    </div>
-    """,
-    unsafe_allow_html=True,
-)
+    st.markdown(
+        """
+        <div class="input-icons-right">
+            <div class="input-icon-circle">🎤</div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
 
-if user_msg:
-    add_message("user", user_msg)
-    with st.chat_message("user"):
-        st.markdown(user_msg)
+    if submission:
+        lead_before = entry.lead.copy()
+        for upload in submission.files:
+            import_notes(entry, upload)
+        if submission.text:
+            answer_note(entry, submission.text)
+        try:
+            persist_lead(entry)
+        except StaleSessionError:
+            sync_lead(entry)
+            st.warning("This lead changed in another window; reloaded its latest notes. Resend your note if it is missing.")
+        # The sidebar lists leads by name / state / stage; the list picks up
+        # the new index on its next run (see leads_list).
+        if index_key(lead_before) != index_key(entry.lead):
+            st.session_state.workspace.reindex(entry.key)
+
+    history_controls(st.session_state.workspace.current)
+    st.caption(
+        f"Session memory: {messages.resident_bytes() / 1024:.1f} KB resident"
+        + (f", {messages.spilled} older messages on disk." if messages.spilled else ".")
+    )
 
-    lower = user_msg.strip().lower()
-    if "summary" in lower:
-        with st.chat_message("assistant"):
-            with st.spinner("Preparing a concise call plan..."):
-                time.sleep(1.0)
-                reply = build_summary()
-            st.markdown(reply)
-        add_message("assistant", reply)
-    else:
-        with st.chat_message("assistant"):
-            with st.spinner("Reviewing details and shaping next questions..."):
-                time.sleep(1.0)
-                reply = build_guidance(user_msg)
-            st.markdown(reply)
-        add_message("assistant", reply)
+pipeline_view()
+chat_panel()
 
 st.markdown('</div></div>', unsafe_allow_html=True)
+METRICS.observe("page", time.perf_counter() - page_started)
@@ -0,0 +1,10 @@
+import pytest
+
+from call_prep_cli import iter_records
+
+
+def test_records_need_string_lead_id_and_note():
+    assert list(iter_records(['{"lead_id": "a", "note": "rate 7.8"}', ""])) == [{"lead_id": "a", "note": "rate 7.8"}]
+    for line in ['{"lead_id": "a", "note": null}', '{"lead_id": 7, "note": "x"}', '["a", "x"]']:
+        with pytest.raises(ValueError, match="line 2"):
+            list(iter_records(['{"lead_id": "a", "note": "ok"}', line]))
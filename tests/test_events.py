@@ -0,0 +1,45 @@
+from call_prep_engine import Lead, apply_pricing, invalidate_pricing
+from call_prep_events import REDO, UNDO, EventLog
+
+
+def test_undo_and_redo_move_between_stacks():
+    log = EventLog()
+    log.record(1, {"name": "Ann"}, "guidance")
+    log.record(3, {"state": "Texas"}, "guidance")
+    assert log.undo_delta() == (1, {"state": None})
+    log.record(4, {"state": None}, UNDO, target=1)
+    assert log.redo_delta() == (1, {"state": "Texas"})
+    log.record(5, {"state": "Texas"}, REDO, target=1)
+    assert (log.can_undo, log.can_redo) == (True, False)
+    assert log.fields_at(4)["state"] is None
+    assert log.fields_at(5)["state"] == "Texas"
+
+def test_empty_undo_still_moves_its_target():
+    log = EventLog()
+    log.record(1, {"name": "Ann"}, "guidance")
+    log.record(3, {"name": "Ann", "state": "Texas"}, "guidance")
+    assert log.undo_delta() == (1, {"state": None})
+    log.record(4, {}, UNDO, target=1)  # the field was already back
+    assert log.undo_delta() == (0, {"name": None})
+    assert log.redo_delta() == (1, {"state": "Texas"})
+    assert len(log) == 2
+
+def test_log_rebuilds_from_messages_with_empty_undo():
+    messages = [
+        {"role": "user", "content": "Ann"},
+        {"role": "assistant", "content": "", "kind": "guidance", "delta": {"name": "Ann"}},
+        {"role": "assistant", "content": "", "kind": UNDO, "delta": {}, "target": 0},
+    ]
+    log = EventLog.from_messages(messages)
+    assert (log.can_undo, log.can_redo) == (False, True)
+
+def test_invalidate_pricing_reprices_restored_rates():
+    lead = Lead(state="Texas", remaining_balance=300_000.0)
+    apply_pricing(lead)
+    floor = lead.rate_floor
+    lead.rate_floor = floor + 1  # as restored by an undo from an older sheet
+    apply_pricing(lead)
+    assert lead.rate_floor == floor + 1
+    invalidate_pricing(lead)
+    apply_pricing(lead)
+    assert lead.rate_floor == floor
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+
+from call_prep_engine import Lead
+from call_prep_export import (
+    EXPORT_COLUMNS,
+    export_bytes,
+    export_rows,
+    main,
+    read_watermark,
+    write_watermark,
+)
+from call_prep_store import MemorySessionStore, SQLiteSessionStore
+
+NOTE = {"role": "user", "content": "Mary Smith from Texas"}
+
+def filled_store(store):
+    store.commit("ws1/a", 0, {"name": "Ann"}, [], [NOTE])
+    store.commit("ws2/a", 0, {"name": "Bob"}, [], [NOTE])
+    mary = store.archive_conversation("ws1", None, "Mary", Lead(name="Mary Smith"), [], [NOTE])
+    store.archive_conversation("ws2", None, "Zoe", Lead(name="Zoe"), [], [NOTE])
+    store.commit("ws1/b", 0, {"name": "Mary Smith"}, [], [], conversation_id=mary)
+    return store, mary
+
+def test_rows_follow_the_change_order():
+    store, _ = filled_store(MemorySessionStore())
+    assert [(r["source"], r["name"]) for r in export_rows(store)] == [
+        ("session", "Ann"), ("session", "Bob"), ("conversation", "Mary Smith"), ("conversation", "Zoe"), ("session", "Mary Smith")
+    ]
+    assert [r["name"] for r in export_rows(store, since=1, archived=False)] == ["Bob", "Mary Smith"]
+
+def test_workspace_export_includes_only_its_closed_chats():
+    store, _ = filled_store(MemorySessionStore())
+    rows = list(export_rows(store, workspace="ws1"))
+    assert [(r["source"], r["name"]) for r in rows] == [("session", "Ann"), ("conversation", "Mary Smith"), ("session", "Mary Smith")]
+    assert [r["name"] for r in export_rows(store, workspace="ws1", archived=False)] == ["Ann", "Mary Smith"]
+    assert len(list(export_rows(store))) == 5
+
+def test_reopened_chat_joins_its_archive_row():
+    store, mary = filled_store(MemorySessionStore())
+    data = export_bytes(store, "csv", workspace="ws1")
+    rows = list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+    assert tuple(rows[0]) == EXPORT_COLUMNS
+    assert [r["conversation_id"] for r in rows] == ["", str(mary), str(mary)]
+
+def test_watermark_round_trip_and_corrupt_file(tmp_path, capsys):
+    mark = tmp_path / "crm.mark"
+    assert read_watermark(str(mark)) == 0
+    write_watermark(str(mark), 7)
+    assert read_watermark(str(mark)) == 7
+
+    db = tmp_path / "sessions.db"
+    filled_store(SQLiteSessionStore(str(db)))
+    mark.write_text("{not json", encoding="utf-8")
+    out = tmp_path / "leads.jsonl"
+    assert main(["--db", str(db), "-o", str(out), "--watermark", str(mark)]) == 1
+    assert "not a watermark file" in capsys.readouterr().err
+
+    mark.unlink()
+    assert main(["--db", str(db), "-o", str(out), "--watermark", str(mark), "--workspace", "ws2"]) == 0
+    assert [json.loads(line)["name"] for line in out.read_text(encoding="utf-8").splitlines()] == ["Bob", "Zoe"]
+    assert read_watermark(str(mark)) == 5
@@ -0,0 +1,31 @@
+import csv
+import io
+
+import pytest
+
+from call_prep_ingest import iter_file_notes
+
+
+def notes(body: str, filename: str = "notes.csv") -> list[str]:
+    return list(iter_file_notes(io.BytesIO(body.encode("utf-8")), filename))
+
+def test_csv_note_column():
+    assert notes("id,Note\n1,rate 7.8 pay 3100\n2,\n3,bal 410k\n") == ["rate 7.8 pay 3100", "bal 410k"]
+
+def test_csv_without_header_keeps_first_row():
+    assert notes("Mary Smith,Texas\nrate 7.8,pay 3100\n") == ["Mary Smith, Texas", "rate 7.8, pay 3100"]
+
+@pytest.fixture
+def small_field_limit():
+    old = csv.field_size_limit(10)
+    yield
+    csv.field_size_limit(old)
+
+def test_csv_error_is_a_value_error(small_field_limit):
+    with pytest.raises(ValueError, match="line 2: field larger than field limit"):
+        notes("note\n" + "x" * 50 + "\n")
+
+def test_jsonl_notes():
+    assert notes('{"text": "rate 7.8"}\n"bal 410k"\n{"other": 1}\n', "notes.jsonl") == ["rate 7.8", "bal 410k"]
+    with pytest.raises(ValueError, match="line 2"):
+        notes('"ok"\n{broken\n', "notes.jsonl")
@@ -0,0 +1,30 @@
+from call_prep_pricing import Quote, RateSheet
+
+SHEET = """\
+state,segment,min_balance,min_term_years,offer_rate,floor_rate
+*,*,0,0,,6.00
+texas,self_employed,0,0,6.80,6.40
+texas,self_employed,250000,20,6.50,6.20
+texas,*,0,0,,6.10
+"""
+
+def make_sheet(tmp_path, body=SHEET) -> RateSheet:
+    path = tmp_path / "rate_sheet.csv"
+    path.write_text(body, encoding="utf-8")
+    return RateSheet(str(path), fallback=Quote(None, 5.0))
+
+def test_exact_band_and_term(tmp_path):
+    sheet = make_sheet(tmp_path)
+    assert sheet.lookup("Texas", "self_employed", 500_000, 25) == Quote(6.50, 6.20)
+
+def test_band_without_short_enough_term_uses_lower_band(tmp_path):
+    # The 250k band only prices 20+ years; a 15-year lead falls back to the
+    # group's 0/0 row, not to the state or global floor.
+    sheet = make_sheet(tmp_path)
+    assert sheet.lookup("texas", "self_employed", 500_000, 15) == Quote(6.80, 6.40)
+
+def test_wider_groups_and_fallback(tmp_path):
+    sheet = make_sheet(tmp_path)
+    assert sheet.lookup("texas", "salaried", 100_000, 10) == Quote(None, 6.10)
+    assert sheet.lookup("ohio", None) == Quote(None, 6.00)
+    assert make_sheet(tmp_path, SHEET.splitlines()[0] + "\n").lookup("texas", "hnw") == Quote(None, 5.0)
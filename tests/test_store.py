@@ -0,0 +1,70 @@
+import pytest
+
+from call_prep_engine import AskedTopics, Lead
+from call_prep_store import MemorySessionStore, SQLiteSessionStore, StaleSessionError
+
+HELLO = {"role": "user", "content": "Mary Smith from Texas"}
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+def test_stale_version_commit_is_rejected(store):
+    assert store.commit("ws/1", 0, {"name": "Mary Smith"}, [], [HELLO]) == 1
+    with pytest.raises(StaleSessionError):
+        store.commit("ws/1", 0, {"name": "Someone Else"}, [], [])
+    assert store.commit("ws/1", 1, {"state": "Texas"}, [], []) == 2
+    with pytest.raises(StaleSessionError):
+        store.commit("ws/1", 1, {"state": "Ohio"}, [], [])
+    session = store.load("ws/1")
+    assert session.version == 2
+    assert (session.lead.name, session.lead.state) == ("Mary Smith", "Texas")
+
+def test_field_only_writes_keep_other_fields_and_messages(store):
+    store.commit("ws/1", 0, {"name": "Mary Smith", "current_rate": 7.1}, ["balance_term"], [HELLO])
+    store.commit("ws/1", 1, {"current_rate": 6.9}, ["balance_term", "surplus"], [])
+    session = store.load("ws/1")
+    assert session.lead == Lead(name="Mary Smith", current_rate=6.9)
+    assert list(session.asked) == ["balance_term", "surplus"]
+    assert session.messages == [HELLO]
+    assert store.load("ws/1", with_messages=False).messages == []
+
+def test_asked_topics_are_kept_by_name(store):
+    store.commit("ws/1", 0, {}, ["surplus", "retired_topic"], [])
+    asked = store.load("ws/1").asked
+    assert list(asked) == ["surplus"]
+    assert asked.bits == AskedTopics.from_topics(["surplus"]).bits
+
+def test_archived_chats_stay_in_their_workspace(store):
+    mary = Lead(name="Mary Smith", state="Texas")
+    cid = store.archive_conversation("ws1", None, "Mary Smith", mary, [], [HELLO])
+    assert [c.conversation_id for c in store.conversations("ws1")] == [cid]
+    assert [c.conversation_id for c in store.conversations("ws1", "mary")] == [cid]
+    assert store.conversations("ws2") == []
+    assert store.conversations("ws2", "mary") == []
+    assert store.load_conversation("ws2", cid) is None
+
+    # Re-archiving from another workspace files a new entry.
+    other = store.archive_conversation("ws2", cid, "Mary Smith", mary, [], [HELLO])
+    assert other != cid
+    assert store.load_conversation("ws1", cid).info.title == "Mary Smith"
+
+def test_change_counter_orders_every_write(store):
+    assert store.last_change() == 0
+    store.commit("ws/1", 0, {"name": "Ann"}, [], [])
+    store.commit("ws/2", 0, {"name": "Bob"}, [], [])
+    store.commit("ws/1", 1, {"state": "Texas"}, [], [])
+    assert store.last_change() == 3
+    assert [(c.change, c.key) for c in store.changes()] == [(2, "ws/2"), (3, "ws/1")]
+    assert [c.key for c in store.changes(since=2)] == ["ws/1"]
+
+    cid = store.archive_conversation("ws", None, "Ann", Lead(name="Ann", state="Texas"), [], [HELLO])
+    store.delete("ws/1")
+    assert store.last_change() == 5
+    found = [(c.change, c.source, c.lead is None) for c in store.changes(since=3, deleted=True)]
+    assert found == [(4, "conversation", False), (5, "session", True)]
+    assert [c.key for c in store.changes(since=3, archived=False)] == []
+    assert store.load("ws/1") is None
+    assert store.load_conversation("ws", cid).lead.name == "Ann"